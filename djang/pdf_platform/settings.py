@@ -107,6 +107,110 @@ os.makedirs(PDF_STORAGE, exist_ok=True)
 # RAG Model Configuration
 RAG_MODEL_PATH = os.path.join(BASE_DIR, 'modelrag', 'output')
 
+# Sentence encoder, loaded once per process on first use (pdf_processor.encoders.get_encoder)
+RAG_ENCODER = 'all-MiniLM-L6-v2'
+RAG_ENCODER_DEVICE = 'cpu'
+RAG_ENCODER_MAX_SEQ_LENGTH = 256
+# 'torch' runs the SentenceTransformer with PyTorch; 'onnx' runs the same model exported to ONNX
+# under ONNX Runtime and 'onnx-int8' its dynamically int8-quantized copy. Exports live in
+# RAG_ONNX_PATH and must be made by `manage.py export_encoder` (which also checks them against
+# the torch embeddings) before switching; RAG_ONNX_THREADS 0 lets ONNX Runtime use every core.
+RAG_ENCODER_BACKEND = os.getenv('RAG_ENCODER_BACKEND', 'torch')
+RAG_ONNX_PATH = os.path.join(BASE_DIR, 'modelrag', 'onnx')
+RAG_ONNX_THREADS = 0
+# Bulk encoding sorts texts by token length and caps each batch at this many padded tokens
+RAG_ENCODE_BATCH_TOKENS = 8192
+RAG_ENCODE_MAX_BATCH_SIZE = 256
+
+# 'passages' indexes token-bounded, overlapping passages; 'document' keeps one vector per PDF
+RAG_INGEST_MODE = os.getenv('RAG_INGEST_MODE', 'passages')
+RAG_PASSAGE_TOKENS = 200
+RAG_PASSAGE_OVERLAP = 40
+
+# Bulk ingest used by the rebuild commands: extraction processes (default: every core),
+# passages + sentences per encode call, and documents per bulk write
+RAG_INGEST_WORKERS = int(os.getenv('RAG_INGEST_WORKERS', '0')) or None
+RAG_INGEST_ENCODE_BATCH = 512
+RAG_INGEST_WRITE_BATCH = 64
+
+# Upper bound on extracted text kept in memory by the text store, in characters
+RAG_TEXT_CACHE_CHARS = 64 * 1024 * 1024
+
+# PDFDocument.embeddings holds raw little-endian bytes of this dtype ('float16' halves the size
+# of 'float32'; cosine scores of normalized embeddings change by well under 1e-3)
+RAG_EMBEDDINGS_DTYPE = 'float16'
+
+# Query embeddings are cached per process (LRU of size entries, expiring after TTL seconds,
+# 0 = never). Queries are case-folded for the key because the default encoder is uncased.
+RAG_QUERY_CACHE_SIZE = 1024
+RAG_QUERY_CACHE_TTL = 60 * 60
+RAG_QUERY_CACHE_CASEFOLD = True
+
+# Formatted search results are cached in this Django cache alias (the default is per-process
+# locmem; a FileBasedCache alias shares them between workers). Keys include the index version,
+# which every add, remove and rebuild bumps, so cached results are never stale.
+RAG_RESULT_CACHE = 'default'
+RAG_RESULT_CACHE_TIMEOUT = 5 * 60
+
+# FAISS index type: 'flat' (exact), 'hnsw', 'ivf_flat', or the compressed 'sq8', 'pq', 'ivf_sq8', 'ivf_pq'.
+# Changing type/hnsw_m/nlist/pq_* needs a rebuild; ef_search, nprobe and rescore_factor apply at load time.
+# The type and parameters are saved as faiss.index.json. Compressed indexes re-score their top
+# candidates against the full-precision vectors in the snapshot's vectors.f32.
+RAG_INDEX = {
+    'type': os.getenv('RAG_INDEX_TYPE', 'flat'),
+    'hnsw_m': 32,
+    'ef_construction': 200,
+    'ef_search': 64,
+    'nlist': 1024,
+    'nprobe': 16,
+    'pq_m': 96,
+    'pq_bits': 8,
+    'rescore_factor': 4,
+}
+
+# Async views (api/async/...) run encoding and FAISS searches on a pool of RAG_SEARCH_THREADS
+# threads; at most RAG_SEARCH_MAX_IN_FLIGHT searches per ASGI process are queued or running
+RAG_SEARCH_THREADS = int(os.getenv('RAG_SEARCH_THREADS', '4'))
+RAG_SEARCH_MAX_IN_FLIGHT = 256
+
+# Concurrent searches are collected for up to RAG_SEARCH_BATCH_WAIT_MS (0 disables batching) or
+# until RAG_SEARCH_BATCH_SIZE arrive, then encoded and searched together
+RAG_SEARCH_BATCH_WAIT_MS = 5
+RAG_SEARCH_BATCH_SIZE = 32
+
+# Searches by non-superusers only scan passages of documents their access lists allow; the
+# id filter built per principal set is cached for this many sets
+RAG_ACL_FILTER_CACHE = 64
+
+# Adds and removals are appended to faiss.index.log and replayed on load; the full index is
+# rewritten (checkpointed) once the log holds this many vector ids, and at the end of rebuilds.
+RAG_INDEX_CHECKPOINT_VECTORS = 50000
+# With RAG_INDEX_MMAP every web worker keeps the vectors logged since the checkpoint in a private
+# in-memory index (1.5 KB per vector at 384 dimensions), so writers checkpoint sooner.
+RAG_INDEX_MMAP_CHECKPOINT_VECTORS = 5000
+
+# The index lives in versioned snapshots under RAG_MODEL_PATH/snapshots; CURRENT names the live
+# one. Rebuilds fill a new snapshot and publish it atomically, keeping the last
+# RAG_INDEX_SNAPSHOTS_KEEP published snapshots (the live one included) for searchers still
+# switching over. Unpublished snapshots untouched this long are treated as abandoned builds.
+RAG_INDEX_SNAPSHOTS_KEEP = 2
+RAG_INDEX_SNAPSHOT_ABANDON_SECONDS = 24 * 60 * 60
+
+# Processes that only search (web workers) memory-map faiss.index read-only, so every worker
+# on a host shares one copy of it in the page cache. They check every RAG_INDEX_RELOAD_INTERVAL
+# seconds for a newer checkpoint, logged vectors or document changes and reopen the index.
+# Mapping flat, HNSW, SQ and PQ codes needs faiss-cpu >= 1.11 (IO_FLAG_MMAP_IFC); older builds
+# read a private copy per worker. The passage map and the BM25 keyword index are still built in
+# each worker on every reopen.
+RAG_INDEX_MMAP = os.getenv('RAG_INDEX_MMAP', '1') == '1'
+RAG_INDEX_RELOAD_INTERVAL = 2
+
+# Uploads are indexed by `manage.py index_worker`. Failed jobs are retried after
+# RETRY_SECONDS * 2**(attempt - 1); jobs running longer than TIMEOUT seconds are reclaimed.
+RAG_INDEX_JOB_MAX_ATTEMPTS = 3
+RAG_INDEX_JOB_RETRY_SECONDS = 30
+RAG_INDEX_JOB_TIMEOUT = 30 * 60
+
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -0,0 +1,118 @@
+import sqlite3
+import logging
+import threading
+from typing import Dict, FrozenSet, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+def user_principals(user) -> Optional[FrozenSet[str]]:
+    """Principals a user searches as, or None for unrestricted (superuser) access"""
+    if user is None or not getattr(user, 'is_authenticated', False):
+        return frozenset()
+    if user.is_superuser:
+        return None
+    return frozenset([f"u:{user.pk}"] + [f"g:{group_id}" for group_id in user.groups.values_list('id', flat=True)])
+
+
+def principals_for(owner_id: int, group_ids: Iterable[int] = (), user_ids: Iterable[int] = ()) -> Set[str]:
+    """Principals for a document's owner, groups and users granted view permission"""
+    principals = {f"u:{owner_id}"}
+    principals.update(f"g:{group_id}" for group_id in group_ids)
+    principals.update(f"u:{user_id}" for user_id in user_ids)
+    return principals
+
+
+def document_principals(document) -> Set[str]:
+    """Principals that may view a PDFDocument: its owner, its groups and users with can_view"""
+    return principals_for(
+        document.owner_id,
+        document.groups.values_list('id', flat=True),
+        document.documentpermission_set.filter(can_view=True).values_list('user_id', flat=True))
+
+
+class DocumentAccess:
+    """Who may see each indexed document, materialized next to the index.
+
+    Rows map a document path (as stored in the vector store) to principals
+    ('u:<user id>', 'g:<group id>'). Writers bump acl_version in the meta table;
+    readers reload the table when it moves, so permission changes made in any
+    process apply to the next search everywhere.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.version = None
+        self._paths_by_principal: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute('''CREATE TABLE IF NOT EXISTS doc_acl
+                        (path TEXT,
+                        principal TEXT,
+                        PRIMARY KEY (path, principal))''')
+        conn.execute("CREATE INDEX IF NOT EXISTS doc_acl_principal ON doc_acl (principal)")
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('acl_version', '0')")
+        conn.commit()
+        conn.close()
+
+    def _bump_version(self, c):
+        c.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'acl_version'")
+
+    def set_document(self, path: str, principals: Iterable[str]):
+        """Replace the principals allowed to see a document"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        c = conn.cursor()
+        c.execute("DELETE FROM doc_acl WHERE path = ?", (path,))
+        c.executemany("INSERT INTO doc_acl (path, principal) VALUES (?, ?)",
+                      [(path, principal) for principal in set(principals)])
+        self._bump_version(c)
+        conn.commit()
+        conn.close()
+
+    def import_rows(self, rows: Iterable[tuple]):
+        """Add (path, principal) rows, e.g. from an older database"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        c = conn.cursor()
+        c.executemany("INSERT OR IGNORE INTO doc_acl (path, principal) VALUES (?, ?)", rows)
+        self._bump_version(c)
+        conn.commit()
+        conn.close()
+
+    def remove_document(self, path: str):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        c = conn.cursor()
+        c.execute("DELETE FROM doc_acl WHERE path = ?", (path,))
+        if c.rowcount:
+            self._bump_version(c)
+        conn.commit()
+        conn.close()
+
+    def refresh(self) -> str:
+        """Reload the ACL if another writer changed it; returns the current acl version"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'acl_version'").fetchone()
+            version = row[0] if row else '0'
+            if version == self.version:
+                return version
+            paths_by_principal = {}
+            for path, principal in conn.execute("SELECT path, principal FROM doc_acl"):
+                paths_by_principal.setdefault(principal, set()).add(path)
+        finally:
+            conn.close()
+        with self._lock:
+            self._paths_by_principal = paths_by_principal
+            self.version = version
+        logger.info(f"Loaded access lists for {len(paths_by_principal)} principals (acl version {version})")
+        return version
+
+    def visible_paths(self, principals: Iterable[str]) -> Set[str]:
+        """Paths any of the principals may see"""
+        paths = set()
+        for principal in principals:
+            paths |= self._paths_by_principal.get(principal, set())
+        return paths
+
+
+__all__ = ['DocumentAccess', 'user_principals', 'principals_for', 'document_principals']
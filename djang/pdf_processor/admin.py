@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import PDFDocument, DocumentPermission
+from .models import PDFDocument, DocumentPermission, IndexingJob
 from django.utils.html import format_html
 
 class DocumentPermissionInline(admin.TabularInline):
@@ -13,7 +13,7 @@ class PDFDocumentAdmin(admin.ModelAdmin):
     search_fields = ('title', 'content')
     list_filter = ('owner', 'groups', 'created_at', 'is_indexed')
     filter_horizontal = ('groups',)
-    readonly_fields = ('embeddings', 'content', 'is_indexed', 'indexing_status')
+    readonly_fields = ('embeddings', 'content', 'content_hash', 'is_indexed', 'indexing_status')
     fieldsets = (
         (None, {
             'fields': ('title', 'file')
@@ -25,7 +25,7 @@ class PDFDocumentAdmin(admin.ModelAdmin):
             'fields': ('is_indexed', 'indexing_status'),
         }),
         ('Advanced', {
-            'fields': ('embeddings', 'content'),
+            'fields': ('content_hash', 'embeddings', 'content'),
             'classes': ('collapse',)
         })
     )
@@ -49,6 +49,11 @@ class PDFDocumentAdmin(admin.ModelAdmin):
             return format_html(
                 '<span style="color: green; font-weight: bold;">✓ Indexed</span>'
             )
+        job = IndexingJob.objects.filter(document=obj).first()
+        if job and job.status in (IndexingJob.PENDING, IndexingJob.RUNNING):
+            return format_html(
+                '<span style="color: orange; font-weight: bold;">… {}</span>', job.get_status_display()
+            )
         return format_html(
             '<span style="color: red; font-weight: bold;">✗ Not Indexed</span>'
         )
@@ -73,7 +78,7 @@ class PDFDocumentAdmin(admin.ModelAdmin):
             super().save_model(request, obj, form, change)
             self.message_user(
                 request, 
-                f'Document "{obj.title}" successfully saved and indexed.'
+                f'Document "{obj.title}" saved; it will be searchable once the index worker processes it.'
             )
         except Exception as e:
             self.message_user(
@@ -94,5 +99,19 @@ class DocumentPermissionAdmin(admin.ModelAdmin):
             return qs
         return qs.filter(document__owner=request.user)
 
+class IndexingJobAdmin(admin.ModelAdmin):
+    list_display = ('document', 'action', 'path', 'status', 'attempts', 'run_after', 'locked_by', 'updated_at')
+    list_filter = ('status', 'action')
+    search_fields = ('document__title', 'path', 'last_error')
+    raw_id_fields = ('document',)
+    actions = ['retry']
+
+    def retry(self, request, queryset):
+        for job in queryset.select_related('document'):
+            job.requeue()
+        self.message_user(request, f'{queryset.count()} job(s) queued again.')
+    retry.short_description = 'Queue selected jobs again'
+
 admin.site.register(PDFDocument, PDFDocumentAdmin)
 admin.site.register(DocumentPermission, DocumentPermissionAdmin)
+admin.site.register(IndexingJob, IndexingJobAdmin)
@@ -8,4 +8,7 @@ urlpatterns = [
     path('upload/', views.upload_document, name='upload_document'),
     path('document/<int:document_id>/content/', views.get_document_content, name='get_document_content'),
     path('document/<int:document_id>/answer/', views.answer_question, name='answer_question'),
+    # Async views; served without tying up a thread per request under ASGI (pdf_platform.asgi)
+    path('async/search/', views.search_api, name='search_async'),
+    path('async/document/<int:document_id>/content/', views.document_content_api, name='document_content_async'),
 ]
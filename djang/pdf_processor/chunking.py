@@ -0,0 +1,122 @@
+import re
+from bisect import bisect_right
+from typing import Iterable, Iterator, List, NamedTuple, Tuple
+
+_WORD_RE = re.compile(r'\S+')
+_SENTENCE_END_RE = re.compile(r'[.!?]+(?=\s)|\n\s*\n')
+
+
+class Passage(NamedTuple):
+    """A token-bounded slice of a document's text"""
+    text: str
+    page: int   # 1-based page the passage starts on
+    start: int  # character offsets into the full document text
+    end: int
+
+
+def token_spans(text: str, tokenizer=None) -> List[Tuple[int, int]]:
+    """Return the (start, end) character spans of the tokens in text.
+
+    Uses the encoder's own tokenizer when one is given so passages line up
+    with ``max_seq_length``; falls back to whitespace-separated words.
+    """
+    if tokenizer is not None:
+        encoded = tokenizer(text, add_special_tokens=False,
+                            return_offsets_mapping=True, verbose=False)
+        return [(start, end) for start, end in encoded['offset_mapping'] if end > start]
+    return [match.span() for match in _WORD_RE.finditer(text)]
+
+
+def page_offsets(pages: List[str]) -> List[int]:
+    """Character offset at which each page starts in ''.join(pages)"""
+    offsets = []
+    position = 0
+    for page_text in pages:
+        offsets.append(position)
+        position += len(page_text)
+    return offsets
+
+
+def iter_pages(text: str, offsets: List[int]) -> Iterator[str]:
+    """Yield the pages back out of ''.join(pages) given page_offsets(pages), one slice at a time"""
+    for start, end in zip(offsets, offsets[1:] + [len(text)]):
+        yield text[start:end]
+
+
+def page_for_offset(offsets: List[int], position: int) -> int:
+    """1-based page number containing the given character offset"""
+    return max(1, bisect_right(offsets, position))
+
+
+def iter_passages(pages: Iterable[str], max_tokens: int = 200, overlap: int = 40,
+                  tokenizer=None) -> Iterator[Passage]:
+    """Split a stream of pages into overlapping passages of at most max_tokens tokens.
+
+    Passages are yielded as soon as the pages they span have been read, and only
+    the tokens and text of the passage being built are kept, so memory does not
+    grow with the document. Offsets refer to ''.join(pages), the same text
+    extract_text_from_pdf returns.
+    """
+    if overlap >= max_tokens:
+        raise ValueError(f"Overlap ({overlap}) must be smaller than max_tokens ({max_tokens})")
+
+    stride = max_tokens - overlap
+    offsets = []         # start of every page read so far
+    window = []          # spans of the tokens from the next passage's first token on
+    buffer = ''          # document text from buffer_start on
+    buffer_start = position = 0
+
+    def passage(last: int) -> Passage:
+        start, end = window[0][0], window[last][1]
+        return Passage(buffer[start - buffer_start:end - buffer_start],
+                       page_for_offset(offsets, start), start, end)
+
+    for page_text in pages:
+        offsets.append(position)
+        window.extend((position + start, position + end)
+                      for start, end in token_spans(page_text, tokenizer))
+        buffer += page_text
+        position += len(page_text)
+
+        # A passage is final only once a token follows it or the pages run out
+        while len(window) > max_tokens:
+            yield passage(max_tokens - 1)
+            del window[:stride]
+
+        trim_to = window[0][0] if window else position
+        buffer = buffer[trim_to - buffer_start:]
+        buffer_start = trim_to
+
+    if window:
+        yield passage(len(window) - 1)
+
+
+def chunk_pages(pages: Iterable[str], max_tokens: int = 200, overlap: int = 40,
+                tokenizer=None) -> List[Passage]:
+    """All passages of a document; see iter_passages"""
+    return list(iter_passages(pages, max_tokens, overlap, tokenizer))
+
+
+def whole_document_passage(pages: Iterable[str]) -> List[Passage]:
+    """Legacy ingestion mode: the whole document as a single passage"""
+    text = ''.join(pages)
+    return [Passage(text, 1, 0, len(text))] if text.strip() else []
+
+
+def sentence_spans(text: str, min_length: int = 20) -> List[Tuple[int, int]]:
+    """Character spans of the sentences in text, skipping fragments shorter than min_length"""
+    spans = []
+    start = 0
+    boundaries = [match.end() for match in _SENTENCE_END_RE.finditer(text)] + [len(text)]
+    for end in boundaries:
+        sentence = text[start:end]
+        stripped = sentence.strip()
+        if len(stripped) >= min_length:
+            offset = start + (len(sentence) - len(sentence.lstrip()))
+            spans.append((offset, offset + len(stripped)))
+        start = end
+    return spans
+
+
+__all__ = ['Passage', 'iter_passages', 'chunk_pages', 'whole_document_passage', 'token_spans',
+           'page_offsets', 'iter_pages', 'page_for_offset', 'sentence_spans']
@@ -0,0 +1,129 @@
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODER = 'all-MiniLM-L6-v2'
+# 'torch' runs the SentenceTransformer; the others run its ONNX export (see onnx_encoder)
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+_encoders: Dict[Tuple[str, str], 'SharedEncoder'] = {}
+_registry_lock = threading.Lock()
+
+
+class _LockedTokenizer:
+    """Tokenizer proxy that shares the encoder's lock; HF fast tokenizers are not re-entrant"""
+
+    def __init__(self, tokenizer, lock: threading.Lock):
+        self._tokenizer = tokenizer
+        self._lock = lock
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            return self._tokenizer(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._tokenizer, name)
+
+
+class SharedEncoder:
+    """A process-wide SentenceTransformer; calls are serialized so one instance serves every thread.
+
+    With backend 'onnx' or 'onnx-int8' the same model runs from its ONNX export
+    under ONNX Runtime instead of PyTorch; encode() behaves the same.
+    """
+
+    def __init__(self, name: str, device: str = 'cpu', max_seq_length: int = None, backend: str = 'torch'):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown encoder backend {backend!r}; expected one of {BACKENDS}")
+        self.name = name
+        self.backend = backend
+        self._lock = threading.Lock()
+        if backend == 'torch':
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(name, device=device)
+        else:
+            from .onnx_encoder import load_onnx_model
+            self._model = load_onnx_model(name, quantized=backend == 'onnx-int8',
+                                          threads=getattr(settings, 'RAG_ONNX_THREADS', 0))
+        if max_seq_length:
+            self._model.max_seq_length = max_seq_length
+        tokenizer = getattr(self._model, 'tokenizer', None)
+        self.tokenizer = _LockedTokenizer(tokenizer, self._lock) if tokenizer is not None else None
+
+    @property
+    def max_seq_length(self) -> int:
+        return self._model.max_seq_length
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._model.get_sentence_embedding_dimension()
+
+    def encode(self, sentences, **kwargs):
+        with self._lock:
+            return self._model.encode(sentences, **kwargs)
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """Tokens each text occupies in a batch, special tokens included and capped at max_seq_length"""
+        limit = self.max_seq_length
+        if self.tokenizer is None:
+            return [min(len(text.split()) + 2, limit) for text in texts]
+        encoded = self.tokenizer(list(texts), add_special_tokens=True, truncation=True,
+                                 max_length=limit, verbose=False)
+        return [len(ids) for ids in encoded['input_ids']]
+
+    def encode_bucketed(self, texts: List[str], batch_tokens: int = None,
+                        max_batch_size: int = None) -> Tuple[np.ndarray, int]:
+        """Encode texts in batches of similar token length; returns (embeddings, tokens).
+
+        Texts are sorted by length and cut into batches of at most batch_tokens
+        padded tokens, so short sentences run in large batches and long
+        passages in small ones, and little compute goes to padding. The
+        embeddings come back in the order of texts. The lock is taken per
+        batch, so searches are not blocked for the whole call.
+        """
+        batch_tokens = batch_tokens or getattr(settings, 'RAG_ENCODE_BATCH_TOKENS', 8192)
+        max_batch_size = max_batch_size or getattr(settings, 'RAG_ENCODE_MAX_BATCH_SIZE', 256)
+        embeddings = np.zeros((len(texts), self.get_sentence_embedding_dimension()), dtype='float32')
+        if not texts:
+            return embeddings, 0
+
+        lengths = self.token_lengths(texts)
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
+        start = 0
+        while start < len(order):
+            # Sorted ascending, so the last text in a batch sets its padded width
+            end = start + 1
+            while (end < len(order) and end - start < max_batch_size
+                   and (end - start + 1) * lengths[order[end]] <= batch_tokens):
+                end += 1
+            batch = order[start:end]
+            embeddings[batch] = self.encode([texts[i] for i in batch], batch_size=len(batch),
+                                            convert_to_numpy=True)
+            start = end
+        return embeddings, sum(lengths)
+
+
+def get_encoder(name: str = None, backend: str = None) -> SharedEncoder:
+    """The shared encoder for name and backend (default settings.RAG_ENCODER and
+    RAG_ENCODER_BACKEND), loaded on first use"""
+    name = name or getattr(settings, 'RAG_ENCODER', DEFAULT_ENCODER)
+    backend = backend or getattr(settings, 'RAG_ENCODER_BACKEND', 'torch')
+    encoder = _encoders.get((name, backend))
+    if encoder is None:
+        with _registry_lock:
+            encoder = _encoders.get((name, backend))
+            if encoder is None:
+                logger.info(f"Loading encoder {name} ({backend})")
+                encoder = SharedEncoder(name,
+                                        device=getattr(settings, 'RAG_ENCODER_DEVICE', 'cpu'),
+                                        max_seq_length=getattr(settings, 'RAG_ENCODER_MAX_SEQ_LENGTH', 256),
+                                        backend=backend)
+                _encoders[(name, backend)] = encoder
+    return encoder
+
+
+__all__ = ['SharedEncoder', 'get_encoder', 'DEFAULT_ENCODER', 'BACKENDS']
@@ -0,0 +1,61 @@
+import os
+import threading
+
+import numpy as np
+
+
+class FloatStore:
+    """Full-precision vectors in a raw float32 file, read back through a memory map.
+
+    Row i holds the vector of FAISS row i. Compressed indexes keep only codes in
+    RAM; their top candidates are re-scored exactly against these rows.
+    """
+
+    def __init__(self, path: str, dimension: int):
+        self.path = path
+        self.dimension = dimension
+        self._row_bytes = 4 * dimension
+        self._map = None
+        self._lock = threading.Lock()
+
+    @property
+    def rows(self) -> int:
+        try:
+            return os.path.getsize(self.path) // self._row_bytes
+        except FileNotFoundError:
+            return 0
+
+    def write(self, first_row: int, vectors: np.ndarray):
+        """Write vectors starting at first_row, extending the file as needed"""
+        vectors = np.ascontiguousarray(vectors, dtype='<f4').reshape(-1, self.dimension)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            with open(self.path, 'r+b' if os.path.exists(self.path) else 'wb') as f:
+                f.seek(first_row * self._row_bytes)
+                f.write(vectors.tobytes())
+            self._map = None
+
+    def get(self, rows) -> np.ndarray:
+        """Vectors for the given rows; rows past the end of the file come back as zeros"""
+        rows = np.asarray(rows, dtype=np.int64)
+        with self._lock:
+            if self._map is None or (len(rows) and rows.max() >= len(self._map)):
+                n_rows = self.rows
+                self._map = np.memmap(self.path, dtype='<f4', mode='r', shape=(n_rows, self.dimension)) \
+                    if n_rows else np.zeros((0, self.dimension), dtype='<f4')
+            vector_map = self._map
+
+        vectors = np.zeros((len(rows), self.dimension), dtype=np.float32)
+        valid = rows < len(vector_map)
+        vectors[valid] = vector_map[rows[valid]]
+        return vectors
+
+    def truncate(self, rows: int = 0):
+        with self._lock:
+            self._map = None
+            if os.path.exists(self.path):
+                with open(self.path, 'r+b') as f:
+                    f.truncate(rows * self._row_bytes)
+
+
+__all__ = ['FloatStore']
@@ -0,0 +1,228 @@
+import os
+import json
+import math
+import logging
+from typing import Dict
+
+import numpy as np
+
+from .lazy_imports import lazy_import
+
+faiss = lazy_import('faiss')
+
+logger = logging.getLogger(__name__)
+
+# Used for indexes saved before the index type was recorded, and as the base for settings.RAG_INDEX
+DEFAULT_INDEX_CONFIG = {
+    'type': 'flat',
+    # HNSW
+    'hnsw_m': 32,
+    'ef_construction': 200,
+    'ef_search': 64,
+    # IVF
+    'nlist': 1024,
+    'nprobe': 16,
+    # Product quantization: pq_m sub-quantizers of pq_bits each (pq_m must divide the dimension)
+    'pq_m': 96,
+    'pq_bits': 8,
+    # Compressed indexes return rescore_factor times more candidates for exact re-scoring
+    'rescore_factor': 4,
+}
+
+INDEX_TYPES = ('flat', 'hnsw', 'ivf_flat', 'sq8', 'pq', 'ivf_sq8', 'ivf_pq')
+
+# Index types whose stored vectors are lossy; their hits are re-scored from the float store
+COMPRESSED_TYPES = ('sq8', 'pq', 'ivf_sq8', 'ivf_pq')
+
+# Search-time parameters may be changed through settings without rebuilding the index
+SEARCH_PARAMS = ('ef_search', 'nprobe', 'rescore_factor')
+
+
+def index_config_from_settings() -> Dict:
+    from django.conf import settings
+    config = dict(DEFAULT_INDEX_CONFIG)
+    config.update(getattr(settings, 'RAG_INDEX', {}))
+    return config
+
+
+def index_description(config: Dict) -> str:
+    """faiss.index_factory description for an index config"""
+    index_type = config['type']
+    if index_type == 'flat':
+        return 'Flat'
+    if index_type == 'hnsw':
+        return f"HNSW{config['hnsw_m']},Flat"
+    if index_type == 'ivf_flat':
+        return f"IVF{config['nlist']},Flat"
+    if index_type == 'sq8':
+        return 'SQ8'
+    if index_type == 'pq':
+        return f"PQ{config['pq_m']}x{config['pq_bits']}"
+    if index_type == 'ivf_sq8':
+        return f"IVF{config['nlist']},SQ8"
+    if index_type == 'ivf_pq':
+        return f"IVF{config['nlist']},PQ{config['pq_m']}x{config['pq_bits']}"
+    raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+
+def make_index(config: Dict, dimension: int) -> 'faiss.Index':
+    """Create an empty inner-product index of the configured type.
+
+    Vectors are added and removed under explicit passage ids rather than their
+    position in the index. IVF indexes store ids in their inverted lists; the
+    others are wrapped in IDMap2 (which cannot wrap IVF: removal would leave the
+    inner list ids out of step with its id map).
+    """
+    description = index_description(config)
+    if not config['type'].startswith('ivf_'):
+        description = f"IDMap2,{description}"
+    index = faiss.index_factory(dimension, description, faiss.METRIC_INNER_PRODUCT)
+    base = base_index(index)
+    if hasattr(base, 'hnsw'):
+        base.hnsw.efConstruction = config['ef_construction']
+    apply_search_params(index, config)
+    return index
+
+
+def is_id_mapped(index: 'faiss.Index') -> bool:
+    """Whether the index holds passage ids (as opposed to a legacy positional index)"""
+    index = faiss.downcast_index(index)
+    return isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) or faiss.try_extract_index_ivf(index) is not None
+
+
+def index_ids(index: 'faiss.Index') -> np.ndarray:
+    """All vector ids stored in an id-mapped index"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+
+    invlists = faiss.extract_index_ivf(index).invlists
+    ids = []
+    for list_no in range(invlists.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            list_ids = invlists.get_ids(list_no)
+            ids.append(faiss.rev_swig_ptr(list_ids, size).copy())
+            invlists.release_ids(list_no, list_ids)
+    return np.concatenate(ids).astype(np.int64) if ids else np.zeros(0, dtype=np.int64)
+
+
+def base_index(index: 'faiss.Index') -> 'faiss.Index':
+    """The concrete index underneath any id-mapping wrapper"""
+    index = faiss.downcast_index(index)
+    while isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def apply_search_params(index: 'faiss.Index', config: Dict):
+    """Set efSearch / nprobe on the index"""
+    base = base_index(index)
+    if hasattr(base, 'hnsw'):
+        base.hnsw.efSearch = config['ef_search']
+    ivf = faiss.try_extract_index_ivf(base)
+    if ivf is not None:
+        ivf.nprobe = config['nprobe']
+
+
+def search_parameters(index: 'faiss.Index', config: Dict, selector: 'faiss.IDSelector', k: int,
+                      fraction: float = 1.0) -> 'faiss.SearchParameters':
+    """Parameters restricting a search to the ids in selector.
+
+    fraction is the share of vectors the selector admits; efSearch / nprobe are
+    raised in proportion so a selective filter still fills k results.
+    """
+    fraction = max(fraction, 1e-6)
+    base = base_index(index)
+    ivf = faiss.try_extract_index_ivf(base)
+    if hasattr(base, 'hnsw'):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = int(max(k, min(max(index.ntotal, 1), math.ceil(config['ef_search'] / fraction))))
+    elif ivf is not None:
+        params = faiss.SearchParametersIVF()
+        params.nprobe = int(min(ivf.nlist, math.ceil(config['nprobe'] / fraction)))
+    else:
+        params = faiss.SearchParameters()
+    params.sel = selector
+    return params
+
+
+def is_compressed(config: Dict) -> bool:
+    return config['type'] in COMPRESSED_TYPES
+
+
+def training_size(config: Dict) -> int:
+    """Vectors to collect before training; zero for index types that need no training"""
+    index_type = config['type']
+    size = 0
+    # faiss warns below 39 training points per centroid
+    if index_type.startswith('ivf_'):
+        size = max(size, 50 * config['nlist'])
+    if index_type.endswith('pq'):
+        size = max(size, 50 * 2 ** config['pq_bits'])
+    if index_type.endswith('sq8'):
+        size = max(size, 10000)
+    return size
+
+
+def fit_config(config: Dict, n_vectors: int) -> Dict:
+    """Shrink nlist / pq_bits when there are too few vectors to train the requested centroids"""
+    fitted = dict(config)
+    if config['type'].startswith('ivf_') and n_vectors < 39 * config['nlist']:
+        fitted['nlist'] = max(1, n_vectors // 39)
+    if config['type'].endswith('pq') and n_vectors < 39 * 2 ** config['pq_bits']:
+        fitted['pq_bits'] = max(1, int(math.log2(max(2, n_vectors // 39))))
+    if fitted != config:
+        logger.warning(f"Only {n_vectors} training vectors; using nlist={fitted['nlist']}, "
+                       f"pq_bits={fitted['pq_bits']} for {config['type']}")
+    return fitted
+
+
+def read_index_mapped(index_path: str, config: Dict) -> 'faiss.Index':
+    """Open an index file memory-mapped and read-only, so processes serving it share its pages.
+
+    IVF inverted lists are mapped with IO_FLAG_MMAP; flat codes (flat, HNSW storage,
+    SQ, PQ) need IO_FLAG_MMAP_IFC, added in faiss 1.11. Indexes that can't be
+    mapped are read into memory. The result must never be modified.
+    """
+    if config['type'].startswith('ivf_'):
+        flags = faiss.IO_FLAG_MMAP
+    else:
+        flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', 0)
+    if flags:
+        try:
+            return faiss.read_index(index_path, flags | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            logger.warning(f"Could not memory-map {index_path}: {str(e)}")
+    else:
+        logger.warning(f"This faiss build cannot memory-map {config['type']} indexes; reading {index_path}")
+    return faiss.read_index(index_path)
+
+
+def config_path(index_path: str) -> str:
+    return f"{index_path}.json"
+
+
+def save_index_config(index_path: str, config: Dict, dimension: int):
+    """Record the index type and its parameters next to the index file"""
+    tmp_path = f"{config_path(index_path)}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'dimension': dimension, **config}, f, indent=2)
+    os.replace(tmp_path, config_path(index_path))
+
+
+def load_index_config(index_path: str) -> Dict:
+    """Config saved with an index; indexes without one are flat"""
+    config = dict(DEFAULT_INDEX_CONFIG)
+    path = config_path(index_path)
+    if os.path.exists(path):
+        with open(path) as f:
+            config.update(json.load(f))
+    config.pop('dimension', None)
+    return config
+
+
+__all__ = ['DEFAULT_INDEX_CONFIG', 'INDEX_TYPES', 'COMPRESSED_TYPES', 'SEARCH_PARAMS',
+           'index_config_from_settings', 'make_index', 'apply_search_params', 'is_compressed', 'training_size', 'fit_config', 'save_index_config',
+           'load_index_config', 'base_index', 'is_id_mapped', 'index_ids', 'search_parameters',
+           'read_index_mapped']
@@ -0,0 +1,132 @@
+import os
+import struct
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads within one process are serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class IndexLog:
+    """Append-only log of the vector ids added to or removed from the index since its last checkpoint.
+
+    Vectors themselves live in the float store, so an entry is just an op code and
+    the ids it applies to; adding a document appends only its own bytes. Replaying
+    is idempotent, so a crash between writing a checkpoint and truncating the log
+    is harmless. Appends and checkpoints from different processes are serialized
+    through an flock on a sidecar lock file.
+    """
+
+    ADD = b'A'
+    REMOVE = b'R'
+    _HEADER = struct.Struct('<cq')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = 0
+        # File size after our last append or clean replay; anything else is re-checked before appending
+        self._size = None
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self._depth = 0
+
+    @contextmanager
+    def locked(self):
+        """Hold the log exclusively, across processes; re-entrant within a thread"""
+        with self._lock:
+            if self._depth == 0 and fcntl is not None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._lock_file = open(f"{self.path}.lock", 'a')
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0 and self._lock_file is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def append(self, op: bytes, ids: np.ndarray):
+        ids = np.ascontiguousarray(ids, dtype='<i8')
+        if not len(ids):
+            return
+        record = self._HEADER.pack(op, len(ids)) + ids.tobytes()
+        with self.locked():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'r+b' if os.path.exists(self.path) else 'wb') as f:
+                end = f.seek(0, os.SEEK_END)
+                if end != self._size:
+                    # Another process appended, or one crashed mid-append and left a torn record
+                    valid = self._valid_end(f, end)
+                    if valid < end:
+                        logger.warning(f"Dropping {end - valid} bytes of torn index log tail from {self.path}")
+                        f.truncate(valid)
+                    end = valid
+                f.seek(end)
+                f.write(record)
+                f.flush()
+            self._size = end + len(record)
+            self.entries += len(ids)
+
+    def _valid_end(self, f, size: int) -> int:
+        """Offset just past the last complete record, walking the record headers"""
+        offset = 0
+        while offset + self._HEADER.size <= size:
+            f.seek(offset)
+            op, count = self._HEADER.unpack(f.read(self._HEADER.size))
+            end = offset + self._HEADER.size + 8 * count
+            if end > size or op not in (self.ADD, self.REMOVE):
+                break
+            offset = end
+        return offset
+
+    def replay(self) -> Iterator[Tuple[bytes, np.ndarray]]:
+        """Yield (op, ids) records in order, stopping at a partially written tail.
+
+        The tail is left on disk (it may be a record still being written); the
+        next append drops it under the lock before writing after it.
+        """
+        if not os.path.exists(self.path):
+            self.entries = 0
+            self._size = None
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        entries = 0
+        offset = 0
+        self._size = None
+        while offset + self._HEADER.size <= len(data):
+            op, count = self._HEADER.unpack_from(data, offset)
+            end = offset + self._HEADER.size + 8 * count
+            if end > len(data) or op not in (self.ADD, self.REMOVE):
+                logger.warning(f"Ignoring truncated index log tail at byte {offset} of {self.path}")
+                break
+            ids = np.frombuffer(data, dtype='<i8', count=count, offset=offset + self._HEADER.size)
+            entries += count
+            offset = end
+            yield op, ids.astype(np.int64)
+        self.entries = entries
+        if offset == len(data):
+            self._size = offset
+
+    def truncate(self):
+        with self.locked():
+            if os.path.exists(self.path):
+                with open(self.path, 'r+b') as f:
+                    f.truncate(0)
+            self.entries = 0
+            self._size = 0
+
+
+__all__ = ['IndexLog']
@@ -0,0 +1,253 @@
+import os
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .chunking import Passage, iter_pages, sentence_spans
+from .text_store import file_fingerprint, file_sha256
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractedDocument(NamedTuple):
+    """Output of the extraction stage; built in a worker process"""
+    key: Any
+    path: str           # name recorded in the vector store
+    text: str
+    page_offsets: List[int]   # where each page starts in text; see chunking.iter_pages
+    content_hash: str
+    sentence_spans: List[Tuple[int, int]]
+    error: Optional[str] = None
+    fingerprint: Optional[Tuple[int, int]] = None   # see text_store.file_fingerprint
+
+
+class EncodedDocument(NamedTuple):
+    """A document ready for VectorStore.add_batch"""
+    key: Any
+    path: str
+    passages: List[Passage]
+    embeddings: np.ndarray
+    text: str
+    content_hash: str
+    sentence_spans: List[Tuple[int, int]]
+    sentence_embeddings: np.ndarray
+    fingerprint: Optional[Tuple[int, int]] = None
+
+
+class IngestStats(NamedTuple):
+    documents: int
+    passages: int
+    failed: int
+    tokens: int
+    seconds: float
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.documents / self.seconds if self.seconds else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+
+def extract_document(key, pdf_path: str, path: str) -> ExtractedDocument:
+    """Extract pages, hash the file and find sentence boundaries (runs in the process pool)"""
+    from .vector_store import extract_paged_text_from_pdf
+
+    try:
+        # Taken before reading, so a write during extraction shows up as a change next time
+        fingerprint = file_fingerprint(pdf_path)
+        # Only the joined text crosses back to the parent process, not a list of pages as well
+        text, offsets = extract_paged_text_from_pdf(pdf_path)
+        if not text or not text.strip():
+            return ExtractedDocument(key, path, '', [], '', [], error='No text extracted')
+        return ExtractedDocument(key, path, text, offsets, file_sha256(pdf_path), sentence_spans(text),
+                                 fingerprint=fingerprint)
+    except Exception as e:
+        return ExtractedDocument(key, path, '', [], '', [], error=str(e))
+
+
+_DONE = object()
+
+
+class IngestPipeline:
+    """Bulk ingestion: extract in a process pool, encode in cross-document batches, write in bulk.
+
+    The stages run concurrently and are connected by bounded queues, so a slow
+    encoder stops new extraction work instead of buffering the whole corpus.
+    Passages and sentences from many documents are pooled and encoded in
+    length-bucketed batches (see SharedEncoder.encode_bucketed).
+    """
+
+    def __init__(self, vector_store, model=None, workers: int = None, encode_batch: int = None,
+                 write_batch: int = None, queue_size: int = None, batch_tokens: int = None):
+        from django.conf import settings
+
+        self.vector_store = vector_store
+        self.model = model or vector_store.model
+        self.workers = workers or getattr(settings, 'RAG_INGEST_WORKERS', None) or os.cpu_count() or 1
+        self.encode_batch = encode_batch or getattr(settings, 'RAG_INGEST_ENCODE_BATCH', 512)
+        self.write_batch = write_batch or getattr(settings, 'RAG_INGEST_WRITE_BATCH', 64)
+        self.queue_size = queue_size or getattr(settings, 'RAG_INGEST_QUEUE_SIZE', None) or 2 * self.workers
+        self.batch_tokens = batch_tokens
+        self.tokens = 0
+
+    def run(self, items: Iterable[Tuple[Any, str, str]],
+            on_result: Callable[[Any, Optional[EncodedDocument], Optional[str]], None] = None) -> IngestStats:
+        """Ingest (key, pdf_path, stored_path) items.
+
+        on_result(key, document, error) is called from the calling thread once a
+        document is written (document set) or has failed (error set).
+        """
+        start = time.time()
+        self.tokens = 0
+        extracted = queue.Queue(maxsize=self.queue_size)
+        encoded = queue.Queue(maxsize=self.queue_size)
+        errors = []
+
+        extractor = threading.Thread(target=self._extract_stage, args=(items, extracted, errors), daemon=True)
+        encoder = threading.Thread(target=self._encode_stage, args=(extracted, encoded, errors), daemon=True)
+        extractor.start()
+        encoder.start()
+
+        documents = passages = failed = 0
+        batch = []
+
+        def report(key, document, error):
+            if on_result is None:
+                return
+            try:
+                on_result(key, document, error)
+            except Exception as e:
+                # Never let a callback stall the stages feeding this thread
+                logger.error(f"Error in ingest callback for {key}: {str(e)}")
+
+        def flush():
+            nonlocal documents, passages, failed
+            ready = [item for item in batch if isinstance(item, EncodedDocument)]
+            write_error = None
+            try:
+                self.vector_store.add_batch(ready)
+            except Exception as e:
+                write_error = str(e)
+                logger.error(f"Error writing {len(ready)} documents: {write_error}")
+
+            for item in batch:
+                if not isinstance(item, EncodedDocument):
+                    failed += 1
+                    report(item[0], None, item[1])
+                elif write_error:
+                    failed += 1
+                    report(item.key, None, write_error)
+                else:
+                    documents += 1
+                    passages += len(item.passages)
+                    report(item.key, item, None)
+            batch.clear()
+
+        while True:
+            item = encoded.get()
+            if item is _DONE:
+                break
+            batch.append(item)
+            if len(batch) >= self.write_batch:
+                flush()
+        flush()
+
+        extractor.join()
+        encoder.join()
+        if errors:
+            raise errors[0]
+        return IngestStats(documents, passages, failed, self.tokens, time.time() - start)
+
+    def _extract_stage(self, items, extracted: queue.Queue, errors: list):
+        # spawn: forking a process that already loaded torch can deadlock
+        context = multiprocessing.get_context('spawn')
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+                pending = set()
+                for key, pdf_path, path in items:
+                    if len(pending) >= self.queue_size:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            extracted.put(future.result())
+                    pending.add(pool.submit(extract_document, key, pdf_path, path))
+                for future in pending:
+                    extracted.put(future.result())
+        except Exception as e:
+            errors.append(e)
+        finally:
+            extracted.put(_DONE)
+
+    def _encode_stage(self, extracted: queue.Queue, encoded: queue.Queue, errors: list):
+        finished = False
+        try:
+            waiting = []   # (document, passages) not yet encoded
+            waiting_texts = 0
+            while True:
+                doc = extracted.get()
+                if doc is _DONE:
+                    finished = True
+                    break
+                if doc.error:
+                    encoded.put((doc.key, doc.error))
+                    continue
+                try:
+                    passages = self.vector_store.split_pages(iter_pages(doc.text, doc.page_offsets), self.model)
+                except Exception as e:
+                    # A document the tokenizer or chunker rejects fails on its own
+                    logger.error(f"Error splitting {doc.path}: {str(e)}")
+                    encoded.put((doc.key, str(e)))
+                    continue
+                if not passages:
+                    encoded.put((doc.key, 'No passages'))
+                    continue
+                waiting.append((doc, passages))
+                waiting_texts += len(passages) + len(doc.sentence_spans)
+                if waiting_texts >= self.encode_batch:
+                    self._encode(waiting, encoded)
+                    waiting, waiting_texts = [], 0
+            if waiting:
+                self._encode(waiting, encoded)
+        except Exception as e:
+            errors.append(e)
+            # Keep taking from the bounded queue, or the extractor blocks on put forever
+            while not finished:
+                finished = extracted.get() is _DONE
+        finally:
+            encoded.put(_DONE)
+
+    def _encode(self, waiting, encoded: queue.Queue):
+        """Encode the passages and sentences of several documents together and scatter the results"""
+        texts = []
+        for doc, passages in waiting:
+            texts.extend(p.text for p in passages)
+            texts.extend(doc.text[s:e] for s, e in doc.sentence_spans)
+        try:
+            embeddings, tokens = self.model.encode_bucketed(texts, self.batch_tokens)
+            self.tokens += tokens
+        except Exception as e:
+            logger.error(f"Error encoding {len(waiting)} documents: {str(e)}")
+            for doc, _ in waiting:
+                encoded.put((doc.key, str(e)))
+            return
+
+        offset = 0
+        for doc, passages in waiting:
+            n_sentences = len(doc.sentence_spans)
+            passage_embeddings = embeddings[offset:offset + len(passages)]
+            offset += len(passages)
+            sentence_embeddings = embeddings[offset:offset + n_sentences]
+            offset += n_sentences
+            encoded.put(EncodedDocument(doc.key, doc.path, passages, passage_embeddings, doc.text,
+                                        doc.content_hash, doc.sentence_spans, sentence_embeddings,
+                                        doc.fingerprint))
+
+
+__all__ = ['IngestPipeline', 'IngestStats', 'EncodedDocument', 'ExtractedDocument', 'extract_document']
@@ -0,0 +1,156 @@
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; matching is on whole words, not substrings"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def term_counts(text: str) -> Dict[str, int]:
+    return Counter(tokenize(text))
+
+
+class KeywordIndex:
+    """In-memory inverted index over documents with BM25 scoring.
+
+    Postings are array-backed (doc ids and term frequencies per term) so scoring
+    a query is a postings lookup rather than a scan of the document text.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # Serving stores backfill documents from request threads while others score;
+        # score reads the postings arrays in place, so they must not be resized meanwhile
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.vocab = {}          # term -> term id
+        self.postings_docs = []  # term id -> sorted array of doc ids
+        self.postings_tfs = []   # term id -> array of term frequencies
+        self.doc_terms = {}      # doc id -> array of term ids, for removal
+        self.doc_lengths = {}    # doc id -> number of tokens
+        self.total_length = 0
+        self._idf = None
+
+    def __contains__(self, doc_id: int) -> bool:
+        return doc_id in self.doc_lengths
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, doc_id: int, counts: Dict[str, int]):
+        """Index a document given its term -> frequency counts"""
+        with self._lock:
+            self._add(doc_id, counts)
+
+    def _add(self, doc_id: int, counts: Dict[str, int]):
+        if doc_id in self.doc_lengths:
+            self._remove(doc_id)
+
+        term_ids = array('q')
+        for term, tf in counts.items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                term_id = len(self.postings_docs)
+                self.vocab[term] = term_id
+                self.postings_docs.append(array('q'))
+                self.postings_tfs.append(array('q'))
+            docs = self.postings_docs[term_id]
+            # Doc ids normally arrive in increasing order; keep postings sorted regardless
+            position = len(docs) if not docs or docs[-1] < doc_id else bisect_left(docs, doc_id)
+            docs.insert(position, doc_id)
+            self.postings_tfs[term_id].insert(position, tf)
+            term_ids.append(term_id)
+
+        length = sum(counts.values())
+        self.doc_terms[doc_id] = term_ids
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+        self._idf = None
+
+    def remove(self, doc_id: int):
+        """Drop a document's postings"""
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: int):
+        term_ids = self.doc_terms.pop(doc_id, None)
+        if term_ids is None:
+            return
+        for term_id in term_ids:
+            docs = self.postings_docs[term_id]
+            position = bisect_left(docs, doc_id)
+            docs.pop(position)
+            self.postings_tfs[term_id].pop(position)
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        self._idf = None
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    @property
+    def idf(self) -> np.ndarray:
+        """IDF per term id, recomputed only after the index changes"""
+        if self._idf is None:
+            n_docs = len(self.doc_lengths)
+            df = np.fromiter((len(docs) for docs in self.postings_docs), dtype=np.float64,
+                             count=len(self.postings_docs))
+            self._idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        return self._idf
+
+    def score(self, query: str, doc_ids: Iterable[int]) -> Dict[int, Tuple[float, int]]:
+        """BM25 scores for the given documents.
+
+        Returns doc id -> (score normalized to [0, 1), number of query terms matched).
+        The normalization divides by the score a document would reach with unbounded
+        term frequency for every query term, so it blends with cosine similarity.
+        """
+        doc_ids = np.fromiter(doc_ids, dtype=np.int64)
+        with self._lock:
+            return self._score(query, doc_ids)
+
+    def _score(self, query: str, doc_ids: np.ndarray) -> Dict[int, Tuple[float, int]]:
+        scores = np.zeros(len(doc_ids))
+        matches = np.zeros(len(doc_ids), dtype=np.int64)
+        if len(doc_ids) == 0 or not self.doc_lengths:
+            return {}
+
+        avg_length = self.total_length / len(self.doc_lengths) or 1.0
+        lengths = np.array([self.doc_lengths.get(int(d), 0) for d in doc_ids], dtype=np.float64)
+        norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+
+        idf = self.idf
+        max_score = 0.0
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None or not self.postings_docs[term_id]:
+                continue
+            max_score += idf[term_id] * (self.k1 + 1)
+
+            postings = np.frombuffer(self.postings_docs[term_id], dtype=np.int64)
+            tfs = np.frombuffer(self.postings_tfs[term_id], dtype=np.int64)
+            positions = np.minimum(np.searchsorted(postings, doc_ids), len(postings) - 1)
+            hit = postings[positions] == doc_ids
+            tf = np.where(hit, tfs[positions], 0).astype(np.float64)
+
+            scores += idf[term_id] * tf * (self.k1 + 1) / (tf + norm)
+            matches += hit
+
+        if max_score > 0:
+            scores /= max_score
+        return {int(d): (float(s), int(m)) for d, s, m in zip(doc_ids, scores, matches)}
+
+
+__all__ = ['KeywordIndex', 'tokenize', 'term_counts']
@@ -0,0 +1,24 @@
+import sys
+import importlib.util
+
+
+def lazy_import(name: str):
+    """Return a module that is only executed on first attribute access.
+
+    Keeps heavy native dependencies (faiss) out of the import path of code that
+    never searches, e.g. models loaded by django.setup() for every manage.py command.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+__all__ = ['lazy_import']
@@ -1,104 +1,93 @@
 from django.core.management.base import BaseCommand
 import os
-import shutil
-import sqlite3
-from django.conf import settings
-from pdf_processor.models import PDFDocument
-from pdf_processor.vector_store import VectorStore, extract_text_from_pdf
-from sentence_transformers import SentenceTransformer
+from django.utils import timezone
+from pdf_processor.models import PDFDocument, IndexingJob
+from pdf_processor.vector_store import VectorStore
+from pdf_processor.snapshots import SnapshotDirectory
+from pdf_processor.encoders import get_encoder
+from pdf_processor.ingest import IngestPipeline
 
 class Command(BaseCommand):
     help = 'Complete rebuild of search index and database'
 
-    def clean_vector_store_db(self, db_path):
-        """Clean the vector store database"""
-        try:
-            if os.path.exists(db_path):
-                os.remove(db_path)
-                self.stdout.write(f"Removed existing database: {db_path}")
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Error cleaning database: {e}"))
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='PDF extraction processes (default: RAG_INGEST_WORKERS or every core)')
 
     def handle(self, *args, **options):
         try:
-            # 1. Clear everything
+            # 1. Start from an empty snapshot; the live one keeps serving until step 5
             self.stdout.write("=== Starting Complete Rebuild ===")
-            
-            # Clear vector store directory
-            output_dir = os.path.join(settings.BASE_DIR, 'modelrag', 'output')
-            if os.path.exists(output_dir):
-                shutil.rmtree(output_dir)
-                self.stdout.write("Cleared output directory")
-            os.makedirs(output_dir, exist_ok=True)
-
-            # Clear the vector store database
-            db_path = 'djang/modelrag/output/vector_store.db'
-            self.clean_vector_store_db(db_path)
+            started = timezone.now()
+            snapshots = SnapshotDirectory()
 
             # 2. Initialize fresh vector store
             self.stdout.write("\nInitializing new vector store...")
-            vector_store = VectorStore(dimension=384)
+            vector_store = VectorStore(dimension=384, snapshot=snapshots.create())
+            self.stdout.write(f"Building snapshot {vector_store.snapshot}")
+            # Save once at the end; IVF indexes are trained on the full corpus there
+            vector_store.autosave = False
+            self.stdout.write(f"Index type: {vector_store.index_config['type']}")
             
             # Initialize model
             self.stdout.write("Initializing model...")
-            model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
+            model = get_encoder()
 
             # 3. Get all documents
             documents = PDFDocument.objects.all()
             self.stdout.write(f"\nFound {documents.count()} documents to process")
 
-            # 4. Process each document
-            processed_count = 0
-            
+            # 4. Process the documents
+            items = []
+            by_id = {}
             for doc in documents:
-                try:
-                    self.stdout.write(f"\nProcessing document {processed_count + 1}/{documents.count()}")
-                    self.stdout.write(f"Title: {doc.title}")
-                    self.stdout.write(f"File: {doc.file.name}")
-                    
-                    # Verify file exists
-                    if not doc.file:
-                        self.stdout.write(self.style.WARNING("No file attached"))
-                        continue
-                        
-                    file_path = doc.file.path
-                    if not os.path.exists(file_path):
-                        self.stdout.write(self.style.WARNING(f"File not found: {file_path}"))
-                        continue
-
-                    # Extract text
-                    text = extract_text_from_pdf(file_path)
-                    if not text:
-                        self.stdout.write(self.style.WARNING("No text extracted"))
-                        continue
+                # Verify file exists
+                if not doc.file:
+                    self.stdout.write(self.style.WARNING(f"No file attached: {doc.title}"))
+                    continue
                     
-                    self.stdout.write(f"Extracted {len(text)} characters")
-
-                    # Generate embedding
-                    embedding = model.encode([text])[0]
-                    self.stdout.write("Generated embedding")
-
-                    # Add to vector store
-                    filename = os.path.basename(file_path)
-                    vector_store.add_documents([filename], [embedding])
-                    processed_count += 1
-                    self.stdout.write(self.style.SUCCESS(f"Added to vector store: {filename}"))
-
-                    # Update document
-                    doc.content = text
-                    doc.is_indexed = True
-                    doc.save(update_fields=['content', 'is_indexed'])
-
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f"Error processing document: {str(e)}"))
-
-            # 5. Save vector store
-            vector_store.save()
+                file_path = doc.file.path
+                if not os.path.exists(file_path):
+                    self.stdout.write(self.style.WARNING(f"File not found: {file_path}"))
+                    continue
+                items.append((doc.pk, file_path, os.path.basename(file_path)))
+                doc.sync_access()
+                by_id[doc.pk] = doc
+
+            def on_result(pk, encoded, error):
+                doc = by_id[pk]
+                if error:
+                    self.stdout.write(self.style.ERROR(f"Error processing {doc.title}: {error}"))
+                    return
+                self.stdout.write(self.style.SUCCESS(
+                    f"Added to vector store: {encoded.path} ({len(encoded.passages)} passages, "
+                    f"{len(encoded.text)} characters)"))
+
+                # Update document
+                doc.content = encoded.text
+                doc.is_indexed = True
+                doc.save(update_fields=['content', 'is_indexed'])
+
+            # Extract, split, embed and add to vector store in parallel
+            pipeline = IngestPipeline(vector_store, model, workers=options['workers'])
+            stats = pipeline.run(items, on_result)
+            processed_count = stats.documents
+
+            # 5. Save vector store and make it live
+            vector_store.checkpoint()
+            snapshots.publish(vector_store.snapshot, vector_store.manifest())
+            self.stdout.write(f"Published snapshot {vector_store.snapshot}")
+
+            # Deletes, uploads and re-uploads while we ran went to the old snapshot
+            removed, requeued = IndexingJob.catch_up(vector_store, started)
+            self.stdout.write(f"Removed {removed} deleted documents, queued {requeued} changed documents again")
 
             # 6. Verify final state
             self.stdout.write("\n=== Final State ===")
             self.stdout.write(f"Documents in database: {documents.count()}")
-            self.stdout.write(f"Documents processed: {processed_count}")
+            self.stdout.write(f"Documents processed: {processed_count} "
+                              f"({stats.docs_per_second:.1f} docs/s, {stats.tokens_per_second:.0f} tokens/s, "
+                              f"{pipeline.workers} extraction workers)")
             self.stdout.write(f"Vectors in index: {vector_store.index.ntotal}")
             self.stdout.write(f"Document mappings: {vector_store.id_to_path}")
 
@@ -0,0 +1,108 @@
+import os
+import time
+import sqlite3
+import statistics
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from pdf_processor.encoders import get_encoder, DEFAULT_ENCODER
+from pdf_processor.onnx_encoder import export_onnx, onnx_model_dir, parity_report, INT8_FILE
+from pdf_processor.snapshots import SnapshotDirectory
+
+# Used when the index holds no passages yet
+SAMPLE_TEXTS = [
+    "How do I reset my password?",
+    "Quarterly revenue grew by twelve percent compared to last year.",
+    "The contract may be terminated by either party with thirty days written notice.",
+    "Install the package and run the migrations before starting the server.",
+    "Symptoms include fever, headache and fatigue lasting several days.",
+    "The committee approved the budget for the new library building.",
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "Shipping is free for orders over fifty dollars within the country.",
+]
+
+
+class Command(BaseCommand):
+    help = 'Export the encoder to ONNX (fp32 and int8) and check its embeddings against torch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', default=None, help='Model to export (default: RAG_ENCODER)')
+        parser.add_argument('--no-quantize', action='store_true', help='Skip the int8 model')
+        parser.add_argument('--check-only', action='store_true', help='Check the existing export without re-exporting')
+        parser.add_argument('--samples', type=int, default=500, help='Indexed passages to compare on')
+        parser.add_argument('--min-cosine', type=float, default=0.99,
+                            help='Fail if any text embeds below this cosine similarity to torch')
+
+    def sample_texts(self, n):
+        """Passages from the live index, plus their opening words as query-like texts"""
+        snapshots = SnapshotDirectory()
+        db_path = os.path.join(snapshots.path(snapshots.current()), 'vector_store.db')
+        passages = []
+        if os.path.exists(db_path):
+            conn = sqlite3.connect(db_path)
+            try:
+                passages = [row[0] for row in conn.execute(
+                    "SELECT text FROM passages WHERE text IS NOT NULL AND text != '' ORDER BY RANDOM() LIMIT ?",
+                    (n,))]
+            except sqlite3.OperationalError:
+                pass
+            finally:
+                conn.close()
+        if not passages:
+            self.stdout.write(self.style.WARNING("No indexed passages; comparing on built-in sample texts"))
+            return list(SAMPLE_TEXTS)
+        return passages + [' '.join(passage.split()[:8]) for passage in passages]
+
+    def timings(self, encoder, texts, queries):
+        """(texts/s with bucketed batches, median ms to encode one query)"""
+        start = time.perf_counter()
+        encoder.encode_bucketed(texts)
+        throughput = len(texts) / (time.perf_counter() - start)
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            encoder.encode([query], batch_size=1, convert_to_numpy=True)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return throughput, statistics.median(latencies)
+
+    def handle(self, *args, **options):
+        name = options['name'] or getattr(settings, 'RAG_ENCODER', DEFAULT_ENCODER)
+        model_dir = onnx_model_dir(name)
+        if not options['check_only']:
+            self.stdout.write(f"Exporting {name} to {model_dir}...")
+            export_onnx(name, model_dir, quantize=not options['no_quantize'])
+        elif not os.path.isdir(model_dir):
+            raise CommandError(f"No ONNX export of {name} in {model_dir}")
+
+        texts = self.sample_texts(options['samples'])
+        queries = [' '.join(text.split()[:8]) for text in texts[:50]]
+        self.stdout.write(f"Comparing on {len(texts)} texts")
+
+        reference = get_encoder(name, 'torch')
+        # Warm up each encoder before timing it
+        reference.encode(queries[:2])
+        torch_rate, torch_latency = self.timings(reference, texts, queries)
+        self.stdout.write(f"torch: {torch_rate:.1f} texts/s, {torch_latency:.1f} ms per query")
+
+        backends = ['onnx']
+        if os.path.exists(os.path.join(model_dir, INT8_FILE)):
+            backends.append('onnx-int8')
+        failed = []
+        for backend in backends:
+            candidate = get_encoder(name, backend)
+            report = parity_report(reference, candidate, texts)
+            candidate.encode(queries[:2])
+            rate, latency = self.timings(candidate, texts, queries)
+            self.stdout.write(
+                f"{backend}: {rate:.1f} texts/s ({rate / torch_rate:.2f}x), "
+                f"{latency:.1f} ms per query ({torch_latency / latency:.2f}x faster); "
+                f"cosine min {report['min_cosine']:.4f} mean {report['mean_cosine']:.4f}, "
+                f"max abs diff {report['max_abs_diff']:.4f}, "
+                f"top-{report['k']} neighbour overlap {report['neighbour_overlap']:.3f}")
+            if report['min_cosine'] < options['min_cosine']:
+                failed.append(backend)
+
+        if failed:
+            raise CommandError(f"{', '.join(failed)} embeddings differ from torch beyond "
+                               f"--min-cosine {options['min_cosine']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"ONNX export of {name} matches torch; set RAG_ENCODER_BACKEND to {' or '.join(backends)} to use it"))
@@ -1,15 +1,47 @@
 import os
 import logging
 from django.core.management.base import BaseCommand
-from sentence_transformers import SentenceTransformer
-import fitz  # PyMuPDF
 from django.conf import settings
 from pdf_processor.vector_store import VectorStore
+from pdf_processor.encoders import get_encoder
+from pdf_processor.ingest import IngestPipeline
+from pdf_processor.text_store import file_fingerprint, file_sha256
 
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
-    help = 'Generate or update FAISS index from PDF documents'
+    help = 'Generate or update FAISS index from PDF documents, re-embedding only added or changed files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='PDF extraction processes (default: RAG_INGEST_WORKERS or every core)')
+        parser.add_argument('--keep-removed', action='store_true',
+                            help='Keep index entries of PDFs no longer in PDF_STORAGE')
+
+    def diff_files(self, pdf_dir, pdf_files, known):
+        """Compare PDF_STORAGE with the fingerprints in the store.
+
+        Returns (changed, touched, unchanged): files to (re-)index, unchanged files
+        with a new size/mtime to record, and the number of files to skip. Files whose
+        size and mtime match are skipped without being read; otherwise the content
+        hash decides, so copies and touched files are not re-embedded.
+        """
+        changed, touched, unchanged = [], {}, 0
+        for filename in pdf_files:
+            full_path = os.path.join(pdf_dir, filename)
+            fingerprint = file_fingerprint(full_path)
+            if filename not in known:
+                changed.append(filename)
+                continue
+            size, mtime_ns, content_hash = known[filename]
+            if (size, mtime_ns) == fingerprint:
+                unchanged += 1
+            elif content_hash and file_sha256(full_path) == content_hash:
+                touched[filename] = fingerprint
+                unchanged += 1
+            else:
+                changed.append(filename)
+        return changed, touched, unchanged
 
     def handle(self, *args, **options):
         # Check PDF directory
@@ -21,10 +53,6 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f"PDF directory does not exist: {settings.PDF_STORAGE}"))
             return
 
-        # Initialize model
-        model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
-        model.max_seq_length = 256
-        
         # Initialize VectorStore
         vector_store = VectorStore(dimension=384)
         
@@ -32,75 +60,64 @@ class Command(BaseCommand):
             # Try to load existing index
             vector_store.load()
             self.stdout.write(self.style.SUCCESS('Loaded existing vector store'))
-            
-            # Get list of already processed files
-            existing_files = set(vector_store.id_to_path.values())
-            self.stdout.write(f"Found {len(existing_files)} already processed files")
-            
         except Exception as e:
             self.stdout.write(self.style.WARNING(f'Could not load vector store: {str(e)}'))
             self.stdout.write('Creating new vector store')
-            existing_files = set()
 
-        # Process each PDF
+        # Save once at the end; an untrained IVF index is trained there
+        vector_store.autosave = False
+
+        # Diff the directory against the size, mtime and content hash recorded for each file
         pdf_dir = settings.PDF_STORAGE
+        known = vector_store.file_fingerprints()
+        self.stdout.write(f"Found {len(known)} already processed files")
+        changed, touched, skipped_count = self.diff_files(pdf_dir, pdf_files, known)
+        if touched:
+            vector_store.update_fingerprints(touched)
+            self.stdout.write(f'Recorded new timestamps for {len(touched)} unchanged files')
+
+        removed = [] if options['keep_removed'] else sorted(set(known) - set(pdf_files))
+        for filename in removed:
+            self.stdout.write(f'Removing deleted file: {filename}')
+            vector_store.remove_document(filename)
+
+        items = []
+        for filename in changed:
+            self.stdout.write(f"{'Re-indexing changed' if filename in known else 'Indexing new'} file: {filename}")
+            items.append((filename, os.path.join(pdf_dir, filename), filename))
+
+        def on_result(filename, encoded, error):
+            if error:
+                logger.error(f'Error processing {filename}: {error}')
+                self.stdout.write(self.style.ERROR(f'Error processing {filename}: {error}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'Processed {filename} ({len(encoded.passages)} passages)'))
+
+        # Extract, split, embed and add to vector store in parallel; the encoder is only
+        # loaded when something changed
         processed_count = 0
-        skipped_count = 0
-        
-        for filename in pdf_files:
-            if filename in existing_files:
-                self.stdout.write(f'Skipping already processed file: {filename}')
-                skipped_count += 1
-                continue
-                
-            pdf_path = os.path.join(pdf_dir, filename)
-            try:
-                # Extract text
-                text = self.extract_text_from_pdf(pdf_path)
-                if not text:
-                    self.stdout.write(self.style.WARNING(f'No text extracted from {filename}'))
-                    continue
-                    
-                # Generate embedding
-                embedding = model.encode([text])
-                
-                # Add to vector store
-                vector_store.add_documents([filename], embedding)
-                
-                processed_count += 1
-                self.stdout.write(self.style.SUCCESS(f'Processed {filename}'))
-                
-            except Exception as e:
-                logger.error(f'Error processing {filename}: {str(e)}')
-                self.stdout.write(self.style.ERROR(f'Error processing {filename}: {str(e)}'))
-                continue
+        if items:
+            pipeline = IngestPipeline(vector_store, get_encoder(), workers=options['workers'])
+            stats = pipeline.run(items, on_result)
+            processed_count = stats.documents
+            self.stdout.write(f'Processed {processed_count} new or changed documents '
+                              f'({stats.docs_per_second:.1f} docs/s, {stats.tokens_per_second:.0f} tokens/s)')
 
         # Save updated vector store
-        if processed_count > 0:
-            vector_store.save()
+        if processed_count > 0 or removed:
+            vector_store.checkpoint()
             self.stdout.write(self.style.SUCCESS(
-                f'Successfully processed {processed_count} new documents\n'
-                f'Skipped {skipped_count} already processed documents\n'
+                f'Successfully processed {processed_count} new or changed documents\n'
+                f'Removed {len(removed)} deleted documents\n'
+                f'Skipped {skipped_count} unchanged documents\n'
                 f'Vector store updated with {vector_store.index.ntotal} total embeddings'
             ))
         else:
             if skipped_count > 0:
                 self.stdout.write(self.style.SUCCESS(
-                    f'No new documents to process\n'
-                    f'Skipped {skipped_count} already processed documents\n'
+                    f'No new or changed documents to process\n'
+                    f'Skipped {skipped_count} unchanged documents\n'
                     f'Vector store contains {vector_store.index.ntotal} total embeddings'
                 ))
             else:
                 self.stdout.write(self.style.WARNING('No valid PDFs processed'))
-
-    def extract_text_from_pdf(self, pdf_path):
-        """Extract text from a PDF file using PyMuPDF"""
-        try:
-            doc = fitz.open(pdf_path)
-            text = ''
-            for page in doc:
-                text += page.get_text()
-            return text
-        except Exception as e:
-            logger.error(f'Error extracting text from {pdf_path}: {str(e)}')
-            return None
@@ -0,0 +1,68 @@
+import os
+import time
+import signal
+import socket
+import logging
+from django.core.management.base import BaseCommand
+from pdf_processor.models import IndexingJob
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Index queued documents; run several workers to index in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=8, help='Jobs claimed per round')
+        parser.add_argument('--poll', type=float, default=5.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is drained')
+
+    def handle(self, *args, **options):
+        from pdf_processor.services import get_search_service
+
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        # Loads the encoder and index once; every job reuses them
+        search_service = get_search_service(writable=True)
+        self.stdout.write(f"Index worker {worker} started")
+
+        processed = failed = 0
+        while not self._stopping:
+            jobs = IndexingJob.claim(worker, options['batch_size'])
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(options['poll'])
+                continue
+
+            for job in jobs:
+                if self._stopping:
+                    # Unfinished claims are picked up again once RAG_INDEX_JOB_TIMEOUT passes
+                    break
+                start = time.time()
+                try:
+                    if job.action == IndexingJob.REMOVE:
+                        search_service.remove_from_index(job.path)
+                    else:
+                        job.document.process_and_index()
+                    job.mark_done()
+                    processed += 1
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Done {job.target} in {time.time() - start:.1f}s"))
+                except Exception as e:
+                    job.mark_failed(e)
+                    failed += 1
+                    logger.error(f"Indexing job {job.pk} ({job.target}) failed: {str(e)}")
+                    self.stdout.write(self.style.ERROR(
+                        f"Failed {job.target} (attempt {job.attempts}): {str(e)}"))
+
+        # A rebuild may have published a newer snapshot while we ran
+        search_service.current_store().save()
+        self.stdout.write(f"Index worker {worker} stopped: {processed} done, {failed} failed")
+
+    def _stop(self, signum, frame):
+        self.stdout.write("Stopping after the current document...")
+        self._stopping = True
@@ -1,9 +1,12 @@
 from django.core.management.base import BaseCommand
-from pdf_processor.models import PDFDocument
+from pdf_processor.models import PDFDocument, IndexingJob
 from pdf_processor.vector_store import VectorStore
-from sentence_transformers import SentenceTransformer
+from pdf_processor.snapshots import SnapshotDirectory
+from pdf_processor.encoders import get_encoder
+from pdf_processor.ingest import IngestPipeline
 import os
 from django.conf import settings
+from django.utils import timezone
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,68 +14,74 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Rebuild FAISS index and clean up orphaned vectors'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='PDF extraction processes (default: RAG_INGEST_WORKERS or every core)')
+
     def handle(self, *args, **options):
         self.stdout.write("Starting index rebuild...")
         
-        # Initialize new vector store
-        vector_store = VectorStore(dimension=384)
-        model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
+        model = get_encoder()
         
         # Get all PDF documents from database
         documents = PDFDocument.objects.all()
         self.stdout.write(f"Found {documents.count()} documents in database")
         
-        # Clear existing index
-        vector_store = VectorStore(dimension=384)
-        vector_store._init_db()  # Reset the database
-        
-        # Process each document
-        successful = 0
-        failed = 0
+        # Build into a new snapshot; searches keep using the live one until it is published
+        started = timezone.now()
+        snapshots = SnapshotDirectory()
+        vector_store = VectorStore(dimension=384, snapshot=snapshots.create())
+        self.stdout.write(f"Building snapshot {vector_store.snapshot}")
+        # Save once at the end; IVF indexes are trained on the full corpus there
+        vector_store.autosave = False
+        self.stdout.write(f"Index type: {vector_store.index_config['type']}")
         
+        # Collect the documents to index
+        items = []
+        by_id = {}
         for doc in documents:
-            try:
-                if not doc.file:
-                    self.stdout.write(self.style.WARNING(f"Skipping {doc.title}: No file"))
-                    continue
-                    
-                file_path = os.path.join(settings.MEDIA_ROOT, str(doc.file))
-                if not os.path.exists(file_path):
-                    self.stdout.write(self.style.WARNING(f"Skipping {doc.title}: File not found at {file_path}"))
-                    continue
-                
-                # Extract text
-                from pdf_processor.vector_store import extract_text_from_pdf
-                text = extract_text_from_pdf(file_path)
-                
-                if not text:
-                    self.stdout.write(self.style.WARNING(f"Skipping {doc.title}: No text extracted"))
-                    continue
-                
-                # Generate embedding
-                embedding = model.encode([text])[0]
-                
-                # Add to vector store
-                vector_store.add_documents([str(doc.file)], [embedding])
+            if not doc.file:
+                self.stdout.write(self.style.WARNING(f"Skipping {doc.title}: No file"))
+                continue
                 
-                # Update document status
-                doc.is_indexed = True
-                doc.save(update_fields=['is_indexed'])
-                
-                successful += 1
-                self.stdout.write(self.style.SUCCESS(f"Indexed: {doc.title}"))
-                
-            except Exception as e:
-                failed += 1
-                self.stdout.write(self.style.ERROR(f"Error processing {doc.title}: {str(e)}"))
+            file_path = os.path.join(settings.MEDIA_ROOT, str(doc.file))
+            if not os.path.exists(file_path):
+                self.stdout.write(self.style.WARNING(f"Skipping {doc.title}: File not found at {file_path}"))
+                continue
+            items.append((doc.pk, file_path, str(doc.file)))
+            doc.sync_access()
+            by_id[doc.pk] = doc
+
+        def on_result(pk, encoded, error):
+            doc = by_id[pk]
+            if error:
+                self.stdout.write(self.style.ERROR(f"Error processing {doc.title}: {error}"))
+                return
+            # Update document status
+            doc.is_indexed = True
+            doc.save(update_fields=['is_indexed'])
+            self.stdout.write(self.style.SUCCESS(f"Indexed: {doc.title}"))
+
+        # Extract, split, embed and add to vector store in parallel
+        pipeline = IngestPipeline(vector_store, model, workers=options['workers'])
+        stats = pipeline.run(items, on_result)
         
-        # Save the new index
-        vector_store.save()
+        # Save the new index and make it live
+        vector_store.checkpoint()
+        snapshots.publish(vector_store.snapshot, vector_store.manifest())
+
+        # Deletes, uploads and re-uploads while we ran went to the old snapshot
+        removed, requeued = IndexingJob.catch_up(vector_store, started)
         
         self.stdout.write(self.style.SUCCESS(
             f"\nIndex rebuild complete:\n"
-            f"- Successfully indexed: {successful}\n"
-            f"- Failed: {failed}\n"
+            f"- Successfully indexed: {stats.documents}\n"
+            f"- Failed: {stats.failed}\n"
+            f"- Throughput: {stats.docs_per_second:.1f} docs/s, {stats.tokens_per_second:.0f} tokens/s "
+            f"with {pipeline.workers} extraction workers\n"
             f"- Total vectors in index: {vector_store.index.ntotal}\n"
-            f"- Total documents mapped: {len(vector_store.id_to_path)}"
+            f"- Total documents mapped: {len(vector_store.id_to_path)}\n"
+            f"- Published snapshot: {vector_store.snapshot}\n"
+            f"- Deleted while building, removed: {removed}\n"
+            f"- Uploads queued again: {requeued}"
         ))
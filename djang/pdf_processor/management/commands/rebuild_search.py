@@ -1,58 +1,70 @@
 from django.core.management.base import BaseCommand
 import os
 from django.conf import settings
-from pdf_processor.models import PDFDocument
+from django.utils import timezone
+from pdf_processor.models import PDFDocument, IndexingJob
 from pdf_processor.vector_store import VectorStore
-from sentence_transformers import SentenceTransformer
+from pdf_processor.snapshots import SnapshotDirectory
+from pdf_processor.encoders import get_encoder
+from pdf_processor.ingest import IngestPipeline
 
 class Command(BaseCommand):
     help = 'Rebuild search index from existing documents'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='PDF extraction processes (default: RAG_INGEST_WORKERS or every core)')
+
     def handle(self, *args, **options):
         # Initialize
         self.stdout.write("Initializing...")
-        model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
-        vector_store = VectorStore(dimension=384)
+        model = get_encoder()
+        # Build into a new snapshot; searches keep using the live one until it is published
+        started = timezone.now()
+        snapshots = SnapshotDirectory()
+        vector_store = VectorStore(dimension=384, snapshot=snapshots.create())
+        self.stdout.write(f"Building snapshot {vector_store.snapshot}")
+        # Save once at the end; IVF indexes are trained on the full corpus there
+        vector_store.autosave = False
+        self.stdout.write(f"Index type: {vector_store.index_config['type']}")
         
         # Get all documents
         documents = PDFDocument.objects.all()
         self.stdout.write(f"Found {documents.count()} documents in database")
         
-        # Process each document
+        # Collect the documents to index
+        items = []
+        titles = {}
         for doc in documents:
-            try:
-                # Get file path
-                file_path = os.path.join(settings.MEDIA_ROOT, str(doc.file))
-                if not os.path.exists(file_path):
-                    self.stdout.write(self.style.WARNING(f"File not found: {file_path}"))
-                    continue
-                
-                self.stdout.write(f"Processing: {doc.title}")
-                
-                # Extract text
-                from pdf_processor.vector_store import extract_text_from_pdf
-                text = extract_text_from_pdf(file_path)
-                
-                if not text:
-                    self.stdout.write(self.style.WARNING(f"No text extracted from {doc.title}"))
-                    continue
-                
-                # Generate embedding
-                embedding = model.encode([text])[0]
-                
-                # Add to vector store
-                vector_store.add_documents(
-                    [str(doc.file)],
-                    [embedding]
-                )
-                
-                self.stdout.write(self.style.SUCCESS(f"Indexed: {doc.title}"))
-                
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Error processing {doc.title}: {str(e)}"))
+            # Get file path
+            file_path = os.path.join(settings.MEDIA_ROOT, str(doc.file))
+            if not os.path.exists(file_path):
+                self.stdout.write(self.style.WARNING(f"File not found: {file_path}"))
+                continue
+            items.append((doc.pk, file_path, str(doc.file)))
+            doc.sync_access()
+            titles[doc.pk] = doc.title
+
+        def on_result(pk, encoded, error):
+            if error:
+                self.stdout.write(self.style.ERROR(f"Error processing {titles[pk]}: {error}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"Indexed: {titles[pk]}"))
+
+        # Extract, split, embed and add to vector store in parallel
+        pipeline = IngestPipeline(vector_store, model, workers=options['workers'])
+        stats = pipeline.run(items, on_result)
+        self.stdout.write(f"Indexed {stats.documents} documents in {stats.seconds:.1f}s "
+                          f"({stats.docs_per_second:.1f} docs/s, {stats.tokens_per_second:.0f} tokens/s)")
         
-        # Save vector store
-        vector_store.save()
+        # Save vector store and make it live
+        vector_store.checkpoint()
+        snapshots.publish(vector_store.snapshot, vector_store.manifest())
+        self.stdout.write(f"Published snapshot {vector_store.snapshot}")
+
+        # Deletes, uploads and re-uploads while we ran went to the old snapshot
+        removed, requeued = IndexingJob.catch_up(vector_store, started)
+        self.stdout.write(f"Removed {removed} deleted documents, queued {requeued} changed documents again")
         
         # Verify final state
         self.stdout.write("\nFinal state:")
@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import subprocess
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+
+DEFAULT_TARGETS = [
+    'pdf_processor.models',
+    'pdf_processor.views',
+    'pdf_processor.management.commands.clear',
+    'pdf_processor.management.commands.generate_faiss_index',
+]
+
+# Dependencies that should only load on paths that encode, search or parse PDFs.
+# faiss is imported lazily, so its presence in sys.modules alone doesn't count.
+HEAVY_MODULES = {
+    'torch': 'torch',
+    'sentence_transformers': 'sentence_transformers',
+    'faiss': 'faiss.loader',
+    'fitz': 'pymupdf',
+}
+
+_CHILD = '''
+import sys, json, time, importlib
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter() - start
+importlib.import_module({target!r})
+if {encoder!r}:
+    from pdf_processor.encoders import get_encoder
+    get_encoder()
+total = time.perf_counter() - start
+heavy = [name for name, module in {heavy!r}.items() if module in sys.modules]
+print(json.dumps({{"setup": setup, "total": total, "heavy": heavy}}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Report start-up time and import cost per package for the given modules'
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='*', default=DEFAULT_TARGETS,
+                            help='Modules to import after django.setup()')
+        parser.add_argument('--top', type=int, default=10, help='Packages to list per module')
+        parser.add_argument('--with-encoder', action='store_true', help='Also time loading the shared encoder')
+
+    def handle(self, *args, **options):
+        for target in options['targets']:
+            # A fresh interpreter per target, so earlier imports don't hide later costs
+            code = _CHILD.format(target=target, encoder=options['with_encoder'], heavy=HEAVY_MODULES)
+            result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                                    capture_output=True, text=True, env=os.environ.copy())
+            if result.returncode != 0:
+                self.stdout.write(self.style.ERROR(f"{target}: import failed\n{result.stderr[-2000:]}"))
+                continue
+
+            summary = json.loads(result.stdout.strip().splitlines()[-1])
+            self_time = defaultdict(int)
+            for line in result.stderr.splitlines():
+                if not line.startswith('import time:') or 'self [us]' in line:
+                    continue
+                # "import time: <self us> | <cumulative us> | <indented module name>"
+                self_us, _, name = line[len('import time:'):].split('|')
+                self_time[name.strip().split('.')[0]] += int(self_us)
+
+            heavy = ', '.join(summary['heavy']) or 'none'
+            self.stdout.write(self.style.SUCCESS(
+                f"\n{target}: {summary['total']:.2f}s total, {summary['setup']:.2f}s in django.setup(); "
+                f"heavy modules loaded: {heavy}"
+            ))
+            for package, us in sorted(self_time.items(), key=lambda item: -item[1])[:options['top']]:
+                self.stdout.write(f"  {us / 1e6:7.3f}s  {package}")
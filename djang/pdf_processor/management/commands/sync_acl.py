@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from pdf_processor.models import PDFDocument
+
+
+class Command(BaseCommand):
+    help = 'Rewrite the search access lists from document owners, groups and view permissions'
+
+    def handle(self, *args, **options):
+        synced = 0
+        for doc in PDFDocument.objects.exclude(file='').select_related('owner'):
+            doc.sync_access()
+            synced += 1
+        self.stdout.write(self.style.SUCCESS(f"Synced access lists for {synced} documents"))
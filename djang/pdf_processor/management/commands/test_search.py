@@ -1,12 +1,12 @@
 from django.core.management.base import BaseCommand
-from sentence_transformers import SentenceTransformer
 from ...vector_store import VectorStore, find_similar_documents
+from ...encoders import get_encoder
 
 class Command(BaseCommand):
     help = 'Test the search functionality'
 
     def handle(self, *args, **options):
-        model = SentenceTransformer('all-MiniLM-L6-v2')
+        model = get_encoder()
         vector_store = VectorStore()
         vector_store.load()
         
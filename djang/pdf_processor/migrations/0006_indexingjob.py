@@ -0,0 +1,33 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf_processor', '0005_pdfdocument_is_indexed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=16)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('run_after', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('locked_by', models.CharField(blank=True, max_length=255)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='indexing_job', to='pdf_processor.pdfdocument')),
+            ],
+            options={
+                'ordering': ['run_after', 'id'],
+            },
+        ),
+    ]
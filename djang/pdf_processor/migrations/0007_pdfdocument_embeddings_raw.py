@@ -0,0 +1,73 @@
+# Generated by Django 4.2.10 on 2026-10-18 16:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+CHUNK = 100
+
+
+def _chunks(queryset):
+    # Fetch by primary key so the table is never written while a cursor is open on it (SQLite)
+    pks = list(queryset.values_list('pk', flat=True))
+    for start in range(0, len(pks), CHUNK):
+        yield queryset.model.objects.filter(pk__in=pks[start:start + CHUNK]).values_list('pk', 'embeddings')
+
+
+def pickle_to_raw(apps, schema_editor):
+    import pickle
+    import numpy as np
+
+    PDFDocument = apps.get_model('pdf_processor', 'PDFDocument')
+    dtype = np.dtype(getattr(settings, 'RAG_EMBEDDINGS_DTYPE', 'float16')).newbyteorder('<')
+    for rows in _chunks(PDFDocument.objects.exclude(embeddings=None)):
+        for pk, blob in rows:
+            try:
+                array = np.ascontiguousarray(np.atleast_2d(pickle.loads(bytes(blob))), dtype=dtype)
+            except Exception as e:
+                # Embeddings on the document are not used for search; a rebuild re-encodes it
+                print(f"Dropping unreadable embeddings of document {pk}: {e}")
+                PDFDocument.objects.filter(pk=pk).update(embeddings=None)
+                continue
+            PDFDocument.objects.filter(pk=pk).update(
+                embeddings=array.tobytes(), embeddings_dtype=dtype.str,
+                embeddings_rows=array.shape[0], embeddings_dim=array.shape[1])
+
+
+def raw_to_pickle(apps, schema_editor):
+    import pickle
+    import numpy as np
+
+    PDFDocument = apps.get_model('pdf_processor', 'PDFDocument')
+    documents = PDFDocument.objects.exclude(embeddings=None).exclude(embeddings_dtype='')
+    for rows in _chunks(documents):
+        for pk, blob in rows:
+            document = PDFDocument.objects.only('embeddings_dtype', 'embeddings_rows', 'embeddings_dim').get(pk=pk)
+            array = np.frombuffer(bytes(blob), dtype=document.embeddings_dtype).astype('float32')
+            array = array.reshape(document.embeddings_rows, document.embeddings_dim)
+            PDFDocument.objects.filter(pk=pk).update(embeddings=pickle.dumps(array))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf_processor', '0006_indexingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='embeddings_dtype',
+            field=models.CharField(blank=True, max_length=8),
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='embeddings_rows',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='embeddings_dim',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(pickle_to_raw, raw_to_pickle),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:40
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_existing_files(apps, schema_editor):
+    PDFDocument = apps.get_model('pdf_processor', 'PDFDocument')
+    # Listed up front: SQLite can't safely update a table while a cursor is open on it
+    for document in list(PDFDocument.objects.exclude(file='').only('pk', 'file')):
+        digest = hashlib.sha256()
+        try:
+            with document.file.open('rb') as f:
+                for chunk in f.chunks():
+                    digest.update(chunk)
+        except (FileNotFoundError, ValueError):
+            # Missing files are hashed when the document is next indexed
+            continue
+        PDFDocument.objects.filter(pk=document.pk).update(content_hash=digest.hexdigest())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf_processor', '0007_pdfdocument_embeddings_raw'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.RunPython(hash_existing_files, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.10 on 2026-10-18 18:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pdf_processor', '0008_pdfdocument_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='indexingjob',
+            name='action',
+            field=models.CharField(choices=[('index', 'Index'), ('remove', 'Remove')], default='index', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='indexingjob',
+            name='path',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='indexingjob',
+            name='document',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='indexing_job', to='pdf_processor.pdfdocument'),
+        ),
+    ]
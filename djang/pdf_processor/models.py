@@ -1,17 +1,15 @@
 import os
 import time
-import pickle
+from datetime import timedelta
 from django.db import models
-from .vector_store import VectorStore
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
 from django.contrib.auth.models import User, Group
 from django.core.files.storage import FileSystemStorage
 from django.core.validators import FileExtensionValidator
 from django.conf import settings
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .services import search_service
 import logging
-from sentence_transformers import SentenceTransformer
 
 logger = logging.getLogger(__name__)
 
@@ -41,7 +39,13 @@ class PDFDocument(models.Model):
         validators=[FileExtensionValidator(allowed_extensions=['pdf'])]
     )
     content = models.TextField(blank=True)
+    # SHA-256 of the PDF bytes; documents with the same hash share text and vectors at indexing
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # Raw little-endian bytes of an (embeddings_rows, embeddings_dim) array of embeddings_dtype
     embeddings = models.BinaryField(null=True)
+    embeddings_dtype = models.CharField(max_length=8, blank=True)
+    embeddings_rows = models.PositiveIntegerField(default=0)
+    embeddings_dim = models.PositiveIntegerField(default=0)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='owned_documents')
     groups = models.ManyToManyField(Group, blank=True, related_name='accessible_documents')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -57,11 +61,29 @@ class PDFDocument(models.Model):
     def __str__(self):
         return self.title
 
-    def get_embeddings(self):
-        return pickle.loads(self.embeddings) if self.embeddings else None
+    def get_embeddings(self, dtype=None):
+        """Stored embeddings as a read-only (rows, dim) view of the raw bytes, or None.
+
+        Nothing is copied unless dtype asks for a different type (e.g. 'float32' for FAISS).
+        """
+        import numpy as np
+
+        if not self.embeddings or not self.embeddings_dtype:
+            return None
+        view = np.frombuffer(self.embeddings, dtype=self.embeddings_dtype)
+        view = view.reshape(self.embeddings_rows, self.embeddings_dim)
+        return view if dtype is None else view.astype(dtype, copy=False)
 
     def set_embeddings(self, embeddings_array):
-        self.embeddings = pickle.dumps(embeddings_array)
+        """Store embeddings as raw RAG_EMBEDDINGS_DTYPE bytes (float16 unless configured otherwise)"""
+        import numpy as np
+
+        dtype = np.dtype(getattr(settings, 'RAG_EMBEDDINGS_DTYPE', 'float16')).newbyteorder('<')
+        array = np.ascontiguousarray(np.atleast_2d(embeddings_array), dtype=dtype)
+        self.embeddings = array.tobytes()
+        self.embeddings_dtype = dtype.str
+        self.embeddings_rows, self.embeddings_dim = array.shape
+
     def save(self, *args, **kwargs):
         """Save the document and handle indexing"""
         is_new = self._state.adding
@@ -76,10 +98,14 @@ class PDFDocument(models.Model):
         print(f"Is indexed: {self.is_indexed}")
         print(f"Update fields: {kwargs.get('update_fields')}")
 
-        if not is_new and 'file' in kwargs.get('update_fields', []):
+        update_fields = kwargs.get('update_fields')
+        replaced_name = None
+        if not is_new and (update_fields is None or 'file' in update_fields):
             try:
                 old_instance = PDFDocument.objects.get(pk=self.pk)
                 file_changed = old_instance.file != self.file
+                if file_changed and old_instance.file:
+                    replaced_name = old_instance.file.name
                 print(f"File changed: {file_changed}")  # Debug print
             except PDFDocument.DoesNotExist:
                 file_changed = True
@@ -88,16 +114,22 @@ class PDFDocument(models.Model):
         if is_new or file_changed:
             self.is_indexed = False
             print("Setting is_indexed to False")  # Debug print
+        if file_changed:
+            # Recomputed from the new file when it is indexed
+            self.content_hash = ''
 
         try:
             super().save(*args, **kwargs)
             print("Base save completed")  # Debug print
 
-            # Index if needed
-            if not self.is_indexed and self.file:
-                print("Starting indexing process...")  # Debug print
-                self.process_and_index()
-                print("Indexing completed")  # Debug print
+            # The replaced file leaves the index and access lists, as on delete()
+            if replaced_name and os.path.basename(replaced_name) != os.path.basename(self.file.name or ''):
+                self._queue_file_removal(replaced_name)
+
+            # Indexing runs in `manage.py index_worker`, not in the request
+            if (is_new or file_changed) and self.file:
+                IndexingJob.enqueue(self)
+                print("Queued for indexing")  # Debug print
             else:
                 print(f"Skipping indexing - is_indexed: {self.is_indexed}, has_file: {bool(self.file)}")
 
@@ -112,43 +144,79 @@ class PDFDocument(models.Model):
 
     def process_and_index(self):
         """Process the PDF file and generate embeddings"""
-        from .vector_store import extract_text_from_pdf
+        from .vector_store import extract_paged_text_from_pdf
+        from .chunking import iter_pages
+        from .text_store import file_sha256
+        from .services import get_search_service
+
+        search_service = get_search_service()
         
         print("\n=== INDEXING PROCESS STARTED ===")
         print(f"Processing document: {self.title}")
         print(f"File path: {self.file.path}")
         
         try:
+            # Get the actual filename
+            filename = os.path.basename(self.file.name)
+            access = dict(
+                document_id=self.id,
+                owner_id=self.owner.id,
+                group_ids=[g.id for g in self.groups.all()],
+                permission_ids=list(self.documentpermission_set.filter(can_view=True)
+                                    .values_list('user_id', flat=True)),
+            )
+
+            # The same bytes were uploaded before: copy their text and vectors instead of encoding
+            if not self.content_hash:
+                self.content_hash = file_sha256(self.file.path)
+            copied = search_service.add_duplicate_to_index(filename, self.content_hash, **access)
+            if copied is not None:
+                _, embeddings, text = copied
+                source = (PDFDocument.objects.filter(content_hash=self.content_hash, embeddings_rows=len(embeddings))
+                          .exclude(pk=self.pk).exclude(embeddings_dtype='')
+                          .only('embeddings', 'embeddings_dtype', 'embeddings_rows', 'embeddings_dim').first())
+                if source is not None:
+                    self.embeddings = source.embeddings
+                    self.embeddings_dtype = source.embeddings_dtype
+                    self.embeddings_rows, self.embeddings_dim = source.embeddings_rows, source.embeddings_dim
+                else:
+                    self.set_embeddings(embeddings)
+                self.content = text
+                self.is_indexed = True
+                self.save(update_fields=['embeddings', 'embeddings_dtype', 'embeddings_rows', 'embeddings_dim',
+                                         'content', 'content_hash', 'is_indexed'])
+                print(f"Reused the index entry of identical content {self.content_hash[:12]}")
+                return True
+
             # Extract text
-            text = extract_text_from_pdf(self.file.path)
+            text, offsets = extract_paged_text_from_pdf(self.file.path)
             if not text:
                 raise ValueError("Failed to extract text from PDF")
 
-            print(f"Extracted {len(text)} characters")
+            print(f"Extracted {len(text)} characters from {len(offsets)} pages")
 
-            # Generate embeddings
-            embeddings = search_service.model.encode(text, show_progress_bar=True, batch_size=32)
+            # Split into passages and embed each one
+            passages = search_service.vector_store.split_pages(iter_pages(text, offsets), search_service.model)
+            embeddings, _ = search_service.model.encode_bucketed([p.text for p in passages])
             print(f"Generated embeddings with shape: {embeddings.shape}")
             
             # Save to document
             self.set_embeddings(embeddings)
             self.content = text
             self.is_indexed = True
-            self.save(update_fields=['embeddings', 'content', 'is_indexed'])
+            self.save(update_fields=['embeddings', 'embeddings_dtype', 'embeddings_rows', 'embeddings_dim',
+                                     'content', 'content_hash', 'is_indexed'])
 
             # Add to search index
-            # Get the actual filename
-            filename = os.path.basename(self.file.name)
             print(f"Adding file to index: {filename}")
             
             search_service.add_to_index(
                 title=filename,  # Use filename instead of title
                 embeddings=embeddings,
                 text=text,
-                document_id=self.id,
-                owner_id=self.owner.id,
-                group_ids=[g.id for g in self.groups.all()],
-                permission_ids=[p.user.id for p in self.documentpermission_set.all()]
+                passages=passages,
+                content_hash=self.content_hash,
+                **access
             )
             
             print("Added to vector store successfully")
@@ -163,10 +231,20 @@ class PDFDocument(models.Model):
             print("=== INDEXING PROCESS COMPLETED ===\n")
 
     def user_has_access(self, user):
-        """Check if user has access to this document"""
-        return (self.owner == user or 
-                user in [group.user for group in self.groups.all()] or
-                self.permissions.filter(user=user).exists())
+        """Check if user has access to this document (the same rule search filtering applies)"""
+        return (user.is_superuser or
+                self.owner_id == user.pk or
+                self.groups.filter(user=user).exists() or
+                self.documentpermission_set.filter(user=user, can_view=True).exists())
+
+    def sync_access(self):
+        """Write who may view this document to the access lists next to the search index"""
+        from .acl import DocumentAccess, document_principals
+        from .snapshots import SnapshotDirectory
+
+        if self.file:
+            DocumentAccess(SnapshotDirectory().access_path).set_document(os.path.basename(self.file.name),
+                                                                         document_principals(self))
 
     def get_user_permissions(self, user):
         """Get specific permissions for a user"""
@@ -176,32 +254,193 @@ class PDFDocument(models.Model):
             return None
 
     def delete(self, *args, **kwargs):
-        """Override delete to remove from vector store"""
+        """Override delete to queue removal from the vector store"""
+        name = self.file.name if self.file else None
+        super().delete(*args, **kwargs)
+        if not name:
+            return
+        # After the cascade, whose permission signals would otherwise re-create the list
+        self._queue_file_removal(name)
+
+    def _queue_file_removal(self, name):
+        """Drop a file name this document no longer has from the access lists and the index"""
+        from .acl import DocumentAccess
+        from .snapshots import SnapshotDirectory
+        DocumentAccess(SnapshotDirectory().access_path).remove_document(os.path.basename(name))
         try:
-            # Remove from vector store
-            vector_store = VectorStore(dimension=384)
-            vector_store.load()
-            vector_store.remove_document(str(self.file))
-            vector_store.save()
-            logger.info(f"Removed document from vector store: {self.title}")
+            # Loading the index here would cost O(corpus); the index worker's store removes it
+            IndexingJob.enqueue_removal(name)
+            logger.info(f"Queued removal from vector store: {self.title}")
         except Exception as e:
-            logger.error(f"Error removing document from vector store: {str(e)}")
-        
-        super().delete(*args, **kwargs)
+            logger.error(f"Error queueing removal of {self.title} from vector store: {str(e)}")
+
+class IndexingJob(models.Model):
+    """A queued request to (re)index a document (at most one per document), or to
+    remove a deleted document's file from the index"""
+    INDEX = 'index'
+    REMOVE = 'remove'
+    ACTION_CHOICES = [
+        (INDEX, 'Index'),
+        (REMOVE, 'Remove'),
+    ]
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    document = models.OneToOneField(PDFDocument, on_delete=models.CASCADE, related_name='indexing_job',
+                                    null=True, blank=True)
+    action = models.CharField(max_length=8, choices=ACTION_CHOICES, default=INDEX)
+    # File name to remove; removal jobs outlive their document
+    path = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now, db_index=True)
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+
+    def __str__(self):
+        return f"{self.target} ({self.status})"
+
+    @property
+    def target(self) -> str:
+        if self.action == self.REMOVE:
+            return f"remove {self.path}"
+        return self.document.title if self.document else self.path
+
+    @classmethod
+    def enqueue(cls, document):
+        """Queue a document, resetting any existing job for it (re-uploads supersede running jobs)"""
+        job, _ = cls.objects.update_or_create(
+            document=document,
+            defaults={'status': cls.PENDING, 'attempts': 0, 'last_error': '',
+                      'run_after': timezone.now(), 'locked_by': '', 'locked_at': None},
+        )
+        return job
+
+    @classmethod
+    def enqueue_removal(cls, path: str):
+        """Queue removal of a deleted document's file name from the index"""
+        return cls.objects.create(action=cls.REMOVE, path=path)
 
-# MODIFIED: Fixed signal handler
+    def requeue(self):
+        """Run this job again from scratch"""
+        if self.action == self.REMOVE:
+            self.__class__.objects.filter(pk=self.pk).update(
+                status=self.PENDING, attempts=0, last_error='', run_after=timezone.now(),
+                locked_by='', locked_at=None)
+        else:
+            self.__class__.enqueue(self.document)
+
+    @classmethod
+    def catch_up(cls, vector_store, started):
+        """Bring a just-published rebuild up to date with changes made while it was built.
+
+        Documents deleted since are removed from vector_store (their removal jobs
+        ran against the old snapshot), and documents created or changed since
+        started are queued again. Returns (removed, requeued) counts.
+        """
+        live = {os.path.basename(name) for name in PDFDocument.objects.exclude(file='').values_list('file', flat=True)}
+        removed = 0
+        for path in [path for path in vector_store.id_to_path.values() if path not in live]:
+            vector_store.remove_document(path)
+            removed += 1
+        if removed:
+            vector_store.save()
+        requeued = 0
+        for document in PDFDocument.objects.filter(updated_at__gte=started):
+            cls.enqueue(document)
+            requeued += 1
+        return removed, requeued
+
+    @classmethod
+    def claim(cls, worker: str, limit: int):
+        """Claim up to limit runnable jobs for worker.
+
+        Each claim is a conditional UPDATE, so concurrent workers never take the
+        same job. Jobs left running past RAG_INDEX_JOB_TIMEOUT are reclaimed.
+        """
+        now = timezone.now()
+        stale = now - timedelta(seconds=getattr(settings, 'RAG_INDEX_JOB_TIMEOUT', 30 * 60))
+        runnable = (models.Q(status=cls.PENDING, run_after__lte=now) |
+                    models.Q(status=cls.RUNNING, locked_at__lt=stale))
+        claimed = []
+        for job in cls.objects.filter(runnable).order_by('run_after', 'id')[:limit * 2]:
+            updated = cls.objects.filter(pk=job.pk, status=job.status, locked_by=job.locked_by).update(
+                status=cls.RUNNING, locked_by=worker, locked_at=now, attempts=models.F('attempts') + 1)
+            if updated:
+                claimed.append(job.pk)
+            if len(claimed) == limit:
+                break
+        return list(cls.objects.filter(pk__in=claimed).select_related('document'))
+
+    def mark_done(self):
+        # A job re-queued while it ran stays pending so the new file gets indexed
+        self.__class__.objects.filter(pk=self.pk, status=self.RUNNING, locked_by=self.locked_by).update(
+            status=self.DONE, last_error='', locked_by='', locked_at=None)
+
+    def mark_failed(self, error: Exception):
+        """Schedule a retry with exponential backoff, or give up after RAG_INDEX_JOB_MAX_ATTEMPTS"""
+        max_attempts = getattr(settings, 'RAG_INDEX_JOB_MAX_ATTEMPTS', 3)
+        delay = getattr(settings, 'RAG_INDEX_JOB_RETRY_SECONDS', 30) * 2 ** (self.attempts - 1)
+        status = self.FAILED if self.attempts >= max_attempts else self.PENDING
+        self.__class__.objects.filter(pk=self.pk, status=self.RUNNING, locked_by=self.locked_by).update(
+            status=status, last_error=str(error)[:2000], locked_by='', locked_at=None,
+            run_after=timezone.now() + timedelta(seconds=delay))
+
+
+# Keep search access lists in step with owners, groups and view permissions
 @receiver(post_save, sender=PDFDocument)
-def index_document(sender, instance, created, **kwargs):
-    """Signal handler to ensure document is indexed after save"""
-    # NEW DEBUG
-    print(f"Signal handler triggered - created: {created}, is_indexed: {instance.is_indexed}")
-    
-    if created and not instance.is_indexed:
+def sync_access_on_save(sender, instance, created, update_fields=None, **kwargs):
+    if not created and update_fields is not None and not {'owner', 'file'} & set(update_fields):
+        return
+    try:
+        instance.sync_access()
+    except Exception as e:
+        logger.error(f"Error updating access list for {instance.title}: {str(e)}")
+
+
+@receiver(m2m_changed, sender=PDFDocument.groups.through)
+def sync_access_on_groups_change(sender, instance, action, reverse, pk_set=None, **kwargs):
+    if reverse and action == 'pre_clear':
+        # group.accessible_documents.clear() reports no pk_set afterwards
+        instance._cleared_document_ids = list(instance.accessible_documents.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        documents = [instance]
+    else:
+        pk_set = pk_set or getattr(instance, '_cleared_document_ids', None)
+        if not pk_set:
+            return
+        documents = PDFDocument.objects.filter(pk__in=pk_set)
+    for document in documents:
         try:
-            # NEW DEBUG
-            print(f"Attempting to index document {instance.title} from signal handler")
-            instance.process_and_index()
+            document.sync_access()
         except Exception as e:
-            # NEW DEBUG
-            print(f"Error in signal handler: {str(e)}")
-            logger.error(f"Error in post-save indexing: {str(e)}")
\ No newline at end of file
+            logger.error(f"Error updating access list for {document.title}: {str(e)}")
+
+
+@receiver(post_save, sender=DocumentPermission)
+@receiver(post_delete, sender=DocumentPermission)
+def sync_access_on_permission_change(sender, instance, **kwargs):
+    try:
+        document = PDFDocument.objects.filter(pk=instance.document_id).first()
+        if document is not None:
+            document.sync_access()
+    except Exception as e:
+        logger.error(f"Error updating access list for document {instance.document_id}: {str(e)}")
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import shutil
+import inspect
+import logging
+from typing import Dict, List
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ONNX_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'modelrag', 'onnx')
+FP32_FILE = 'model.onnx'
+INT8_FILE = 'model.int8.onnx'
+CONFIG_FILE = 'encoder.json'
+
+
+def onnx_model_dir(name: str) -> str:
+    """Where the ONNX export of a SentenceTransformer model lives"""
+    root = getattr(settings, 'RAG_ONNX_PATH', DEFAULT_ONNX_ROOT)
+    return os.path.join(root, name.strip('/').replace('/', '__'))
+
+
+def _pooling_mode(pooling) -> str:
+    # sentence-transformers 2.x: get_pooling_mode_str(); newer releases: a pooling_mode string
+    mode = getattr(pooling, 'pooling_mode', None)
+    if not isinstance(mode, str):
+        mode = pooling.get_pooling_mode_str()
+    if mode not in ('mean', 'cls', 'max'):
+        raise ValueError(f"Unsupported pooling for ONNX export: {mode}")
+    return mode
+
+
+def export_onnx(name: str, target_dir: str = None, quantize: bool = True) -> str:
+    """Export a SentenceTransformer's transformer to ONNX next to its tokenizer and pooling config.
+
+    Pooling and normalization run in numpy at encode time. With quantize, a copy
+    with dynamically int8-quantized weights is written as well. The export is
+    built in a temporary directory and renamed into place, so concurrent exports
+    never leave a partial one behind. Returns the export directory.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    target_dir = target_dir or onnx_model_dir(name)
+    model = SentenceTransformer(name, device='cpu')
+    transformer = pooling = None
+    normalize = False
+    for module in model:
+        kind = type(module).__name__
+        if hasattr(module, 'auto_model'):
+            transformer = module
+        elif kind == 'Pooling':
+            pooling = module
+        elif kind == 'Normalize':
+            normalize = True
+        else:
+            raise ValueError(f"Cannot export {name}: unsupported module {kind}")
+    if transformer is None or pooling is None:
+        raise ValueError(f"Cannot export {name}: expected a transformer followed by pooling")
+
+    tokenizer = transformer.tokenizer
+    input_names = [input_name for input_name in tokenizer.model_input_names
+                   if input_name in ('input_ids', 'attention_mask', 'token_type_ids')]
+
+    class TokenEmbeddings(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs)))[0]
+
+    tmp_dir = f"{target_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        sample = tokenizer(['an example sentence'], return_tensors='pt')
+        export_kwargs = {}
+        if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+            # Newer torch defaults to the dynamo exporter; the TorchScript one handles dynamic axes here
+            export_kwargs['dynamo'] = False
+        axes = {0: 'batch', 1: 'sequence'}
+        transformer.auto_model.eval()
+        with torch.no_grad():
+            torch.onnx.export(TokenEmbeddings(transformer.auto_model),
+                              tuple(sample[input_name] for input_name in input_names),
+                              os.path.join(tmp_dir, FP32_FILE),
+                              input_names=input_names, output_names=['token_embeddings'],
+                              dynamic_axes={**{input_name: axes for input_name in input_names},
+                                            'token_embeddings': axes},
+                              opset_version=14, **export_kwargs)
+        if quantize:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(os.path.join(tmp_dir, FP32_FILE), os.path.join(tmp_dir, INT8_FILE),
+                             weight_type=QuantType.QInt8)
+        tokenizer.save_pretrained(tmp_dir)
+        with open(os.path.join(tmp_dir, CONFIG_FILE), 'w') as f:
+            json.dump({
+                'source': name,
+                'inputs': input_names,
+                'pooling': _pooling_mode(pooling),
+                'normalize': normalize,
+                'dimension': model.get_sentence_embedding_dimension(),
+                'max_seq_length': model.max_seq_length,
+                'quantized': quantize,
+                'exported_at': time.time(),
+            }, f, indent=2)
+
+        # Move the old export aside rather than deleting it where a loading process may be reading it
+        old_dir = f"{target_dir}.{os.getpid()}.old"
+        if os.path.exists(target_dir):
+            os.replace(target_dir, old_dir)
+        os.makedirs(os.path.dirname(target_dir), exist_ok=True)
+        os.replace(tmp_dir, target_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    logger.info(f"Exported {name} to {target_dir}")
+    return target_dir
+
+
+class OnnxSentenceModel:
+    """Runs an export from export_onnx() with ONNX Runtime behind SentenceTransformer's encode()"""
+
+    def __init__(self, model_dir: str, quantized: bool = False, threads: int = 0):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        model_file = INT8_FILE if quantized else FP32_FILE
+        if not os.path.exists(os.path.join(model_dir, model_file)):
+            raise FileNotFoundError(f"No {model_file} in {model_dir}; run manage.py export_encoder")
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = self.config['max_seq_length']
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, model_file), options,
+                                                    providers=['CPUExecutionProvider'])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config['dimension']
+
+    def _pool(self, token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        mode = self.config['pooling']
+        if mode == 'cls':
+            return token_embeddings[:, 0]
+        mask = attention_mask[:, :, None].astype(token_embeddings.dtype)
+        if mode == 'max':
+            return np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+        return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        """Embeddings as SentenceTransformer.encode returns them (numpy only; progress options are ignored)"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embeddings = np.zeros((len(texts), self.get_sentence_embedding_dimension()), dtype='float32')
+        # Longest first, as SentenceTransformer does, so each batch pads to similar lengths
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            features = self.tokenizer([texts[i] for i in batch], padding=True, truncation=True,
+                                      max_length=self.max_seq_length, return_tensors='np')
+            inputs = {name: features[name].astype(np.int64) for name in self.config['inputs']}
+            token_embeddings = self.session.run(None, inputs)[0]
+            embeddings[batch] = self._pool(token_embeddings, features['attention_mask'])
+        if self.config['normalize'] or normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+
+def load_onnx_model(name: str, quantized: bool = False, threads: int = 0) -> OnnxSentenceModel:
+    """The ONNX export of name, made beforehand by `manage.py export_encoder`.
+
+    Never exports here: that would run in whichever request first loads the
+    encoder, and concurrent processes would race to replace the directory.
+    """
+    model_dir = onnx_model_dir(name)
+    if not os.path.exists(os.path.join(model_dir, CONFIG_FILE)):
+        raise FileNotFoundError(f"No ONNX export of {name} in {model_dir}; run manage.py export_encoder "
+                                f"before setting RAG_ENCODER_BACKEND to onnx or onnx-int8")
+    return OnnxSentenceModel(model_dir, quantized=quantized, threads=threads)
+
+
+def parity_report(reference, candidate, texts: List[str], k: int = 10) -> Dict:
+    """How closely candidate's embeddings of texts match reference's (e.g. ONNX against torch).
+
+    Reports per-text cosine similarity and the overlap of each text's k nearest
+    neighbours among the others, which is what search quality depends on.
+    """
+    expected = np.asarray(reference.encode(texts, batch_size=32, convert_to_numpy=True), dtype='float32')
+    actual = np.asarray(candidate.encode(texts, batch_size=32, convert_to_numpy=True), dtype='float32')
+    expected /= np.clip(np.linalg.norm(expected, axis=1, keepdims=True), 1e-12, None)
+    actual /= np.clip(np.linalg.norm(actual, axis=1, keepdims=True), 1e-12, None)
+    cosine = (expected * actual).sum(axis=1)
+
+    k = min(k, len(texts) - 1)
+    overlap = 1.0
+    if k > 0:
+        def neighbours(embeddings):
+            scores = embeddings @ embeddings.T
+            np.fill_diagonal(scores, -np.inf)
+            return np.argsort(-scores, axis=1)[:, :k]
+        expected_nn, actual_nn = neighbours(expected), neighbours(actual)
+        overlap = float(np.mean([len(set(e) & set(a)) / k for e, a in zip(expected_nn, actual_nn)]))
+    return {
+        'texts': len(texts),
+        'min_cosine': float(cosine.min()),
+        'mean_cosine': float(cosine.mean()),
+        'max_abs_diff': float(np.abs(expected - actual).max()),
+        'k': k,
+        'neighbour_overlap': overlap,
+    }
+
+
+__all__ = ['OnnxSentenceModel', 'export_onnx', 'load_onnx_model', 'onnx_model_dir', 'parity_report']
@@ -0,0 +1,95 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SentenceStore:
+    """Sentence offsets and their float16 embeddings, one pair of .npy files per content hash.
+
+    Computed once at ingest so previews are picked with a single dot product
+    against the query vector instead of encoding sentences at query time.
+    """
+
+    def __init__(self, root: str, max_open: int = 256):
+        self.root = root
+        self.max_open = max_open
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _paths(self, content_hash: str) -> Tuple[str, str]:
+        base = os.path.join(self.root, content_hash[:2], content_hash)
+        return f"{base}.spans.npy", f"{base}.emb.npy"
+
+    def __contains__(self, content_hash: str) -> bool:
+        return bool(content_hash) and os.path.exists(self._paths(content_hash)[1])
+
+    def put(self, content_hash: str, spans, embeddings):
+        """Persist (n, 2) character spans and (n, dim) embeddings for a content hash"""
+        spans = np.asarray(spans, dtype=np.int32).reshape(-1, 2)
+        embeddings = np.asarray(embeddings, dtype=np.float16)
+        if embeddings.ndim != 2 or embeddings.shape[0] != spans.shape[0]:
+            raise ValueError(f"Got {embeddings.shape} embeddings for {spans.shape[0]} sentences")
+
+        spans_path, emb_path = self._paths(content_hash)
+        os.makedirs(os.path.dirname(spans_path), exist_ok=True)
+        # Embeddings are written last; their presence marks the entry as complete
+        for path, array in ((spans_path, spans), (emb_path, embeddings)):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            self._open.pop(content_hash, None)
+
+    def get(self, content_hash: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Return memory-mapped (spans, embeddings), or None if never computed"""
+        if not content_hash:
+            return None
+        with self._lock:
+            entry = self._open.get(content_hash)
+            if entry is not None:
+                self._open.move_to_end(content_hash)
+                return entry
+
+        spans_path, emb_path = self._paths(content_hash)
+        if not os.path.exists(emb_path):
+            return None
+        try:
+            entry = (self._load(spans_path), self._load(emb_path))
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading sentence embeddings {content_hash}: {str(e)}")
+            return None
+
+        with self._lock:
+            self._open[content_hash] = entry
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return entry
+
+    def delete(self, content_hash: str):
+        with self._lock:
+            self._open.pop(content_hash, None)
+        for path in self._paths(content_hash):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _load(path: str) -> np.ndarray:
+        try:
+            return np.load(path, mmap_mode='r')
+        except ValueError:
+            # Empty arrays cannot be memory-mapped
+            return np.load(path)
+
+
+__all__ = ['SentenceStore']
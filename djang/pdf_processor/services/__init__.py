@@ -1,4 +1 @@
-
-from .search_service import SearchService
-
-search_service = SearchService()
\ No newline at end of file
+from .search_service import SearchService, get_search_service
@@ -0,0 +1,86 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBatcher:
+    """Coalesces concurrent searches into one batched encode and one multi-query index search.
+
+    The first request of a batch waits at most max_wait_ms for others to join;
+    requests that queued while the previous batch ran join without waiting, and
+    a batch closes early once it holds max_batch requests. search_batch takes
+    a list of (query, principals, k, threshold) and returns one result list each.
+    """
+
+    def __init__(self, search_batch: Callable[[List[tuple]], List[list]], max_batch: int = 32,
+                 max_wait_ms: float = 5.0):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.queries = 0
+        self._search_batch = search_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='rag-query-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, query: str, principals, k: int, threshold: float) -> Future:
+        """Queue a search; the future resolves to its formatted results"""
+        future = Future()
+        self._queue.put(((query, principals, k, threshold), future))
+        return future
+
+    def search(self, query: str, principals, k: int, threshold: float) -> list:
+        if threading.current_thread() is self._thread:
+            return self._search_batch([(query, principals, k, threshold)])[0]
+        return self.submit(query, principals, k, threshold).result()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        # Callers that gave up (cancelled async requests) are dropped
+        return [(request, future) for request, future in batch if future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                results = self._search_batch([request for request, _ in batch])
+            except Exception as e:
+                logger.error(f"Error in batched search of {len(batch)} queries: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.queries += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'queries': self.queries,
+            'mean_batch_size': self.queries / self.batches if self.batches else 0.0,
+        }
+
+
+__all__ = ['QueryBatcher']
@@ -0,0 +1,50 @@
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+_executor = None
+_executor_lock = threading.Lock()
+# One semaphore per event loop; asyncio primitives can't be shared between loops
+_in_flight = weakref.WeakKeyDictionary()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """The process-wide pool that runs encoding and FAISS searches for async views"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'RAG_SEARCH_THREADS', 4),
+                                               thread_name_prefix='rag-search')
+    return _executor
+
+
+def _slots(loop) -> asyncio.Semaphore:
+    slots = _in_flight.get(loop)
+    if slots is None:
+        slots = _in_flight[loop] = asyncio.Semaphore(getattr(settings, 'RAG_SEARCH_MAX_IN_FLIGHT', 256))
+    return slots
+
+
+async def offload(fn, *args, **kwargs):
+    """Run CPU-bound work on the search pool without blocking the event loop.
+
+    At most RAG_SEARCH_MAX_IN_FLIGHT calls per loop are queued or running; further
+    callers wait here, holding nothing but their connection.
+    """
+    loop = asyncio.get_running_loop()
+    async with _slots(loop):
+        return await loop.run_in_executor(get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+async def await_future(submit, *args, **kwargs):
+    """Await a concurrent.futures.Future from submit(*args) (e.g. the query batcher) under the same limit"""
+    async with _slots(asyncio.get_running_loop()):
+        return await asyncio.wrap_future(submit(*args, **kwargs))
+
+
+__all__ = ['get_executor', 'offload', 'await_future']
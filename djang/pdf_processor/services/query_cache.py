@@ -0,0 +1,79 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+
+def normalize_query(query: str, casefold: bool = True) -> str:
+    """Cache key for a query: surrounding and repeated whitespace removed, optionally case-folded"""
+    query = ' '.join(query.split())
+    return query.casefold() if casefold else query
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU of normalized query text -> L2-normalized float32 embedding.
+
+    Entries older than ``ttl`` seconds are treated as misses (ttl 0 keeps them
+    until evicted). Vectors are stored read-only and handed out as copies, so
+    callers may normalize or reshape them in place.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key -> (stored_at, vector)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1].copy()
+
+    def put(self, key: str, vector: np.ndarray) -> np.ndarray:
+        """Store the normalized vector and return a copy of it"""
+        vector = np.array(vector, dtype='float32').reshape(-1)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        if self.max_size <= 0:
+            return vector
+        vector.setflags(write=False)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return vector.copy()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+__all__ = ['QueryEmbeddingCache', 'normalize_query']
@@ -0,0 +1,62 @@
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class SearchResultCache:
+    """Formatted search results in Django's cache framework.
+
+    Keys combine the normalized query, k, threshold, the caller's access scope
+    and the vector store's index version. Any add, remove or rebuild bumps the
+    version, so entries from before a change are never read again; they simply
+    age out of the backend.
+    """
+
+    def __init__(self, alias: str = 'default', timeout: int = 300, prefix: str = 'rag:search'):
+        self.alias = alias
+        self.timeout = timeout
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def key(self, query: str, k: int, threshold: float, scope: str, version: str) -> str:
+        # Hashed: memcached-style backends reject long keys and spaces
+        digest = hashlib.sha1(repr((query, k, threshold, scope, version)).encode('utf-8')).hexdigest()
+        return f"{self.prefix}:{digest}"
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        try:
+            results = self.cache.get(key)
+        except Exception as e:
+            logger.warning(f"Search result cache unavailable: {str(e)}")
+            results = None
+        if results is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return results
+
+    def set(self, key: str, results: List[Dict]):
+        try:
+            self.cache.set(key, results, self.timeout)
+        except Exception as e:
+            logger.warning(f"Could not cache search results: {str(e)}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+__all__ = ['SearchResultCache']
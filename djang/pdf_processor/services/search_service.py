@@ -1,8 +1,21 @@
 import os
+import time
+import hashlib
 import logging
+import threading
 from typing import List, Dict
-from sentence_transformers import SentenceTransformer
+
+import numpy as np
+from django.conf import settings
+
 from ..vector_store import VectorStore
+from ..encoders import get_encoder
+from ..chunking import Passage
+from ..acl import user_principals, principals_for
+from .query_cache import QueryEmbeddingCache, normalize_query
+from .result_cache import SearchResultCache
+from .batcher import QueryBatcher
+from .offload import offload, await_future
 
 logger = logging.getLogger(__name__)
 
@@ -12,79 +25,299 @@ class SearchService:
    
     instance = None
     _initialized = False
-    def __new__(cls):
+    # Held while the singleton is created and initialized; checked again under it
+    _instance_lock = threading.Lock()
+    def __new__(cls, writable: bool = False):
         if cls.instance is None:
-            cls.instance = super(SearchService, cls).__new__(cls)
+            with cls._instance_lock:
+                if cls.instance is None:
+                    cls.instance = super(SearchService, cls).__new__(cls)
         return cls.instance
    
    
-    def __init__(self):
-        if not self._initialized:
-            self.model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
-            self.model.max_seq_length = 256
-            
-            self.vector_store = VectorStore(dimension=384)
-            try:
-                self.vector_store.load()
-                logger.info("Loaded existing vector store")
-            except Exception as e:
-                logger.warning(f"Could not load vector store: {str(e)}")
-                logger.info("Creating new vector store")
-            
-            SearchService._initialized = True
+    def __init__(self, writable: bool = False):
+        if self._initialized:
+            return
+        with SearchService._instance_lock:
+            # Concurrent first calls wait here instead of each loading the index
+            if not self._initialized:
+                self._setup(writable)
+                SearchService._initialized = True
+
+    def _setup(self, writable: bool):
+        # With RAG_INDEX_MMAP, processes that only search share one mapped copy of faiss.index
+        self.read_only = getattr(settings, 'RAG_INDEX_MMAP', False) and not writable
+        self.reload_interval = getattr(settings, 'RAG_INDEX_RELOAD_INTERVAL', 2)
+        self._next_reload_check = 0.0
+        self._reload_lock = threading.Lock()
+        self.vector_store = self._open_store()
+
+        self.query_cache = QueryEmbeddingCache(
+            max_size=getattr(settings, 'RAG_QUERY_CACHE_SIZE', 1024),
+            ttl=getattr(settings, 'RAG_QUERY_CACHE_TTL', 3600))
+        self.result_cache = SearchResultCache(
+            alias=getattr(settings, 'RAG_RESULT_CACHE', 'default'),
+            timeout=getattr(settings, 'RAG_RESULT_CACHE_TIMEOUT', 300))
+        # Concurrent searches are coalesced unless RAG_SEARCH_BATCH_WAIT_MS is 0
+        self.batcher = None
+        if getattr(settings, 'RAG_SEARCH_BATCH_WAIT_MS', 5):
+            self.batcher = QueryBatcher(self.search_batch,
+                                        max_batch=getattr(settings, 'RAG_SEARCH_BATCH_SIZE', 32),
+                                        max_wait_ms=getattr(settings, 'RAG_SEARCH_BATCH_WAIT_MS', 5))
+
+    def _open_store(self) -> VectorStore:
+        vector_store = VectorStore(dimension=384, read_only=self.read_only)
+        try:
+            vector_store.load()
+            logger.info(f"Loaded existing vector store{' (read-only)' if self.read_only else ''}")
+        except Exception as e:
+            logger.warning(f"Could not load vector store: {str(e)}")
+            logger.info("Creating new vector store")
+        return vector_store
+
+    def current_store(self) -> VectorStore:
+        """The vector store to search or add to.
+
+        Once a rebuild publishes a new snapshot, the next call opens it. A read-only
+        store is also replaced by a freshly loaded one once a writer has checkpointed,
+        logged vectors or changed documents (checked at most every
+        RAG_INDEX_RELOAD_INTERVAL seconds). Searches already running finish on the
+        store they started with; only one thread reloads at a time.
+        """
+        superseded = self.vector_store.is_superseded()
+        if not superseded and (not self.read_only or time.monotonic() < self._next_reload_check):
+            return self.vector_store
+        if not self._reload_lock.acquire(blocking=False):
+            return self.vector_store
+        try:
+            self._next_reload_check = time.monotonic() + self.reload_interval
+            if superseded or self.vector_store.is_stale():
+                logger.info("Index changed on disk; reopening vector store")
+                self.vector_store = self._open_store()
+        except Exception as e:
+            logger.error(f"Could not reopen vector store: {str(e)}")
+        finally:
+            self._reload_lock.release()
+        return self.vector_store
+
+    @property
+    def model(self):
+        return get_encoder()
+
+    @staticmethod
+    def _normalize(query: str) -> str:
+        return normalize_query(query, getattr(settings, 'RAG_QUERY_CACHE_CASEFOLD', True))
+
+    def _access_scope(self, principals, vector_store: VectorStore) -> str:
+        """Identifies the documents the principals may see, for result cache keys.
+
+        Users with the same principals share entries; any ACL change moves the acl version.
+        """
+        if principals is None:
+            return 'all'
+        digest = hashlib.sha1('\0'.join(sorted(principals)).encode('utf-8')).hexdigest()
+        return f"{digest}@{vector_store.acl.refresh()}"
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Normalized query embedding; repeated queries are served from the query cache"""
+        return self.embed_queries([query])[0]
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Normalized embeddings, one row per query; cache misses are encoded in one batch"""
+        model = self.model
+        keys = [self._normalize(query) for query in queries]
+        cache_keys = [f"{model.name}\0{key}" for key in keys]
+        embeddings = [self.query_cache.get(cache_key) for cache_key in cache_keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            encoded = model.encode([keys[i] for i in missing], batch_size=len(missing), convert_to_numpy=True)
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = self.query_cache.put(cache_keys[i], embedding)
+        return np.vstack(embeddings)
 
     def add_to_index(self, title: str, embeddings, text: str, document_id: int, 
-                    owner_id: int, group_ids: List[int], permission_ids: List[int]):
-        """Add document to search index"""
+                    owner_id: int, group_ids: List[int], permission_ids: List[int],
+                    passages: List[Passage] = None, content_hash: str = None):
+        """Add document to search index, one vector per passage when passages are given.
+
+        owner_id, group_ids and permission_ids (users with view permission) become
+        the document's access list. A known content_hash spares hashing the file again.
+        """
         try:
-            self.vector_store.add_documents([title], embeddings)
+            vector_store = self.current_store()
+            vector_store.acl.set_document(os.path.basename(title),
+                                          principals_for(owner_id, group_ids, permission_ids))
+            if passages is not None:
+                vector_store.add_passages(title, passages, embeddings, text=text, content_hash=content_hash)
+            else:
+                vector_store.add_documents([title], embeddings, texts=[text])
             logger.info(f"Added document to index: {title}")
         except Exception as e:
             logger.error(f"Error adding document to index: {str(e)}")
             raise
 
-    def search(self, query: str, user=None, k: int = 5) -> List[Dict]:
-        """Search documents"""
+    def add_duplicate_to_index(self, title: str, content_hash: str, document_id: int,
+                               owner_id: int, group_ids: List[int], permission_ids: List[int]):
+        """Index a document by copying an indexed document with the same content hash.
+
+        Returns (passages, embeddings, text) like VectorStore.add_duplicate, or None
+        when the content has not been indexed yet and must be encoded.
+        """
         try:
-            logger.info(f"Processing search query: {query}")
-            
-            # Generate query embedding
-            query_embedding = self.model.encode(query)
-            
-            # Search using vector store
-            results = self.vector_store.search(
-                query_vector=query_embedding,
-                query_text=query,
-                k=k,
-                threshold=0.3
-            )
-            
-            logger.info(f"Found {len(results)} results for query: {query}")
-            
-            # Format results
-            formatted_results = []
-            for path, score, preview in results:
-                formatted_results.append({
-                    'path': path,
-                    'title': os.path.basename(path),
-                    'content': preview,
-                    'score': score
-                })
-            
-            return formatted_results
-            
+            vector_store = self.current_store()
+            vector_store.acl.set_document(os.path.basename(title),
+                                          principals_for(owner_id, group_ids, permission_ids))
+            copied = vector_store.add_duplicate(title, content_hash)
+            if copied is not None:
+                logger.info(f"Added document to index from identical content: {title}")
+            return copied
+        except Exception as e:
+            logger.error(f"Error adding document to index: {str(e)}")
+            raise
+
+    def remove_from_index(self, title: str):
+        """Remove a deleted document's file from the index (run by index_worker)"""
+        from ..models import PDFDocument
+
+        if PDFDocument.objects.filter(file=title).exists():
+            # Uploaded again under the same name; that document's own job replaces the entry
+            logger.info(f"Not removing {title}: a document uses it again")
+            return
+        vector_store = self.current_store()
+        vector_store.remove_document(title)
+        vector_store.save()
+        logger.info(f"Removed document from index: {title}")
+
+    def search(self, query: str, user=None, k: int = 5, threshold: float = 0.3) -> List[Dict]:
+        """Search the documents user may see (all documents for user=None or a superuser)"""
+        try:
+            principals = user_principals(user) if user is not None else None
+        except Exception as e:
+            logger.error(f"Error resolving search access for {user}: {str(e)}")
+            return []
+        return self.search_as(query, principals, k=k, threshold=threshold)
+
+    def search_as(self, query: str, principals, k: int = 5, threshold: float = 0.3) -> List[Dict]:
+        """Search the documents principals may see (see acl.user_principals; None for all).
+
+        Touches no Django models, so it can run on any thread. Goes through the
+        query batcher when one is configured.
+        """
+        try:
+            if self.batcher is not None:
+                return self.batcher.search(query, principals, k, threshold)
+            return self.search_batch([(query, principals, k, threshold)])[0]
         except Exception as e:
             logger.error(f"Error during search: {str(e)}")
             return []
+
+    async def search_as_async(self, query: str, principals, k: int = 5, threshold: float = 0.3) -> List[Dict]:
+        """search_as for async views; waits on the batcher (or the search pool) without holding a thread"""
+        if self.batcher is not None:
+            try:
+                return await await_future(self.batcher.submit, query, principals, k, threshold)
+            except Exception as e:
+                logger.error(f"Error during search: {str(e)}")
+                return []
+        return await offload(self.search_as, query, principals, k=k, threshold=threshold)
+
+    def search_batch(self, requests: List[tuple]) -> List[List[Dict]]:
+        """Run (query, principals, k, threshold) searches together; returns one result list each.
+
+        Identical searches against an unchanged index come from the result cache.
+        The remaining queries are encoded in one batch and searched with one
+        multi-vector index search per (principals, k, threshold) group.
+        """
+        try:
+            vector_store = self.current_store()
+            queries = [self._normalize(query) for query, _, _, _ in requests]
+            logger.info(f"Processing {len(queries)} search queries: {queries}")
+            results = [None] * len(requests)
+            # Cache key -> positions of the requests it answers; duplicates are searched once
+            pending = {}
+            for i, (query, (_, principals, k, threshold)) in enumerate(zip(queries, requests)):
+                # Versions restart in every snapshot, so the snapshot is part of the key
+                cache_key = self.result_cache.key(query, k, threshold, self._access_scope(principals, vector_store),
+                                                  f"{vector_store.snapshot}:{vector_store.index_version}")
+                cached = self.result_cache.get(cache_key)
+                if cached is not None:
+                    results[i] = cached
+                else:
+                    pending.setdefault(cache_key, []).append(i)
+            if not pending:
+                return results
+
+            firsts = [positions[0] for positions in pending.values()]
+            embeddings = self.embed_queries([queries[i] for i in firsts])
+            groups = {}
+            for row, i in enumerate(firsts):
+                _, principals, k, threshold = requests[i]
+                groups.setdefault((principals, k, threshold), []).append(row)
+
+            cache_keys = list(pending)
+            for (principals, k, threshold), rows in groups.items():
+                found = vector_store.search_batch(
+                    embeddings[rows], [queries[firsts[row]] for row in rows],
+                    k=k, threshold=threshold, principals=principals)
+                for row, raw_results in zip(rows, found):
+                    formatted_results = self._format_results(raw_results)
+                    self.result_cache.set(cache_keys[row], formatted_results)
+                    for i in pending[cache_keys[row]]:
+                        results[i] = formatted_results
+            logger.info(f"Searched {len(firsts)} queries in {len(groups)} index searches")
+            return results
+            
+        except Exception as e:
+            logger.error(f"Error during search: {str(e)}")
+            return [[] for _ in requests]
+
+    @staticmethod
+    def _format_results(results) -> List[Dict]:
+        formatted_results = []
+        for path, score, preview, passages in results:
+            formatted_results.append({
+                'path': path,
+                'title': os.path.basename(path),
+                'content': preview,
+                'score': score,
+                'passages': passages
+            })
+        return formatted_results
+
     def get_document_content(self, document_id: int, user=None) -> str:
         """Get document content"""
         try:
-            # Implementation for getting document content
-            pass
+            name = self.readable_document_file(document_id, user)
+            if name is None:
+                return None
+            # Served from the text store, never by re-parsing the PDF
+            return self.document_text(name) or self.stored_document_content(document_id)
         except Exception as e:
             logger.error(f"Error getting document content: {str(e)}")
             return None
 
+    def readable_document_file(self, document_id: int, user=None) -> str:
+        """File name of the document if it exists and user may read it, else None"""
+        from ..models import PDFDocument
+
+        try:
+            document = PDFDocument.objects.only('file', 'owner').get(pk=document_id)
+        except PDFDocument.DoesNotExist:
+            return None
+        if user is not None and not document.user_has_access(user):
+            return None
+        return document.file.name
+
+    def document_text(self, name: str) -> str:
+        """Text of an indexed document from the text store; touches no Django models"""
+        return self.current_store().get_document_text(name)
+
+    def stored_document_content(self, document_id: int) -> str:
+        """The copy of the text saved on the document, for documents not in the text store"""
+        from ..models import PDFDocument
+
+        return PDFDocument.objects.filter(pk=document_id).values_list('content', flat=True).first()
+
     def answer_question(self, document_id: int, question: str, user=None) -> Dict:
         """Answer a question about a document"""
         try:
@@ -93,3 +326,12 @@ class SearchService:
         except Exception as e:
             logger.error(f"Error answering question: {str(e)}")
             return None
+
+
+def get_search_service(writable: bool = False) -> SearchService:
+    """The process-wide SearchService, created (and its index loaded) on first call.
+
+    Processes that add to the index (index workers) pass writable=True on that
+    first call; otherwise RAG_INDEX_MMAP makes the service read-only.
+    """
+    return SearchService(writable)
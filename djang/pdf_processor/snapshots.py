@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent publishes are not serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'modelrag', 'output')
+
+# Where the store lived before snapshots: files directly under the root, and the database
+# at a path relative to the working directory
+LEGACY_FILES = ('faiss.index', 'faiss.index.json', 'faiss.index.log', 'vectors.f32', 'text', 'sentences')
+LEGACY_DB_PATH = 'djang/modelrag/output/vector_store.db'
+
+
+class SnapshotDirectory:
+    """Versioned copies of the vector store, one of them live.
+
+    Each snapshot (snapshots/<name>/) holds everything a VectorStore writes: the
+    FAISS index with its config and log, vectors.f32, the sqlite mappings and the
+    text and sentence stores. The CURRENT file names the live snapshot. Rebuilds
+    fill a new snapshot while searches keep using the live one, then publish it by
+    replacing CURRENT atomically. Access lists (access.db) belong to documents,
+    not to an index build, so they sit beside the snapshots and are shared.
+    """
+
+    POINTER = 'CURRENT'
+    MANIFEST = 'MANIFEST.json'
+
+    def __init__(self, root: str = None):
+        self.root = os.path.abspath(root or getattr(settings, 'RAG_MODEL_PATH', DEFAULT_ROOT))
+        self.snapshots_dir = os.path.join(self.root, 'snapshots')
+        self.access_path = os.path.join(self.root, 'access.db')
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.snapshots_dir, name)
+
+    @contextmanager
+    def _locked(self):
+        """Serialize publishing and the legacy migration across processes"""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, 'snapshots.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_pointer(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, self.POINTER)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def current(self) -> str:
+        """Name of the live snapshot; the first call moves a pre-snapshot store into one"""
+        name = self._read_pointer()
+        if name is None:
+            with self._locked():
+                name = self._read_pointer()
+                if name is None:
+                    name = self._adopt_legacy()
+        return name
+
+    def create(self) -> str:
+        """Make an empty, unpublished snapshot and return its name"""
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        os.makedirs(self.path(name))
+        return name
+
+    def publish(self, name: str, manifest: Dict = None):
+        """Make a snapshot live; stores opened from now on, and searchers on their next request, use it"""
+        if not os.path.isdir(self.path(name)):
+            raise FileNotFoundError(f"No snapshot {name} in {self.snapshots_dir}")
+        manifest = dict(manifest or {}, snapshot=name, published_at=time.time())
+        self._write_atomic(os.path.join(self.path(name), self.MANIFEST), json.dumps(manifest, indent=2))
+        with self._locked():
+            previous = self._read_pointer()
+            self._write_atomic(os.path.join(self.root, self.POINTER), name)
+        logger.info(f"Published index snapshot {name} (was {previous})")
+        self.collect_garbage()
+
+    def manifest(self, name: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.path(name), self.MANIFEST)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def collect_garbage(self, keep: int = None) -> List[str]:
+        """Delete snapshots nothing should still be reading; returns their names.
+
+        The live snapshot and the ones published just before it (RAG_INDEX_SNAPSHOTS_KEEP
+        in all) stay, so searchers that haven't switched yet keep working. Unpublished
+        snapshots are builds in progress unless untouched for RAG_INDEX_SNAPSHOT_ABANDON_SECONDS.
+        """
+        keep = keep if keep is not None else getattr(settings, 'RAG_INDEX_SNAPSHOTS_KEEP', 2)
+        abandon_after = getattr(settings, 'RAG_INDEX_SNAPSHOT_ABANDON_SECONDS', 24 * 60 * 60)
+        current = self._read_pointer()
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+
+        published, unpublished = [], []
+        for name in os.listdir(self.snapshots_dir):
+            if name == current or not os.path.isdir(self.path(name)):
+                continue
+            manifest = self.manifest(name)
+            if manifest is not None:
+                published.append((manifest.get('published_at', 0), name))
+            elif time.time() - os.path.getmtime(self.path(name)) > abandon_after:
+                unpublished.append(name)
+        published.sort(reverse=True)
+        removed = [name for _, name in published[max(keep - 1, 0):]] + unpublished
+        for name in removed:
+            shutil.rmtree(self.path(name), ignore_errors=True)
+            logger.info(f"Removed index snapshot {name}")
+        return removed
+
+    def _adopt_legacy(self) -> str:
+        """Move a store written before snapshots existed into the first snapshot and publish it"""
+        name = self.create()
+        target = self.path(name)
+        moved = False
+        for filename in LEGACY_FILES:
+            source = os.path.join(self.root, filename)
+            if os.path.exists(source):
+                os.replace(source, os.path.join(target, filename))
+                moved = True
+        db_paths = [os.path.join(self.root, 'vector_store.db')]
+        if moved:
+            # The old working-directory-relative database only belongs with an index in this root
+            db_paths.append(LEGACY_DB_PATH)
+        for db_path in db_paths:
+            if os.path.exists(db_path):
+                shutil.move(db_path, os.path.join(target, 'vector_store.db'))
+                self._import_access_lists(os.path.join(target, 'vector_store.db'))
+                break
+        self._write_atomic(os.path.join(target, self.MANIFEST),
+                           json.dumps({'snapshot': name, 'published_at': time.time(), 'migrated': True}, indent=2))
+        self._write_atomic(os.path.join(self.root, self.POINTER), name)
+        logger.info(f"Moved the index in {self.root} into snapshot {name}")
+        return name
+
+    def _import_access_lists(self, db_path: str):
+        """Copy access lists kept in the old mappings database to access.db"""
+        from .acl import DocumentAccess
+
+        access = DocumentAccess(self.access_path)
+        conn = sqlite3.connect(db_path)
+        try:
+            if conn.execute("SELECT name FROM sqlite_master WHERE name = 'doc_acl'").fetchone():
+                access.import_rows(conn.execute("SELECT path, principal FROM doc_acl").fetchall())
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _write_atomic(path: str, content: str):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+__all__ = ['SnapshotDirectory']
@@ -0,0 +1,36 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import SimpleTestCase
+
+from pdf_processor.services.batcher import QueryBatcher
+
+
+class QueryBatcherTests(SimpleTestCase):
+    def test_concurrent_searches_share_batches(self):
+        release = threading.Event()
+        batches = []
+
+        def search_batch(requests):
+            release.wait(5)
+            batches.append(len(requests))
+            return [[query.upper()] for query, _, _, _ in requests]
+
+        batcher = QueryBatcher(search_batch, max_batch=8, max_wait_ms=50)
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            futures = [pool.submit(batcher.search, f"q{i}", None, 5, 0.3) for i in range(6)]
+            release.set()
+            results = [future.result(5) for future in futures]
+
+        self.assertEqual(results, [[f"Q{i}"] for i in range(6)])
+        self.assertEqual(sum(batches), 6)
+        self.assertLess(len(batches), 6)
+
+    def test_errors_reach_every_caller_of_the_batch(self):
+        def search_batch(requests):
+            raise RuntimeError("index unavailable")
+
+        batcher = QueryBatcher(search_batch, max_wait_ms=1)
+        with self.assertLogs('pdf_processor.services.batcher', 'ERROR'):
+            with self.assertRaisesMessage(RuntimeError, "index unavailable"):
+                batcher.search("q", None, 5, 0.3)
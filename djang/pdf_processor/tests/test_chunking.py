@@ -0,0 +1,53 @@
+from django.test import SimpleTestCase
+
+from pdf_processor.chunking import (chunk_pages, iter_pages, iter_passages, page_offsets,
+                                    sentence_spans, whole_document_passage)
+
+
+def words(n, prefix='w'):
+    return ' '.join(f'{prefix}{i}' for i in range(n)) + ' '
+
+
+class ChunkingTests(SimpleTestCase):
+    def test_passages_are_bounded_and_overlap(self):
+        passages = chunk_pages([words(50)], max_tokens=20, overlap=5)
+        self.assertEqual([len(p.text.split()) for p in passages], [20, 20, 20])
+        for previous, passage in zip(passages, passages[1:]):
+            self.assertEqual(previous.text.split()[-5:], passage.text.split()[:5])
+        self.assertEqual(passages[-1].text.split()[-1], 'w49')
+
+    def test_offsets_index_the_joined_text(self):
+        pages = [words(30, 'a'), words(30, 'b'), words(5, 'c')]
+        text = ''.join(pages)
+        for passage in chunk_pages(pages, max_tokens=16, overlap=4):
+            self.assertEqual(text[passage.start:passage.end], passage.text)
+
+    def test_page_is_where_the_passage_starts(self):
+        pages = [words(10, 'a'), words(10, 'b'), words(10, 'c')]
+        passages = chunk_pages(pages, max_tokens=10, overlap=0)
+        self.assertEqual([p.page for p in passages], [1, 2, 3])
+        self.assertTrue(all(p.text.startswith(prefix) for p, prefix in zip(passages, 'abc')))
+
+    def test_streaming_matches_a_page_list(self):
+        pages = [words(37, 'a'), '', words(3, 'b'), words(64, 'c')]
+        streamed = list(iter_passages(iter(pages), max_tokens=12, overlap=3))
+        self.assertEqual(streamed, chunk_pages(pages, max_tokens=12, overlap=3))
+
+    def test_pages_round_trip_through_offsets(self):
+        pages = ['first page ', '', 'third ', 'last']
+        text = ''.join(pages)
+        self.assertEqual(page_offsets(pages), [0, 11, 11, 17])
+        self.assertEqual(list(iter_pages(text, page_offsets(pages))), pages)
+
+    def test_overlap_must_be_smaller_than_max_tokens(self):
+        with self.assertRaises(ValueError):
+            chunk_pages([words(10)], max_tokens=5, overlap=5)
+
+    def test_empty_documents_have_no_passages(self):
+        self.assertEqual(chunk_pages(['', '   ']), [])
+        self.assertEqual(whole_document_passage(['  ', '\n']), [])
+
+    def test_sentence_spans_skip_short_fragments(self):
+        text = "Ok. This sentence is long enough to keep. Tiny!  Another sentence that stays here."
+        self.assertEqual([text[s:e] for s, e in sentence_spans(text)],
+                         ['This sentence is long enough to keep.', 'Another sentence that stays here.'])
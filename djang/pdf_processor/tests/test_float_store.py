@@ -0,0 +1,34 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from pdf_processor.float_store import FloatStore
+
+
+class FloatStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.store = FloatStore(os.path.join(directory, 'vectors.f32'), 4)
+
+    def test_rows_read_back_and_missing_rows_are_zero(self):
+        vectors = np.arange(12, dtype='float32').reshape(3, 4)
+        self.store.write(0, vectors)
+        self.assertEqual(self.store.rows, 3)
+        np.testing.assert_array_equal(self.store.get([2, 0, 5]), np.vstack([vectors[2], vectors[0], np.zeros(4)]))
+
+    def test_writes_past_the_end_extend_the_file(self):
+        self.store.write(0, np.ones((1, 4)))
+        self.store.get([0])  # maps the one-row file
+        self.store.write(3, np.full((1, 4), 2.0))
+        self.assertEqual(self.store.rows, 4)
+        np.testing.assert_array_equal(self.store.get([3, 1])[:, 0], [2.0, 0.0])
+
+    def test_truncate(self):
+        self.store.write(0, np.ones((3, 4)))
+        self.store.truncate(1)
+        self.assertEqual(self.store.rows, 1)
+        self.assertEqual(self.store.get([0, 2]).sum(), 4.0)
@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from pdf_processor.management.commands.generate_faiss_index import Command
+from pdf_processor.text_store import file_fingerprint, file_sha256
+
+
+class DiffFilesTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        for name, content in (('same.pdf', b'same'), ('touched.pdf', b'touched'), ('edited.pdf', b'edited'),
+                              ('new.pdf', b'new')):
+            with open(os.path.join(self.dir, name), 'wb') as f:
+                f.write(content)
+
+    def known(self, name):
+        path = os.path.join(self.dir, name)
+        return (*file_fingerprint(path), file_sha256(path))
+
+    def test_only_new_and_edited_files_are_reindexed(self):
+        known = {name: self.known(name) for name in ('same.pdf', 'touched.pdf', 'edited.pdf')}
+        touched_path = os.path.join(self.dir, 'touched.pdf')
+        stat = os.stat(touched_path)
+        os.utime(touched_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        with open(os.path.join(self.dir, 'edited.pdf'), 'wb') as f:
+            f.write(b'edited again')
+
+        changed, touched, unchanged = Command().diff_files(
+            self.dir, ['same.pdf', 'touched.pdf', 'edited.pdf', 'new.pdf'], known)
+
+        self.assertEqual(sorted(changed), ['edited.pdf', 'new.pdf'])
+        self.assertEqual(touched, {'touched.pdf': file_fingerprint(touched_path)})
+        self.assertEqual(unchanged, 2)
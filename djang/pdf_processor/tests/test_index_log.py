@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from pdf_processor.index_log import IndexLog
+
+
+class IndexLogTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.path = os.path.join(self.dir, 'faiss.index.log')
+
+    def replayed(self, log):
+        return [(op, ids.tolist()) for op, ids in log.replay()]
+
+    def test_replays_entries_in_order(self):
+        log = IndexLog(self.path)
+        log.append(IndexLog.ADD, np.array([1, 2, 3]))
+        log.append(IndexLog.REMOVE, np.array([2]))
+        log.append(IndexLog.ADD, np.array([], dtype=np.int64))
+        self.assertEqual(log.entries, 4)
+
+        reopened = IndexLog(self.path)
+        self.assertEqual(self.replayed(reopened), [(IndexLog.ADD, [1, 2, 3]), (IndexLog.REMOVE, [2])])
+        self.assertEqual(reopened.entries, 4)
+
+    def test_ignores_a_partially_written_tail(self):
+        log = IndexLog(self.path)
+        log.append(IndexLog.ADD, np.array([7, 8]))
+        log.append(IndexLog.ADD, np.array([9, 10]))
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 3)
+
+        with self.assertLogs('pdf_processor.index_log', 'WARNING'):
+            self.assertEqual(self.replayed(IndexLog(self.path)), [(IndexLog.ADD, [7, 8])])
+
+    def test_appends_after_a_torn_tail_are_kept(self):
+        log = IndexLog(self.path)
+        log.append(IndexLog.ADD, np.array([1, 2]))
+        with open(self.path, 'ab') as f:
+            f.write(b'\x00\x01\x02')
+
+        reopened = IndexLog(self.path)
+        with self.assertLogs('pdf_processor.index_log', 'WARNING'):
+            self.assertEqual(self.replayed(reopened), [(IndexLog.ADD, [1, 2])])
+            reopened.append(IndexLog.ADD, np.array([3]))
+        self.assertEqual(self.replayed(IndexLog(self.path)), [(IndexLog.ADD, [1, 2]), (IndexLog.ADD, [3])])
+
+    def test_appends_check_for_a_tail_torn_by_another_process(self):
+        log = IndexLog(self.path)
+        log.append(IndexLog.ADD, np.array([1]))
+        other = IndexLog(self.path)
+        other.append(IndexLog.REMOVE, np.array([1]))
+        with open(self.path, 'ab') as f:
+            f.write(IndexLog.ADD + b'\x05')
+
+        with self.assertLogs('pdf_processor.index_log', 'WARNING'):
+            log.append(IndexLog.ADD, np.array([2]))
+        self.assertEqual(self.replayed(IndexLog(self.path)),
+                         [(IndexLog.ADD, [1]), (IndexLog.REMOVE, [1]), (IndexLog.ADD, [2])])
+
+    def test_truncate_empties_the_log(self):
+        log = IndexLog(self.path)
+        log.append(IndexLog.ADD, np.array([1]))
+        log.truncate()
+        self.assertEqual(log.entries, 0)
+        self.assertEqual(self.replayed(IndexLog(self.path)), [])
+
+    def test_missing_log_replays_nothing(self):
+        self.assertEqual(self.replayed(IndexLog(self.path)), [])
@@ -0,0 +1,56 @@
+import threading
+
+from django.test import SimpleTestCase
+
+from pdf_processor.keyword_index import KeywordIndex, term_counts, tokenize
+
+
+class KeywordIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = KeywordIndex()
+        self.index.add(1, term_counts("Invoice total due in thirty days"))
+        self.index.add(2, term_counts("The invoice invoice was paid"))
+        self.index.add(3, term_counts("Meeting notes about the budget"))
+
+    def test_tokenize_matches_whole_lowercased_words(self):
+        self.assertEqual(tokenize("Re-Invoice, INVOICES!"), ['re', 'invoice', 'invoices'])
+
+    def test_scores_matching_documents(self):
+        scores = self.index.score("invoice total", [1, 2, 3])
+        self.assertEqual({doc_id: matches for doc_id, (_, matches) in scores.items()}, {1: 2, 2: 1, 3: 0})
+        self.assertGreater(scores[1][0], scores[2][0])
+        self.assertEqual(scores[3][0], 0.0)
+        self.assertTrue(all(0.0 <= score < 1.0 for score, _ in scores.values()))
+
+    def test_documents_added_out_of_order_keep_postings_sorted(self):
+        self.index.add(0, term_counts("invoice"))
+        self.assertEqual(list(self.index.postings_docs[self.index.vocab['invoice']]), [0, 1, 2])
+        self.assertEqual(self.index.score("invoice", [0])[0][1], 1)
+
+    def test_remove_and_readd(self):
+        self.index.remove(2)
+        self.assertNotIn(2, self.index)
+        self.assertEqual(self.index.score("invoice", [1, 2])[2], (0.0, 0))
+
+        self.index.add(1, term_counts("budget only"))
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.score("invoice", [1])[1][1], 0)
+        self.assertEqual(self.index.total_length, sum(self.index.doc_lengths.values()))
+
+    def test_scoring_while_documents_are_added_and_removed(self):
+        errors = []
+
+        def churn():
+            try:
+                for _ in range(2000):
+                    self.index.add(4, term_counts("invoice " * 50))
+                    self.index.remove(4)
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=churn)
+        thread.start()
+        while thread.is_alive():
+            self.assertEqual(self.index.score("invoice", [1, 2])[1][1], 1)
+        thread.join()
+        self.assertEqual(errors, [])
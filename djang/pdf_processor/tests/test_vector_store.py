@@ -0,0 +1,141 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import numpy as np
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from pdf_processor.chunking import Passage
+from pdf_processor.ingest import EncodedDocument
+from pdf_processor.vector_store import VectorStore
+
+DIMENSION = 384
+
+
+def encoded(name, vectors):
+    passages = [Passage(f"{name} alpha passage {i}", 1, 20 * i, 20 * i + 19) for i in range(len(vectors))]
+    text = ' '.join(p.text for p in passages)
+    return EncodedDocument(name, name, passages, vectors, text, f"hash-{name}", [],
+                           np.zeros((0, DIMENSION), dtype='float32'))
+
+
+class RemovalReloadTests(SimpleTestCase):
+    """Removing a document must hold across reloads, whether or not the index can drop vectors"""
+    index_type = 'flat'
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        override = override_settings(RAG_MODEL_PATH=root,
+                                     RAG_INDEX={**settings.RAG_INDEX, 'type': self.index_type})
+        override.enable()
+        self.addCleanup(override.disable)
+        rng = np.random.default_rng(0)
+        self.vectors = {name: rng.standard_normal((3, DIMENSION)).astype('float32') for name in ('a.pdf', 'b.pdf')}
+
+    def open_store(self):
+        store = VectorStore(dimension=DIMENSION)
+        store.load()
+        return store
+
+    def build(self, checkpoint: bool):
+        store = self.open_store()
+        for name, vectors in self.vectors.items():
+            store.add_batch([encoded(name, vectors)])
+            store.acl.set_document(name, ['u:1'])
+        if checkpoint:
+            store.checkpoint()
+        store.remove_document('a.pdf')
+        store.save()
+        return self.open_store()
+
+    def assert_only_b_remains(self, store):
+        doc_ids = {path: id_ for id_, path in store.id_to_path.items()}
+        self.assertEqual(set(doc_ids), {'b.pdf'})
+        self.assertEqual([store._passage_doc_id(i) for i in range(1, 8)], [0, 0, 0] + [doc_ids['b.pdf']] * 3 + [0])
+
+        _, bitmap, allowed = store.access_filter(['u:1'])
+        self.assertEqual(allowed, 3)
+        self.assertEqual(np.unpackbits(bitmap, bitorder='little')[1:7].tolist(), [0, 0, 0, 1, 1, 1])
+
+        for principals in (None, ['u:1']):
+            results = store.search(self.vectors['a.pdf'][0], 'alpha', k=5, threshold=-1.0, principals=principals)
+            self.assertEqual([path for path, _, _, _ in results], ['b.pdf'])
+
+    def test_removal_replayed_from_the_log(self):
+        self.assert_only_b_remains(self.build(checkpoint=False))
+
+    def test_removal_after_a_checkpoint(self):
+        self.assert_only_b_remains(self.build(checkpoint=True))
+
+    def test_ids_are_not_reused_after_reload(self):
+        store = self.build(checkpoint=True)
+        store.add_batch([encoded('c.pdf', self.vectors['a.pdf'])])
+        store = self.open_store()
+        doc_ids = {path: id_ for id_, path in store.id_to_path.items()}
+        self.assertEqual([store._passage_doc_id(i) for i in (1, 7, 8, 9)], [0] + [doc_ids['c.pdf']] * 3)
+
+
+class HNSWRemovalReloadTests(RemovalReloadTests):
+    """HNSW can't delete vectors, so removed ones stay in the index and must map to no document"""
+    index_type = 'hnsw'
+
+
+class ReadOnlyStoreTests(SimpleTestCase):
+    """Serving stores backfill documents indexed before the text store in memory, never in the snapshot"""
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        media = os.path.join(root, 'media')
+        os.makedirs(os.path.join(media, 'pdfs'))
+        shutil.copy(os.path.join(settings.MEDIA_ROOT, 'pdfs', 'pdflatex-outline.pdf'),
+                    os.path.join(media, 'pdfs', 'a.pdf'))
+        override = override_settings(RAG_MODEL_PATH=os.path.join(root, 'model'), MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        store = VectorStore(dimension=DIMENSION)
+        store.load()
+        store.add_batch([encoded('a.pdf', np.random.default_rng(0).standard_normal((2, DIMENSION)).astype('float32'))])
+        store.checkpoint()
+        # Make it look like a document indexed before doc_terms and the text store existed
+        conn = sqlite3.connect(store.db_path)
+        conn.execute("UPDATE documents SET content_hash = NULL")
+        conn.execute("DELETE FROM doc_terms")
+        conn.commit()
+        conn.close()
+        store.text_store.delete('hash-a.pdf')
+        self.doc_id = next(iter(store.id_to_path))
+        self.output_dir = store.output_dir
+
+    def snapshot_state(self):
+        state = {}
+        for dirpath, _, filenames in os.walk(self.output_dir):
+            for filename in filenames:
+                with open(os.path.join(dirpath, filename), 'rb') as f:
+                    state[os.path.relpath(os.path.join(dirpath, filename), self.output_dir)] = f.read()
+        return state
+
+    def test_backfill_leaves_the_snapshot_untouched(self):
+        store = VectorStore(dimension=DIMENSION, read_only=True)
+        store.load()
+        self.assertNotIn(self.doc_id, store.keyword_index)
+        before = self.snapshot_state()
+
+        scores = store.keyword_scores('printed text', [self.doc_id])
+        self.assertIn(self.doc_id, store.keyword_index)
+        self.assertGreater(scores[self.doc_id][1], 0)
+        self.assertTrue(store.get_document_text('a.pdf'))
+        self.assertEqual(self.snapshot_state(), before)
+
+    def test_preview_without_sentence_embeddings_is_not_encoded(self):
+        store = VectorStore(dimension=DIMENSION, read_only=True)
+        store.load()
+        before = self.snapshot_state()
+
+        preview = store.get_content_preview('a.pdf', np.ones(DIMENSION, dtype='float32'), {'printed'})
+        self.assertIn('**printed**', preview)
+        self.assertEqual(self.snapshot_state(), before)
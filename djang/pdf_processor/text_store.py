@@ -0,0 +1,109 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hex SHA-256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path: str) -> Tuple[int, int]:
+    """(size in bytes, modification time in ns) of a file; take it before hashing the file"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class TextStore:
+    """Extracted document text on disk, keyed by the content hash of the PDF.
+
+    Text is written once at ingest and read back lazily; recently used texts are
+    kept in an LRU bounded by ``max_chars`` so query-time code never re-parses a PDF.
+    """
+
+    def __init__(self, root: str, max_chars: int = 64 * 1024 * 1024):
+        self.root = root
+        self.max_chars = max_chars
+        self._cache = OrderedDict()
+        self._cached_chars = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, content_hash: str) -> str:
+        return os.path.join(self.root, content_hash[:2], f"{content_hash}.txt")
+
+    def __contains__(self, content_hash: str) -> bool:
+        return bool(content_hash) and os.path.exists(self._path(content_hash))
+
+    def put(self, content_hash: str, text: str):
+        """Persist the text for a content hash; identical content is only written once"""
+        path = self._path(content_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        self._remember(content_hash, text)
+
+    def get(self, content_hash: str) -> Optional[str]:
+        """Return the stored text, or None if this content was never ingested"""
+        if not content_hash:
+            return None
+        with self._lock:
+            text = self._cache.get(content_hash)
+            if text is not None:
+                self._cache.move_to_end(content_hash)
+                return text
+
+        path = self._path(content_hash)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError as e:
+            logger.error(f"Error reading stored text {content_hash}: {str(e)}")
+            return None
+        self._remember(content_hash, text)
+        return text
+
+    def remember(self, key: str, text: str):
+        """Keep text in the in-memory LRU only; get(key) returns it until it is evicted"""
+        self._remember(key, text)
+
+    def delete(self, content_hash: str):
+        """Remove stored text once no document references the content any more"""
+        with self._lock:
+            text = self._cache.pop(content_hash, None)
+            if text is not None:
+                self._cached_chars -= len(text)
+        try:
+            os.remove(self._path(content_hash))
+        except FileNotFoundError:
+            pass
+
+    def _remember(self, content_hash: str, text: str):
+        if len(text) > self.max_chars:
+            return
+        with self._lock:
+            previous = self._cache.pop(content_hash, None)
+            if previous is not None:
+                self._cached_chars -= len(previous)
+            self._cache[content_hash] = text
+            self._cached_chars += len(text)
+            while self._cached_chars > self.max_chars:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_chars -= len(evicted)
+
+
+__all__ = ['TextStore', 'file_fingerprint', 'file_sha256']
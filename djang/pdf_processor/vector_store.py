@@ -1,53 +1,184 @@
 import os
+import math
+import uuid
 import logging
-import fitz  # PyMuPDF
-from sentence_transformers import SentenceTransformer
+from collections import OrderedDict
 import numpy as np
-import faiss
 import pickle
-from typing import Dict, List, Tuple, TYPE_CHECKING
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
 import sqlite3
 from datetime import datetime
 from django.conf import settings
+from .chunking import Passage, chunk_pages, whole_document_passage, sentence_spans, page_offsets
+from .text_store import TextStore, file_fingerprint, file_sha256
+from .sentence_store import SentenceStore
+from .keyword_index import KeywordIndex, term_counts
+from .index_factory import (index_config_from_settings, make_index, apply_search_params, training_size,
+                            fit_config, save_index_config, load_index_config, SEARCH_PARAMS, is_compressed,
+                            is_id_mapped, index_ids, search_parameters, read_index_mapped)
+from .float_store import FloatStore
+from .index_log import IndexLog
+from .acl import DocumentAccess
+from .snapshots import SnapshotDirectory
+from .encoders import get_encoder, SharedEncoder
+from .lazy_imports import lazy_import
+
+# Imported on first use so loading models/views does not pay for the native library
+faiss = lazy_import('faiss')
 
 logger = logging.getLogger(__name__)
 
-def extract_text_from_pdf(pdf_path: str) -> str:    
+def iter_pdf_pages(pdf_path: str) -> Iterator[str]:
+    """Yield the text of each page of a PDF, loading one page at a time.
+
+    The document is closed when the pages run out, when the consumer closes the
+    generator, or when reading fails (the error propagates).
+    """
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        for number in range(doc.page_count):
+            yield doc.load_page(number).get_text()
+
+def extract_text_from_pdf(pdf_path: str) -> str:
     try:
-        doc = fitz.open(pdf_path)
-        text = ''
-        for page in doc:
-            text += page.get_text()
-        return text
+        return ''.join(iter_pdf_pages(pdf_path))
+    except Exception as e:
+        print(f"Error reading {pdf_path}: {e}")
+        return None
+
+def extract_pages_from_pdf(pdf_path: str) -> List[str]:
+    """Extract the text of each page; ''.join() of the result matches extract_text_from_pdf"""
+    try:
+        return list(iter_pdf_pages(pdf_path))
     except Exception as e:
         print(f"Error reading {pdf_path}: {e}")
         return None
+
+def extract_paged_text_from_pdf(pdf_path: str) -> Tuple[Optional[str], List[int]]:
+    """Extract the whole text and the offset at which each page starts.
+
+    Callers that need both the full text and the pages keep this one string and
+    read the pages back with chunking.iter_pages instead of holding both.
+    """
+    pages = extract_pages_from_pdf(pdf_path)
+    if pages is None:
+        return None, []
+    return ''.join(pages), page_offsets(pages)
+
 class VectorStore:
-    def __init__(self, dimension: int = 384):
+    def __init__(self, dimension: int = 384, read_only: bool = False, snapshot: str = None):
+        """Open a snapshot of the store (see snapshots.SnapshotDirectory), the live one by default"""
         self.dimension = dimension
-        self.index = faiss.IndexFlatIP(dimension)
-        self.db_path = 'djang/modelrag/output/vector_store.db'
+        # Serving stores memory-map faiss.index and never write (see SearchService)
+        self.read_only = read_only
+        self.index_config = index_config_from_settings()
+        self.index = make_index(self.index_config, dimension)
+        # (vectors, passage ids) waiting for an untrained (IVF) index to be trained
+        self._pending = []
+        self._pending_rows = 0
+        # Bulk loaders turn this off and call save() once at the end
+        self.autosave = True
+        self.snapshots = SnapshotDirectory()
+        self.snapshot = snapshot or self.snapshots.current()
+        self.output_dir = self.snapshots.path(self.snapshot)
+        self.db_path = os.path.join(self.output_dir, 'vector_store.db')
         self.current_id = 0
         self.id_to_path = {}
-        self.model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
+        self.path_to_hash = {}
+        self.text_store = TextStore(os.path.join(self.output_dir, 'text'),
+                                    max_chars=getattr(settings, 'RAG_TEXT_CACHE_CHARS', 64 * 1024 * 1024))
+        self.sentence_store = SentenceStore(os.path.join(self.output_dir, 'sentences'))
+        self.keyword_index = KeywordIndex()
+        # Full-precision copy of every vector, memory-mapped for exact re-scoring
+        self.float_store = FloatStore(os.path.join(self.output_dir, 'vectors.f32'), dimension)
+        # Vector ids added/removed since faiss.index was last written
+        self.index_log = IndexLog(os.path.join(self.output_dir, 'faiss.index.log'))
+        # Every mmap reader holds the log since the checkpoint in its private _delta, so keep it short
+        if getattr(settings, 'RAG_INDEX_MMAP', False):
+            self.checkpoint_vectors = getattr(settings, 'RAG_INDEX_MMAP_CHECKPOINT_VECTORS', 5000)
+        else:
+            self.checkpoint_vectors = getattr(settings, 'RAG_INDEX_CHECKPOINT_VECTORS', 50000)
+        self._checkpoint_due = False
+        self._index_stamp = None  # (mtime, size) of faiss.index when last read or written
+        # disk_stamp() at the last load(); read-only stores reload once it moves
+        self._loaded_stamp = None
+        # Read-only stores keep vectors logged since the checkpoint in this exact in-memory index
+        self._delta = None
+        # passage id - 1 -> documents.id (0 once removed); ids are never reused
+        self.passage_doc_ids = np.zeros(0, dtype=np.int64)
+        self.next_passage_id = 1
+        # Ids up to this bound are legacy whole-document vectors, stored under their document id
+        self.legacy_ids = 0
+        # Bumped on every add, remove and rebuild; search result caches key on it
+        self.index_version = '0'
+        self._version_token = uuid.uuid4().hex[:8]
         self._init_db()
-        self._load_existing_paths()
+        # Per-document access lists; search(principals=...) only returns documents they allow
+        self.acl = DocumentAccess(self.snapshots.access_path)
+        self._selectors = OrderedDict()
+
+    @property
+    def model(self):
+        """The process-wide encoder, loaded on first use"""
+        return get_encoder()
+
+    @property
+    def ntotal(self) -> int:
+        """Searchable vectors, counting a read-only store's replayed ones"""
+        return self.index.ntotal + (self._delta.ntotal if self._delta is not None else 0)
 
     def _init_db(self):
         """Initialize the database if it doesn't exist"""
         try:
             # Create directory if it doesn't exist
-            os.makedirs('djang/modelrag/output', exist_ok=True)
+            os.makedirs(self.output_dir, exist_ok=True)
             
             # Create database if it doesn't exist
             conn = sqlite3.connect(self.db_path)
             c = conn.cursor()
             
+            c.execute("SELECT name FROM sqlite_master WHERE name = 'documents'")
+            fresh = c.fetchone() is None
+
             # Create table if it doesn't exist
             c.execute('''CREATE TABLE IF NOT EXISTS documents
                         (id INTEGER PRIMARY KEY,
                         path TEXT UNIQUE,
                         added_date TEXT)''')
+
+            # Stores created before the text store have no content_hash column, and older
+            # ones no file fingerprint (size and mtime when the file was hashed)
+            c.execute("PRAGMA table_info(documents)")
+            columns = [row[1] for row in c.fetchall()]
+            for column, column_type in (('content_hash', 'TEXT'), ('file_size', 'INTEGER'),
+                                        ('file_mtime_ns', 'INTEGER')):
+                if column not in columns:
+                    c.execute(f"ALTER TABLE documents ADD COLUMN {column} {column_type}")
+
+            # One row per FAISS vector; id is the vector's id in the id-mapped index
+            c.execute('''CREATE TABLE IF NOT EXISTS passages
+                        (id INTEGER PRIMARY KEY,
+                        doc_id INTEGER,
+                        page INTEGER,
+                        char_start INTEGER,
+                        char_end INTEGER,
+                        text TEXT)''')
+            c.execute("CREATE INDEX IF NOT EXISTS passages_doc_id ON passages (doc_id)")
+
+            # Per-document term frequencies backing the in-memory BM25 index
+            c.execute('''CREATE TABLE IF NOT EXISTS doc_terms
+                        (doc_id INTEGER,
+                        term TEXT,
+                        tf INTEGER)''')
+            c.execute("CREATE INDEX IF NOT EXISTS doc_terms_doc_id ON doc_terms (doc_id)")
+
+            c.execute('''CREATE TABLE IF NOT EXISTS meta
+                        (key TEXT PRIMARY KEY,
+                        value TEXT)''')
+            c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('index_version', '0')")
+            if fresh:
+                # New stores never hold legacy whole-document vectors
+                c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('legacy_ids', '0')")
             
             conn.commit()
             conn.close()
@@ -58,41 +189,296 @@ class VectorStore:
             print(f"Error in _init_db: {str(e)}")
             raise
 
+    def _load_mappings(self):
+        """Document paths, the passage -> document array and the keyword index, read once per load()"""
+        self.id_to_path = {}
+        self.path_to_hash = {}
+        self._selectors.clear()
+        self._load_existing_paths()
+        self._load_passages()
+        self._load_terms()
+
     def _load_existing_paths(self):
         """Load existing document paths from database"""
         try:
             conn = sqlite3.connect(self.db_path)
             c = conn.cursor()
-            c.execute("SELECT id, path FROM documents")
-            for id_, path in c.fetchall():
+            c.execute("SELECT id, path, content_hash FROM documents")
+            for id_, path, content_hash in c.fetchall():
                 self.id_to_path[id_] = path
+                if content_hash:
+                    self.path_to_hash[path] = content_hash
                 self.current_id = max(self.current_id, id_)
             conn.close()
         except Exception as e:
             print(f"Error loading existing paths: {str(e)}")
             raise
-    def save(self):
-        """Save the FAISS index and document mappings"""
+
+    def _load_passages(self):
+        """Load the passage -> document mapping into a compact array"""
         try:
-            output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'modelrag', 'output')
-            os.makedirs(output_dir, exist_ok=True)
-            
-            index_path = os.path.join(output_dir, 'faiss.index')
-            print(f"Saving FAISS index to {index_path}")
-            faiss.write_index(self.index, index_path)
-            
             conn = sqlite3.connect(self.db_path)
             c = conn.cursor()
-            c.execute('DELETE FROM documents')
-            
-            current_date = datetime.now().isoformat()
-            for doc_id, path in self.id_to_path.items():
-                c.execute("INSERT OR REPLACE INTO documents (id, path, added_date) VALUES (?, ?, ?)",
-                         (doc_id, path, current_date))
-            
-            conn.commit()
+            c.execute("SELECT id, doc_id FROM passages ORDER BY id")
+            rows = c.fetchall()
+            c.execute("SELECT value FROM meta WHERE key = 'next_passage_id'")
+            next_id = c.fetchone()
+            c.execute("SELECT value FROM meta WHERE key = 'index_version'")
+            version = c.fetchone()
+            c.execute("SELECT value FROM meta WHERE key = 'legacy_ids'")
+            legacy_ids = c.fetchone()
+            if legacy_ids is None:
+                # Stores converted before the bound was recorded: every id below the first passage
+                c.execute("SELECT MIN(id) FROM passages WHERE page IS NOT NULL")
+                first_passage = c.fetchone()[0]
+                legacy_ids = (first_passage - 1,) if first_passage else (np.iinfo(np.int64).max,)
             conn.close()
-            print(f"Saved {len(self.id_to_path)} document mappings to database")
+
+            # Removed passages keep a row with no document (see _remove_vectors)
+            self.legacy_ids = int(legacy_ids[0])
+            doc_ids = self._extend_doc_ids(np.zeros(0, dtype=np.int64), rows[-1][0] if rows else 0)
+            for id_, doc_id in rows:
+                doc_ids[id_ - 1] = doc_id or 0
+            self.passage_doc_ids = doc_ids
+            self.next_passage_id = max(int(next_id[0]) if next_id else 1, len(doc_ids) + 1)
+            self.index_version = version[0] if version else '0'
+        except Exception as e:
+            print(f"Error loading passages: {str(e)}")
+            raise
+
+    def _load_terms(self):
+        """Build the keyword index from the stored per-document term frequencies"""
+        try:
+            self.keyword_index.clear()
+            conn = sqlite3.connect(self.db_path)
+            c = conn.cursor()
+            c.execute("SELECT doc_id, term, tf FROM doc_terms ORDER BY doc_id")
+            doc_id, counts = None, {}
+            for row_doc_id, term, tf in c:
+                if row_doc_id != doc_id:
+                    if counts:
+                        self.keyword_index.add(doc_id, counts)
+                    doc_id, counts = row_doc_id, {}
+                counts[term] = tf
+            if counts:
+                self.keyword_index.add(doc_id, counts)
+            conn.close()
+        except Exception as e:
+            print(f"Error loading keyword index: {str(e)}")
+            raise
+
+    def _index_terms(self, c, doc_id: int, text: str):
+        """Store a document's term frequencies and add it to the keyword index"""
+        counts = term_counts(text)
+        c.execute("DELETE FROM doc_terms WHERE doc_id = ?", (doc_id,))
+        c.executemany("INSERT INTO doc_terms (doc_id, term, tf) VALUES (?, ?, ?)",
+                      [(doc_id, term, tf) for term, tf in counts.items()])
+        self.keyword_index.add(doc_id, counts)
+
+    def _unindex_terms(self, c, doc_id: int):
+        c.execute("DELETE FROM doc_terms WHERE doc_id = ?", (doc_id,))
+        self.keyword_index.remove(doc_id)
+
+    def _passage_doc_id(self, passage_id: int) -> int:
+        """Document id owning the vector with the given passage id (0 for none)"""
+        if passage_id <= len(self.passage_doc_ids):
+            return int(self.passage_doc_ids[passage_id - 1])
+        # Indexes built before passage indexing hold one vector per document
+        return passage_id if passage_id <= self.legacy_ids else 0
+
+    def _extend_doc_ids(self, doc_ids: np.ndarray, last_id: int) -> np.ndarray:
+        """doc_ids grown to cover ids up to last_id; new legacy ids map to themselves, others to 0"""
+        if last_id <= len(doc_ids):
+            return doc_ids
+        new_ids = np.arange(len(doc_ids) + 1, last_id + 1, dtype=np.int64)
+        return np.concatenate([doc_ids, np.where(new_ids <= self.legacy_ids, new_ids, 0)])
+
+    def _allocate_ids(self, n: int) -> np.ndarray:
+        """Reserve n new, never reused passage ids.
+
+        The counter lives in the meta table so concurrent index workers never hand
+        out the same id.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT value FROM meta WHERE key = 'next_passage_id'").fetchone()
+            first_id = max(int(row[0]) if row else 1, self.next_passage_id)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_passage_id', ?)",
+                         (str(first_id + n),))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        self.next_passage_id = first_id + n
+        return np.arange(first_id, first_id + n, dtype=np.int64)
+
+    def _bump_version(self, c, resync: bool = False):
+        """Advance the shared index version inside the caller's transaction.
+
+        Processes that loaded the same version hold the same documents, so they can
+        share cached results. A process that missed another's change (its version
+        is behind the stored one) gets a private version until it reloads, unless
+        resync says its state was rebuilt from scratch.
+        """
+        c.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'index_version'")
+        if not c.rowcount:
+            c.execute("INSERT INTO meta (key, value) VALUES ('index_version', '1')")
+        c.execute("SELECT value FROM meta WHERE key = 'index_version'")
+        version = int(c.fetchone()[0])
+        if resync or self.index_version == str(version - 1):
+            self.index_version = str(version)
+        else:
+            self.index_version = f"{version}.{self._version_token}"
+
+    def _insert_document(self, c, filename: str, content_hash: str, fingerprint: Tuple[int, int] = None) -> int:
+        """Insert a documents row, letting sqlite pick the id"""
+        size, mtime_ns = fingerprint or (None, None)
+        c.execute("INSERT OR REPLACE INTO documents (path, added_date, content_hash, file_size, file_mtime_ns) "
+                  "VALUES (?, ?, ?, ?, ?)",
+                  (filename, datetime.now().isoformat(), content_hash, size, mtime_ns))
+        doc_id = c.lastrowid
+        self.current_id = max(self.current_id, doc_id)
+        self.id_to_path[doc_id] = filename
+        return doc_id
+
+    def _get_passages(self, ids: List[int]) -> Dict[int, Tuple[int, int, int, str]]:
+        """Fetch page, offsets and text for the given passage ids"""
+        if not ids:
+            return {}
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        placeholders = ','.join('?' * len(ids))
+        c.execute(f"SELECT id, page, char_start, char_end, text FROM passages WHERE id IN ({placeholders})",
+                  list(ids))
+        rows = {row[0]: row[1:] for row in c.fetchall()}
+        conn.close()
+        return rows
+
+    def _append_passages(self, c, doc_id: int, passages: List[Passage], ids: np.ndarray):
+        """Record passage rows for vectors added under the given ids"""
+        c.executemany("INSERT OR REPLACE INTO passages (id, doc_id, page, char_start, char_end, text) "
+                      "VALUES (?, ?, ?, ?, ?, ?)",
+                      [(int(id_), doc_id, p.page, p.start, p.end, p.text)
+                       for id_, p in zip(ids, passages)])
+
+        self.passage_doc_ids = self._extend_doc_ids(self.passage_doc_ids, int(ids[-1]))
+        self.passage_doc_ids[ids - 1] = doc_id
+
+    def _remove_vectors(self, c, doc_id: int) -> int:
+        """Drop a document's passages and vectors without touching the rest of the index.
+
+        The passage rows stay behind as tombstones (doc_id NULL): HNSW indexes and
+        read-only stores can still return the removed ids, and without a row
+        _load_passages would map them to the document with the same numeric id.
+        """
+        c.execute("SELECT id FROM passages WHERE doc_id = ?", (doc_id,))
+        ids = np.array([row[0] for row in c.fetchall()], dtype=np.int64)
+        c.execute("UPDATE passages SET doc_id = NULL, text = NULL WHERE doc_id = ?", (doc_id,))
+        if not len(ids) and self._passage_doc_id(doc_id) == doc_id:
+            # Legacy whole-document vector, stored under its document id
+            ids = np.array([doc_id], dtype=np.int64)
+            c.execute("INSERT OR REPLACE INTO passages (id, doc_id) VALUES (?, NULL)", (doc_id,))
+        if not len(ids):
+            return 0
+
+        in_range = ids[ids <= len(self.passage_doc_ids)]
+        self.passage_doc_ids[in_range - 1] = 0
+        self.index_log.append(IndexLog.REMOVE, ids)
+        return self._drop_ids(ids)
+
+    def _drop_ids(self, ids: np.ndarray) -> int:
+        """Remove vector ids from the index and the staged vectors"""
+        if self.read_only:
+            # Removed passages have no document in passage_doc_ids, so their hits are skipped
+            return self._delta.remove_ids(ids) if self._delta is not None else 0
+        if self._pending:
+            self._pending = [(vectors[~np.isin(pending_ids, ids)], pending_ids[~np.isin(pending_ids, ids)])
+                             for vectors, pending_ids in self._pending]
+            self._pending_rows = sum(len(pending_ids) for _, pending_ids in self._pending)
+        try:
+            removed = self.index.remove_ids(ids)
+        except RuntimeError:
+            # HNSW cannot delete; the unmapped vectors are skipped at search time until a rebuild
+            logger.info(f"Index does not support removal; {len(ids)} vectors left unmapped")
+            removed = 0
+        return removed
+
+    def reset(self):
+        """Drop every vector and mapping so the store can be rebuilt from scratch"""
+        self._check_writable()
+        self.index_config = index_config_from_settings()
+        self.index = make_index(self.index_config, self.dimension)
+        self._pending = []
+        self._pending_rows = 0
+        self.id_to_path = {}
+        self.path_to_hash = {}
+        self.current_id = 0
+        self.passage_doc_ids = np.zeros(0, dtype=np.int64)
+        self.next_passage_id = 1
+        self.legacy_ids = 0
+        self.keyword_index.clear()
+        self.float_store.truncate(0)
+        self.index_log.truncate()
+        self._checkpoint_due = True
+        # The old checkpoint on disk is superseded, not merged
+        self._index_stamp = self._file_stamp(os.path.join(self.output_dir, 'faiss.index'))
+
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        c.execute('DELETE FROM documents')
+        c.execute('DELETE FROM passages')
+        c.execute('DELETE FROM doc_terms')
+        # The version survives a rebuild so results cached before it can't match again
+        c.execute("DELETE FROM meta WHERE key != 'index_version'")
+        c.execute("INSERT INTO meta (key, value) VALUES ('legacy_ids', '0')")
+        self._bump_version(c, resync=True)
+        conn.commit()
+        conn.close()
+
+    def save(self):
+        """Persist pending changes.
+
+        Document rows are written as documents are added, and every add/remove is
+        already in the index log, so this only rewrites faiss.index once the log
+        has grown past RAG_INDEX_CHECKPOINT_VECTORS (RAG_INDEX_MMAP_CHECKPOINT_VECTORS
+        when serving from mmap) or after reset/migration.
+        """
+        self._check_writable()
+        index_path = os.path.join(self.output_dir, 'faiss.index')
+        if self._checkpoint_due or self.index_log.entries >= self.checkpoint_vectors \
+                or not os.path.exists(index_path):
+            self.checkpoint()
+        else:
+            print(f"{self.index_log.entries} vector ids in index log since last checkpoint")
+
+    def checkpoint(self):
+        """Write the full FAISS index and truncate the index log"""
+        self._check_writable()
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            
+            index_path = os.path.join(self.output_dir, 'faiss.index')
+            with self.index_log.locked():
+                reread = self._file_stamp(index_path) not in (None, self._index_stamp)
+                if reread:
+                    # Another process checkpointed since we loaded; its index plus the
+                    # log (which holds our own changes) supersedes our in-memory copy
+                    self._read_index(index_path)
+                # Pick up entries other processes (index workers) appended since our load
+                if self._replay_log() or reread:
+                    # Their document rows aren't loaded here, so this state matches no shared version
+                    self.index_version = f"{self.index_version.split('.')[0]}.{self._version_token}"
+                self.train()
+                print(f"Saving FAISS index to {index_path}")
+                tmp_path = f"{index_path}.{os.getpid()}.tmp"
+                faiss.write_index(self.index, tmp_path)
+                os.replace(tmp_path, index_path)
+                self._index_stamp = self._file_stamp(index_path)
+                save_index_config(index_path, self.index_config, self.dimension)
+                # Replay is idempotent, so a crash before this truncate only replays applied entries
+                self.index_log.truncate()
+            self._checkpoint_due = False
+            print(f"Saved {self.index.ntotal} vectors for {len(self.id_to_path)} documents")
             
         except Exception as e:
             print(f"Error saving vector store: {e}")
@@ -101,28 +487,224 @@ class VectorStore:
     def load(self):
         """Load the FAISS index and document mappings"""
         try:
-            index_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 
-                                    '..', 'modelrag', 'output', 'faiss.index')
+            index_path = os.path.join(self.output_dir, 'faiss.index')
             print(f"Looking for FAISS index at {index_path}")
+            # Taken first: a write landing while we load moves the stamp again
+            stamp = self.disk_stamp()
             
             if os.path.exists(index_path):
                 print(f"Loading FAISS index from {index_path}")
-                self.index = faiss.read_index(index_path)
-                print(f"FAISS index loaded with {self.index.ntotal} vectors")
+                # Held so a concurrent checkpoint can't truncate the log between the two reads
+                with self.index_log.locked():
+                    self._read_index(index_path)
+                    self._replay_log()
+                print(f"FAISS index loaded with {self.index.ntotal} vectors ({self.index_config['type']})")
                 
                 # Load document mappings
-                self._load_existing_paths()
+                self._load_mappings()
+                self.next_passage_id = max(self.next_passage_id, self.index.ntotal + 1)
                 print(f"Loaded {len(self.id_to_path)} document mappings from database")
             else:
                 print("FAISS index not found. Starting with an empty index.")
-                self.index = faiss.IndexFlatIP(self.dimension)
+                self.index_config = index_config_from_settings()
+                self.index = make_index(self.index_config, self.dimension)
+                self._pending = []
+                self._pending_rows = 0
+                self._delta = None
+                self._index_stamp = None
                 self._init_db()  # Just initialize the database, don't reset it
+                with self.index_log.locked():
+                    self._replay_log()
+                self._load_mappings()
+            self._loaded_stamp = stamp
                 
         except Exception as e:
             print(f"Error loading vector store: {e}")
             raise
-    def add_documents(self, paths: List[str], embeddings):
+
+    def disk_stamp(self) -> tuple:
+        """(faiss.index stamp, index log stamp, stored index version); moves with any writer's change"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'index_version'").fetchone()
+        finally:
+            conn.close()
+        return (self._file_stamp(os.path.join(self.output_dir, 'faiss.index')),
+                self._file_stamp(self.index_log.path), row[0] if row else '0')
+
+    def is_stale(self) -> bool:
+        """Whether the index on disk changed since load(); read-only stores are reloaded then"""
+        return self.disk_stamp() != self._loaded_stamp
+
+    def is_superseded(self) -> bool:
+        """Whether another snapshot has been published since this store was opened"""
+        return self.snapshots.current() != self.snapshot
+
+    def manifest(self) -> Dict:
+        """What this snapshot holds, recorded in its MANIFEST.json when published"""
+        return {
+            'index': self.index_config,
+            'dimension': self.dimension,
+            'vectors': int(self.index.ntotal),
+            'documents': len(self.id_to_path),
+            'index_version': self.index_version,
+            'files': sorted(os.listdir(self.output_dir)),
+        }
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError("Vector store is read-only; index changes go through a writable store")
+
+    @staticmethod
+    def _file_stamp(path: str):
+        try:
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def _read_index(self, index_path: str):
+        """Replace the in-memory index with the checkpoint on disk"""
+        self._index_stamp = self._file_stamp(index_path)
+        self.index_config = load_index_config(index_path)
+        if self.read_only:
+            self.index = read_index_mapped(index_path, self.index_config)
+        else:
+            self.index = faiss.read_index(index_path)
+        # Search-time parameters follow the current settings
+        settings_config = index_config_from_settings()
+        self.index_config.update({key: settings_config[key] for key in SEARCH_PARAMS})
+        apply_search_params(self.index, self.index_config)
+        self._pending = []
+        self._pending_rows = 0
+        self._delta = None
+        if not is_id_mapped(self.index):
+            self._migrate_legacy_index()
+    def _replay_log(self) -> int:
+        """Apply adds and removals logged since the index file was written; returns the ids applied"""
+        # Ids already in the checkpoint are skipped; ids of one add are never reused
+        known = np.concatenate([index_ids(self.index)] + [ids for _, ids in self._pending])
+        replayed = 0
+        for op, ids in self.index_log.replay():
+            if op == IndexLog.ADD:
+                ids = ids[~np.isin(ids, known)]
+                if len(ids):
+                    self._add_vectors(self.float_store.get(ids - 1), ids, log=False)
+            else:
+                self._drop_ids(ids)
+            replayed += len(ids)
+        if replayed:
+            print(f"Replayed {replayed} vector ids from {self.index_log.path}")
+        return replayed
+
+    def _migrate_legacy_index(self):
+        """Re-add vectors of a positional index under ids (row + 1) in an id-mapped index"""
+        n_vectors = self.index.ntotal
+        print(f"Converting positional index with {n_vectors} vectors to stable ids")
+        if self.float_store.rows >= n_vectors:
+            vectors = self.float_store.get(np.arange(n_vectors))
+        else:
+            vectors = self.index.reconstruct_n(0, n_vectors)
+            self.float_store.write(0, vectors)
+
+        self.index = make_index(self.index_config, self.dimension)
+        self._pending = []
+        self._pending_rows = 0
+        if n_vectors:
+            self._add_vectors(vectors, np.arange(1, n_vectors + 1, dtype=np.int64), log=False)
+            self.train()
+        self._checkpoint_due = True
+        # Only these ids fall back to the document with the same id (see _passage_doc_id)
+        self.legacy_ids = n_vectors
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_ids', ?)", (str(n_vectors),))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _add_vectors(self, embeddings: np.ndarray, ids: np.ndarray, log: bool = True):
+        """Add normalized vectors under ids, staging them until the index is trained"""
+        if self.read_only:
+            # The mapped index can't grow; replayed vectors are searched alongside it
+            if self._delta is None:
+                self._delta = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+            self._delta.add_with_ids(embeddings, ids)
+            return
+        if log:
+            # The float store keeps vector id at row id - 1; the log only records the ids
+            self.float_store.write(int(ids[0]) - 1, embeddings)
+            self.index_log.append(IndexLog.ADD, ids)
+        if self.index.is_trained and not self._pending:
+            self.index.add_with_ids(embeddings, ids)
+            return
+
+        self._pending.append((embeddings, ids))
+        self._pending_rows += len(embeddings)
+        if self._pending_rows >= training_size(self.index_config):
+            self.train()
+
+    def train(self):
+        """Train the index on the staged vectors if needed, then add them"""
+        if not self._pending:
+            return
+
+        vectors = np.concatenate([vectors for vectors, _ in self._pending])
+        ids = np.concatenate([ids for _, ids in self._pending])
+        if not self.index.is_trained:
+            config = fit_config(self.index_config, len(vectors))
+            if config != self.index_config:
+                self.index_config = config
+                self.index = make_index(config, self.dimension)
+            sample_size = min(len(vectors), training_size(config) or len(vectors))
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), sample_size, replace=False)]
+            print(f"Training {config['type']} index on {sample_size} vectors")
+            self.index.train(sample)
+
+        self.index.add_with_ids(vectors, ids)
+        self._pending = []
+        self._pending_rows = 0
+
+    def _document_filename(self, path: str) -> str:
+        """Normalize a stored or uploaded path to the bare filename used as the mapping key"""
+        # Handle different path formats
+        if '/' in path:
+            filename = path.split('/')[-1]
+        else:
+            filename = path.split('\\')[-1]
+
+        # Remove any 'pdfs/' prefix
+        if filename.startswith('pdfs/'):
+            filename = filename.replace('pdfs/', '')
+        return filename
+
+    def _record_text(self, filename: str, full_path: str, text: str = None, content_hash: str = None,
+                     sentences: bool = True) -> str:
+        """Hash a document's file (unless its hash is given) and keep its extracted text in the text store.
+
+        Sentence embeddings are computed too unless sentences is False (query-time backfills).
+        """
+        content_hash = content_hash or file_sha256(full_path)
+        if text is not None:
+            self.text_store.put(content_hash, text)
+            if sentences and content_hash not in self.sentence_store:
+                self._embed_sentences(content_hash, text)
+        self.path_to_hash[filename] = content_hash
+        return content_hash
+
+    def _embed_sentences(self, content_hash: str, text: str):
+        """Segment text into sentences and store their embeddings for previews"""
+        spans = sentence_spans(text)
+        if spans:
+            embeddings, _ = self.model.encode_bucketed([text[start:end] for start, end in spans])
+            faiss.normalize_L2(embeddings)
+        else:
+            embeddings = np.zeros((0, self.dimension), dtype='float32')
+        self.sentence_store.put(content_hash, spans, embeddings)
+
+    def add_documents(self, paths: List[str], embeddings, texts: List[str] = None):
         """Add documents to the vector store"""
+        self._check_writable()
         if len(paths) == 0:
             return
                 
@@ -141,27 +723,20 @@ class VectorStore:
         faiss.normalize_L2(embeddings)
         
         # Add to FAISS index
-        self.index.add(embeddings)
+        ids = self._allocate_ids(len(embeddings))
+        self._add_vectors(embeddings, ids)
         
         # Add to database and mapping
         conn = sqlite3.connect(self.db_path)
         c = conn.cursor()
-        current_date = datetime.now().isoformat()
         
-        for path in paths:
-            self.current_id += 1
+        for i, path in enumerate(paths):
+            # Vectors whose file is skipped below stay unmapped (doc_id 0)
+            doc_id = 0
             try:
                 # Get the correct filename from the path
                 if isinstance(path, str):
-                    # Handle different path formats
-                    if '/' in path:
-                        filename = path.split('/')[-1]
-                    else:
-                        filename = path.split('\\')[-1]
-                    
-                    # Remove any 'pdfs/' prefix
-                    if filename.startswith('pdfs/'):
-                        filename = filename.replace('pdfs/', '')
+                    filename = self._document_filename(path)
                     
                     print(f"Processing file: {filename}")  # Debug print
                     
@@ -171,26 +746,234 @@ class VectorStore:
                         print(f"Warning: File not found at {full_path}")
                         continue
                     
-                    c.execute("INSERT OR REPLACE INTO documents (id, path, added_date) VALUES (?, ?, ?)",
-                            (self.current_id, filename, current_date))
-                    self.id_to_path[self.current_id] = filename
+                    text = texts[i] if texts else None
+                    fingerprint = file_fingerprint(full_path)
+                    content_hash = self._record_text(filename, full_path, text)
+                    doc_id = self._insert_document(c, filename, content_hash, fingerprint)
+                    if text is not None:
+                        self._index_terms(c, doc_id, text)
                     print(f"Added document to database: {filename}")
                 
             except sqlite3.IntegrityError:
                 print(f"Document {filename} already exists in database")
             except Exception as e:
                 print(f"Error processing document: {str(e)}")
+            finally:
+                # Whole-document vectors have no stored passage text
+                self._append_passages(c, doc_id, [Passage(None, 1, 0, 0)], ids[i:i + 1])
         
+        self._bump_version(c)
         conn.commit()
         conn.close()
         
         # Save the updated index and mappings
-        self.save()
+        if self.autosave:
+            self.save()
         print(f"Current document mappings: {self.id_to_path}")  # Debug print
 
+    def add_passages(self, path: str, passages: List[Passage], embeddings, text: str = None,
+                     content_hash: str = None):
+        """Add a single document as one vector per passage; text goes to the text store.
+
+        content_hash is the file's sha256 when the caller already has it (PDFDocument.content_hash).
+        """
+        self._check_writable()
+        if len(passages) == 0:
+            return
+
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        if len(embeddings.shape) == 1:
+            embeddings = embeddings.reshape(1, -1)
+
+        if embeddings.shape[1] != self.dimension:
+            raise ValueError(f"Embedding dimension mismatch. Expected {self.dimension}, got {embeddings.shape[1]}")
+        if embeddings.shape[0] != len(passages):
+            raise ValueError(f"Got {embeddings.shape[0]} embeddings for {len(passages)} passages")
+
+        filename = self._document_filename(path)
+        full_path = os.path.join(settings.MEDIA_ROOT, 'pdfs', filename)
+        if not os.path.exists(full_path):
+            print(f"Warning: File not found at {full_path}")
+            return
+
+        faiss.normalize_L2(embeddings)
+        ids = self._allocate_ids(len(embeddings))
+        self._add_vectors(embeddings, ids)
+
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        fingerprint = file_fingerprint(full_path)
+        content_hash = self._record_text(filename, full_path, text, content_hash)
+        self._replace_document(c, filename, content_hash, passages, ids, text, fingerprint)
+        self._bump_version(c)
+        conn.commit()
+        conn.close()
+        print(f"Added {len(passages)} passages for {filename}")
+
+        if self.autosave:
+            self.save()
+
+    def add_duplicate(self, path: str, content_hash: str):
+        """Index path as a copy of an indexed document with the same content hash.
+
+        Passages and their vectors (from the float store) are copied and the text and
+        sentence stores are already keyed by content, so nothing is extracted or
+        encoded. The copy gets vector ids of its own, so its access list stays
+        separate. Returns (passages, embeddings, text), or None when no indexed
+        document has this content.
+        """
+        self._check_writable()
+        if not content_hash:
+            return None
+        filename = self._document_filename(path)
+        text = self.text_store.get(content_hash)
+        if text is None:
+            return None
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            c = conn.cursor()
+            c.execute("SELECT p.id, p.page, p.char_start, p.char_end, p.text FROM passages p "
+                      "WHERE p.doc_id = (SELECT d.id FROM documents d WHERE d.content_hash = ? AND d.path != ? "
+                      "AND EXISTS (SELECT 1 FROM passages WHERE doc_id = d.id) ORDER BY d.id DESC LIMIT 1) "
+                      "ORDER BY p.id", (content_hash, filename))
+            rows = c.fetchall()
+            source_ids = np.array([row[0] for row in rows], dtype=np.int64)
+            # Vectors added before the float store existed can't be copied
+            if not len(rows) or source_ids.max() > self.float_store.rows:
+                return None
+
+            passages = [Passage(row[4], row[1], row[2], row[3]) for row in rows]
+            embeddings = self.float_store.get(source_ids - 1)
+            full_path = os.path.join(settings.MEDIA_ROOT, 'pdfs', filename)
+            fingerprint = file_fingerprint(full_path) if os.path.exists(full_path) else None
+            ids = self._allocate_ids(len(passages))
+            self._add_vectors(embeddings, ids)
+            self.path_to_hash[filename] = content_hash
+            self._replace_document(c, filename, content_hash, passages, ids, text, fingerprint)
+            self._bump_version(c)
+            conn.commit()
+        finally:
+            conn.close()
+        print(f"Added {len(passages)} passages for {filename}, copied from identical content")
+
+        if self.autosave:
+            self.save()
+        return passages, embeddings, text
+
+    def add_batch(self, documents):
+        """Add many encoded documents at once (see ingest.EncodedDocument).
+
+        One id allocation, one vector write/log append and one transaction for the
+        whole batch; text hashes and sentence embeddings arrive precomputed.
+        """
+        self._check_writable()
+        documents = [doc for doc in documents if len(doc.passages)]
+        if not documents:
+            return
+
+        embeddings = np.ascontiguousarray(np.concatenate([doc.embeddings for doc in documents]), dtype='float32')
+        if embeddings.shape[1] != self.dimension:
+            raise ValueError(f"Embedding dimension mismatch. Expected {self.dimension}, got {embeddings.shape[1]}")
+        faiss.normalize_L2(embeddings)
+        ids = self._allocate_ids(len(embeddings))
+        self._add_vectors(embeddings, ids)
+
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        offset = 0
+        for doc in documents:
+            doc_ids = ids[offset:offset + len(doc.passages)]
+            offset += len(doc.passages)
+            filename = self._document_filename(doc.path)
+            self.text_store.put(doc.content_hash, doc.text)
+            if doc.content_hash not in self.sentence_store:
+                sentence_embeddings = np.ascontiguousarray(doc.sentence_embeddings, dtype='float32')
+                if len(sentence_embeddings):
+                    faiss.normalize_L2(sentence_embeddings)
+                self.sentence_store.put(doc.content_hash, doc.sentence_spans, sentence_embeddings)
+            self.path_to_hash[filename] = doc.content_hash
+            self._replace_document(c, filename, doc.content_hash, doc.passages, doc_ids, doc.text,
+                                   doc.fingerprint)
+        self._bump_version(c)
+        conn.commit()
+        conn.close()
+        print(f"Added {len(ids)} passages for {len(documents)} documents")
+
+        if self.autosave:
+            self.save()
+
+    def _replace_document(self, c, filename: str, content_hash: str, passages: List[Passage],
+                          ids: np.ndarray, text: str = None, fingerprint: Tuple[int, int] = None) -> int:
+        """Record a document's row, passages and terms, replacing any earlier version of the file"""
+        # Includes versions another process added
+        c.execute("SELECT id FROM documents WHERE path = ?", (filename,))
+        old_ids = {row[0] for row in c.fetchall()}
+        old_ids.update(id_ for id_, p in self.id_to_path.items() if p == filename)
+        for id_ in old_ids:
+            self.id_to_path.pop(id_, None)
+            c.execute("DELETE FROM documents WHERE id = ?", (id_,))
+            self._remove_vectors(c, id_)
+            self._unindex_terms(c, id_)
+
+        doc_id = self._insert_document(c, filename, content_hash, fingerprint)
+        self._append_passages(c, doc_id, passages, ids)
+        if text is not None:
+            self._index_terms(c, doc_id, text)
+        return doc_id
+
+    def split_pages(self, pages: Iterable[str], model=None) -> List[Passage]:
+        """Split a document's pages (a list or a stream) into passages according to RAG_INGEST_MODE"""
+        model = model or self.model
+        if getattr(settings, 'RAG_INGEST_MODE', 'passages') == 'document':
+            return whole_document_passage(pages)
+        return chunk_pages(
+            pages,
+            max_tokens=getattr(settings, 'RAG_PASSAGE_TOKENS', 200),
+            overlap=getattr(settings, 'RAG_PASSAGE_OVERLAP', 40),
+            tokenizer=getattr(model, 'tokenizer', None),
+        )
+
+    def index_pages(self, path: str, pages: List[str], model=None) -> Tuple[List[Passage], np.ndarray]:
+        """Chunk, encode and add a document; returns its passages and their embeddings"""
+        model = model or self.model
+        passages = self.split_pages(pages, model)
+        if not passages:
+            return [], None
+
+        embeddings, _ = model.encode_bucketed([p.text for p in passages])
+        self.add_passages(path, passages, embeddings, text=''.join(pages))
+        return passages, embeddings
+
+    def file_fingerprints(self) -> Dict[str, Tuple[int, int, str]]:
+        """(file size, mtime in ns, content hash) of every indexed file, by filename.
+
+        Size and mtime are None for documents indexed before fingerprints were kept.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return {path: (size, mtime_ns, content_hash) for path, size, mtime_ns, content_hash in
+                    conn.execute("SELECT path, file_size, file_mtime_ns, content_hash FROM documents")}
+        finally:
+            conn.close()
+
+    def update_fingerprints(self, fingerprints: Dict[str, Tuple[int, int]]):
+        """Record new (size, mtime) for files whose content did not change (e.g. only touched)"""
+        self._check_writable()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executemany("UPDATE documents SET file_size = ?, file_mtime_ns = ? WHERE path = ?",
+                             [(size, mtime_ns, self._document_filename(path))
+                              for path, (size, mtime_ns) in fingerprints.items()])
+            conn.commit()
+        finally:
+            conn.close()
+
     def remove_document(self, path: str):
         """Remove a document from the vector store"""
+        self._check_writable()
         try:
+            path = self._document_filename(path)
             doc_id = None
             for id_, p in self.id_to_path.items():
                 if p == path:
@@ -204,135 +987,323 @@ class VectorStore:
             conn = sqlite3.connect(self.db_path)
             c = conn.cursor()
             c.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+            removed = self._remove_vectors(c, doc_id)
+            self._unindex_terms(c, doc_id)
+            self._bump_version(c)
             conn.commit()
             conn.close()
 
             del self.id_to_path[doc_id]
-            self._rebuild_index()
+            content_hash = self.path_to_hash.pop(path, None)
+            if content_hash and content_hash not in self.path_to_hash.values():
+                self.text_store.delete(content_hash)
+                self.sentence_store.delete(content_hash)
+            logger.info(f"Removed {path} ({removed} vectors) from vector store")
             
         except Exception as e:
             logger.error(f"Error removing document {path}: {str(e)}")
-    def search(self, query_vector: np.ndarray, query_text: str, k: int = 5, threshold: float = 0.5) -> List[Tuple[str, float, str]]:
+
+    def search(self, query_vector: np.ndarray, query_text: str, k: int = 5, threshold: float = 0.5,
+               passages_per_doc: int = 3, principals=None) -> List[Tuple[str, float, str, List[Dict]]]:
+        """Search passages and return the best documents with their best passages.
+
+        Each result is (filename, combined_score, preview, passages), where passages
+        holds up to passages_per_doc dicts with page, start, end, score and text.
+        With principals (see acl.user_principals), only documents their access lists
+        allow are searched; None searches everything.
+        """
+        return self.search_batch(np.reshape(query_vector, (1, -1)), [query_text], k=k, threshold=threshold,
+                                 passages_per_doc=passages_per_doc, principals=principals)[0]
+
+    def search_batch(self, query_vectors: np.ndarray, query_texts: List[str], k: int = 5, threshold: float = 0.5,
+                     passages_per_doc: int = 3, principals=None) -> List[List[Tuple[str, float, str, List[Dict]]]]:
+        """Run several queries with the same k and access as one multi-vector index search.
+
+        Returns one result list per query, as search() would.
+        """
         print("\n=== VECTOR STORE SEARCH STARTED ===")
-        print(f"Searching for query: {query_text}")
-        print(f"Number of vectors in index: {self.index.ntotal}")
-        print(f"Document paths: {self.id_to_path}")
+        print(f"Searching for {len(query_texts)} queries: {query_texts}")
+        print(f"Number of vectors in index: {self.ntotal}")
         
         try:
-            # Normalize query vector
-            faiss.normalize_L2(query_vector.reshape(1, -1))
+            # Normalize query vectors
+            query_vectors = np.ascontiguousarray(query_vectors, dtype='float32').reshape(len(query_texts), -1)
+            faiss.normalize_L2(query_vectors)
             
-            # Search in FAISS
-            scores, indices = self.index.search(query_vector.reshape(1, -1), k * 2)
-            print(f"FAISS returned {len(indices[0])} results")
-            print(f"Indices: {indices[0]}")
-            print(f"Scores: {scores[0]}")
-            
-            results = []
-            query_terms = set(query_text.lower().split())
+            access = None
+            n_allowed = self.ntotal
+            if principals is not None:
+                access = self.access_filter(principals)
+                n_allowed = min(n_allowed, access[2])
             
-            for idx, score in zip(indices[0], scores[0]):
-                if idx != -1 and score > -float('inf'):  # Check for valid scores
-                    doc_id = idx + 1
-                    filename = self.id_to_path.get(doc_id)
-                    
-                    if filename:
-                        print(f"\nProcessing result for file: {filename}")
-                        print(f"Document ID: {doc_id}")
-                        semantic_similarity = (score + 1) / 2
-                        print(f"Semantic similarity: {semantic_similarity}")
-                        
-                        try:
-                            # Get the full path
-                            full_path = os.path.join(settings.MEDIA_ROOT, 'pdfs', filename)
-                            print(f"Looking for file at: {full_path}")
-                            
-                            if not os.path.exists(full_path):
-                                # Try alternative path
-                                full_path = os.path.join(settings.MEDIA_ROOT, filename)
-                                print(f"Trying alternative path: {full_path}")
-                                
-                                if not os.path.exists(full_path):
-                                    print(f"File not found at either location")
-                                    continue
-                            
-                            print(f"Found file, extracting text...")
-                            doc = fitz.open(full_path)
-                            content = ""
-                            for page in doc:
-                                content += page.get_text().lower()
-                            doc.close()
-                            
-                            word_matches = sum(1 for term in query_terms if term in content)
-                            exact_match_score = word_matches / len(query_terms)
-                            print(f"Word matches: {word_matches}")
-                            print(f"Exact match score: {exact_match_score}")
-                            
-                            combined_score = (0.7 * semantic_similarity) + (0.3 * exact_match_score)
-                            print(f"Combined score: {combined_score}")
-                            
-                            if combined_score >= threshold and word_matches > 0:
-                                preview = self.get_content_preview(filename, query_vector, query_terms)
-                                results.append((filename, float(combined_score), preview))
-                                print("Added to results")
-                                
-                        except Exception as e:
-                            print(f"Error processing document {filename}: {str(e)}")
-                            continue
+            # Several passages of one document can fill the top hits, so over-fetch
+            n_candidates = min(n_allowed, k * 10)
+            if n_candidates == 0:
+                return [[] for _ in query_texts]
+            scores, indices = self._search_index(query_vectors, n_candidates, access)
+            print(f"FAISS returned {indices.shape[1]} results per query")
             
-            print(f"\nReturning {len(results)} final results")
-            return sorted(results, key=lambda x: x[1], reverse=True)[:k]
+            # Group passage hits per document, best first
+            hits = [self._hits_by_doc(scores[row], indices[row]) for row in range(len(query_texts))]
+            passage_rows = self._get_passages([pid for by_doc in hits for doc_hits in by_doc.values()
+                                               for _, pid in doc_hits])
+            results = []
+            for row, query_text in enumerate(query_texts):
+                try:
+                    results.append(self._rank_documents(query_vectors[row], query_text, hits[row], passage_rows,
+                                                        k, threshold, passages_per_doc))
+                except Exception as e:
+                    print(f"Error ranking results for {query_text}: {str(e)}")
+                    results.append([])
+            return results
             
         except Exception as e:
             print(f"Error in vector store search: {str(e)}")
-            return []
+            return [[] for _ in query_texts]
         finally:
             print("=== VECTOR STORE SEARCH COMPLETED ===\n")
 
+    def _hits_by_doc(self, scores: np.ndarray, indices: np.ndarray) -> Dict[int, List[Tuple[float, int]]]:
+        """(score, passage id) hits of one query per document id, best first"""
+        hits_by_doc = {}
+        for passage_id, score in zip(indices, scores):
+            if passage_id == -1:
+                continue
+            doc_id = self._passage_doc_id(int(passage_id))
+            if doc_id in self.id_to_path:
+                hits_by_doc.setdefault(doc_id, []).append((float(score), int(passage_id)))
+        return hits_by_doc
 
-
-    def get_content_preview(self, path: str, query_vector: np.ndarray, query_terms: set, preview_length: int = 200) -> str:
-        """Get a preview of the document content"""
-        try:
-            file_name = os.path.basename(path)
-            full_path = os.path.join(settings.MEDIA_ROOT, 'pdfs', file_name)
+    def _rank_documents(self, query_vector: np.ndarray, query_text: str, hits_by_doc, passage_rows,
+                        k: int, threshold: float, passages_per_doc: int) -> List[Tuple[str, float, str, List[Dict]]]:
+        """Combine semantic and keyword scores for one query's documents and build their previews"""
+        keyword_scores = self.keyword_scores(query_text, hits_by_doc.keys())
+        
+        results = []
+        query_terms = set(query_text.lower().split())
+        if not query_terms:
+            return []
+        
+        for doc_id, hits in hits_by_doc.items():
+            filename = self.id_to_path[doc_id]
+            semantic_similarity = (hits[0][0] + 1) / 2
             
-            if not os.path.exists(full_path):
-                logger.error(f"File not found: {full_path}")
-                return "Document not found"
+            try:
+                passages = []
+                for score, pid in hits[:passages_per_doc]:
+                    page, start, end, text = passage_rows.get(pid, (1, 0, 0, None))
+                    if text is not None:
+                        passages.append({'page': page, 'start': start, 'end': end,
+                                         'score': (score + 1) / 2, 'text': text})
                 
-            doc = fitz.open(full_path)
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            doc.close()
-            
-            sentences = text.replace('\n', ' ').split('.')
-            best_sentence = ""
-            best_score = -1
-            
-            for sentence in sentences:
-                sentence = sentence.strip()
-                if len(sentence) < 20:
-                    continue
+                # BM25 over the whole document replaces the substring scan
+                exact_match_score, word_matches = keyword_scores.get(doc_id, (0.0, 0))
                 
-                sentence_lower = sentence.lower()
-                matches = sum(1 for term in query_terms if term in sentence_lower)
+                combined_score = (0.7 * semantic_similarity) + (0.3 * exact_match_score)
+                print(f"{filename}: semantic {semantic_similarity:.3f}, "
+                      f"matches {word_matches}, combined {combined_score:.3f}")
                 
-                if matches > 0:
-                    sentence_embedding = self.model.encode([sentence])[0]
-                    faiss.normalize_L2(sentence_embedding.reshape(1, -1))
-                    similarity = np.dot(query_vector, sentence_embedding)
-                    combined_score = (0.7 * similarity) + (0.3 * (matches / len(query_terms)))
+                if combined_score >= threshold and word_matches > 0:
+                    preview = self.get_content_preview(
+                        filename, query_vector, query_terms,
+                        ranges=[(p['start'], p['end']) for p in passages])
+                    results.append((filename, float(combined_score), preview, passages))
                     
-                    if combined_score > best_score:
-                        best_score = combined_score
-                        best_sentence = sentence
-            
-            if not best_sentence:
+            except Exception as e:
+                print(f"Error processing document {filename}: {str(e)}")
+                continue
+        
+        print(f"\nReturning {len(results)} final results for {query_text}")
+        return sorted(results, key=lambda x: x[1], reverse=True)[:k]
+
+    def access_filter(self, principals) -> Tuple['faiss.IDSelector', np.ndarray, int]:
+        """(selector, bitmap, allowed vector count) for the documents principals may see.
+
+        Bit i of the bitmap is set when passage id i belongs to a visible document.
+        Built once per principal set, acl version and index version.
+        """
+        acl_version = self.acl.refresh()
+        key = (frozenset(principals), acl_version, self.index_version)
+        access = self._selectors.get(key)
+        if access is not None:
+            self._selectors.move_to_end(key)
+            return access
+
+        paths = self.acl.visible_paths(principals)
+        doc_ids = np.array([id_ for id_, path in self.id_to_path.items() if path in paths], dtype=np.int64)
+        doc_of = self._extend_doc_ids(self.passage_doc_ids, self.next_passage_id - 1)
+        mask = np.zeros(len(doc_of) + 1, dtype=bool)
+        mask[1:] = np.isin(doc_of, doc_ids)
+        bitmap = np.packbits(mask, bitorder='little')
+        # The selector points into bitmap, which must stay referenced alongside it
+        access = (faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap)), bitmap, int(mask.sum()))
+
+        self._selectors[key] = access
+        while len(self._selectors) > getattr(settings, 'RAG_ACL_FILTER_CACHE', 64):
+            self._selectors.popitem(last=False)
+        return access
+
+    def _filtered_search(self, query_vectors: np.ndarray, n: int, access) -> Tuple[np.ndarray, np.ndarray]:
+        """Search restricted to the ids access admits, merging in a read-only store's replayed vectors"""
+        if self._delta is None or not self._delta.ntotal:
+            return self._scan_index(query_vectors, n, access)
+
+        params = faiss.SearchParameters(sel=access[0]) if access is not None else None
+        scores, indices = self._delta.search(query_vectors, n, params=params)
+        if self.index.ntotal:
+            index_scores, index_indices = self._scan_index(query_vectors, n, access)
+            scores, indices = np.hstack([index_scores, scores]), np.hstack([index_indices, indices])
+            order = np.argsort(-scores, axis=1)
+            scores, indices = np.take_along_axis(scores, order, 1), np.take_along_axis(indices, order, 1)
+        return self._top_rows(scores, indices, indices != -1, n)
+
+    def _scan_index(self, query_vectors: np.ndarray, n: int, access) -> Tuple[np.ndarray, np.ndarray]:
+        """Search self.index for the ids access admits, inside the ANN scan where the index supports it"""
+        if access is None:
+            return self.index.search(query_vectors, n)
+        selector, bitmap, allowed = access
+        fraction = allowed / max(self.ntotal, 1)
+        try:
+            params = search_parameters(self.index, self.index_config, selector, n, fraction)
+            return self.index.search(query_vectors, n, params=params)
+        except RuntimeError as e:
+            # Index without selector support: over-fetch and drop hidden ids
+            logger.debug(f"Filtering search results after the scan: {str(e)}")
+            n_fetch = min(self.index.ntotal, math.ceil(n / max(fraction, 1e-6)))
+            scores, indices = self.index.search(query_vectors, n_fetch)
+            visible = (indices >= 0) & (indices >> 3 < len(bitmap))
+            visible[visible] = (bitmap[indices[visible] >> 3] >> (indices[visible] & 7)) & 1 == 1
+            return self._top_rows(scores, indices, visible, n)
+
+    @staticmethod
+    def _top_rows(scores: np.ndarray, indices: np.ndarray, keep: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """First n kept hits of each row, padded with id -1"""
+        top_scores = np.full((len(indices), n), -np.inf, dtype='float32')
+        top_ids = np.full((len(indices), n), -1, dtype=np.int64)
+        for row in range(len(indices)):
+            row_scores, row_ids = scores[row][keep[row]][:n], indices[row][keep[row]][:n]
+            top_scores[row, :len(row_ids)] = row_scores
+            top_ids[row, :len(row_ids)] = row_ids
+        return top_scores, top_ids
+
+    def _search_index(self, query_vectors: np.ndarray, n: int, access=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-n passage ids per normalized query row; compressed indexes are re-scored exactly"""
+        if not is_compressed(self.index_config):
+            return self._filtered_search(query_vectors, n, access)
+
+        n_fetch = min(self.ntotal, n * self.index_config['rescore_factor'])
+        _, indices = self._filtered_search(query_vectors, n_fetch, access)
+        scores = np.full(indices.shape, -np.inf, dtype='float32')
+        for row, query_vector in enumerate(query_vectors):
+            found = indices[row] != -1
+            scores[row, found] = self.float_store.get(indices[row, found] - 1) @ query_vector
+        order = np.argsort(-scores, axis=1)
+        scores, indices = np.take_along_axis(scores, order, 1), np.take_along_axis(indices, order, 1)
+        return self._top_rows(scores, indices, indices != -1, n)
+
+    def keyword_scores(self, query_text: str, doc_ids) -> Dict[int, Tuple[float, int]]:
+        """Normalized BM25 score and matched term count per document id"""
+        doc_ids = list(doc_ids)
+        missing = [doc_id for doc_id in doc_ids if doc_id not in self.keyword_index]
+        if missing:
+            # Documents indexed before the keyword index existed are added once
+            # Read (and possibly extract) every text before opening the write connection
+            texts = {doc_id: self.get_document_text(self.id_to_path.get(doc_id, '')) for doc_id in missing}
+            if self.read_only:
+                # A serving store never writes the published snapshot; writers persist the terms
+                for doc_id, text in texts.items():
+                    if text is not None:
+                        self.keyword_index.add(doc_id, term_counts(text))
+                return self.keyword_index.score(query_text, doc_ids)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            c = conn.cursor()
+            for doc_id, text in texts.items():
+                if text is not None:
+                    self._index_terms(c, doc_id, text)
+            conn.commit()
+            conn.close()
+        return self.keyword_index.score(query_text, doc_ids)
+
+    def get_document_text(self, path: str) -> str:
+        """Full extracted text of an indexed document, served from the text store"""
+        filename = self._document_filename(path)
+        text = self.text_store.get(self.path_to_hash.get(filename))
+        if text is None and self.read_only:
+            text = self.text_store.get(f"extracted-{filename}")
+        if text is not None:
+            return text
+
+        # Documents indexed before the text store existed are extracted once, then stored
+        full_path = os.path.join(settings.MEDIA_ROOT, 'pdfs', filename)
+        if not os.path.exists(full_path):
+            # Try alternative path
+            full_path = os.path.join(settings.MEDIA_ROOT, filename)
+            if not os.path.exists(full_path):
+                print(f"File not found: {filename}")
+                return None
+
+        text = extract_text_from_pdf(full_path)
+        if text is not None and self.read_only:
+            # Kept in memory: serving stores must not change the published snapshot
+            self.text_store.remember(f"extracted-{filename}", text)
+        elif text is not None:
+            content_hash = self._record_text(filename, full_path, text, sentences=False)
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("UPDATE documents SET content_hash = ? WHERE path = ?", (content_hash, filename))
+            conn.commit()
+            conn.close()
+        return text
+
+    def get_content_preview(self, path: str, query_vector: np.ndarray, query_terms: set, preview_length: int = 200,
+                            ranges: List[Tuple[int, int]] = None) -> str:
+        """Get a preview of the document content.
+
+        Sentence embeddings are precomputed at ingest, so the best sentence is found
+        with one dot product; ranges restricts candidates to the matching passages.
+        Documents without them get the sentence with the most query terms instead.
+        """
+        try:
+            text = self.get_document_text(path)
+            if text is None:
+                logger.error(f"Document text not found: {path}")
+                return "Document not found"
+
+            content_hash = self.path_to_hash.get(self._document_filename(path))
+            sentences = self.sentence_store.get(content_hash)
+            if sentences is not None:
+                spans, embeddings = sentences
+            else:
+                # Never encode on the request thread; embeddings are only computed at ingest
+                spans, embeddings = np.array(sentence_spans(text), dtype=np.int64).reshape(-1, 2), None
+            if len(spans) == 0:
                 return "No relevant preview available"
+
+            query = np.asarray(query_vector, dtype='float32').reshape(-1)
+            query = query / (np.linalg.norm(query) or 1.0)
+
+            candidate_sets = []
+            if ranges:
+                in_ranges = np.zeros(len(spans), dtype=bool)
+                for start, end in ranges:
+                    in_ranges |= (spans[:, 0] >= start) & (spans[:, 1] <= end)
+                candidate_sets.append(np.flatnonzero(in_ranges))
+            candidate_sets.append(np.arange(len(spans)))
+
+            for candidates in candidate_sets:
+                if embeddings is None:
+                    best_sentence = self._keyword_sentence(text, spans, candidates, query_terms)
+                else:
+                    best_sentence = self._best_sentence(text, spans, embeddings, candidates, query, query_terms)
+                if best_sentence:
+                    break
+            else:
+                if embeddings is None:
+                    start, end = spans[next(c for c in candidate_sets if len(c))[0]]
+                    best_sentence = text[start:end]
+                else:
+                    return "No relevant preview available"
             
-            preview = best_sentence.strip()
+            preview = ' '.join(best_sentence.split())
             if len(preview) > preview_length:
                 preview = preview[:preview_length] + "..."
             
@@ -344,24 +1315,54 @@ class VectorStore:
         except Exception as e:
             logger.error(f"Error getting preview for {path}: {str(e)}")
             return ""
-    def _rebuild_index(self):
-        """Rebuild the FAISS index from remaining documents"""
-        try:
-            new_index = faiss.IndexFlatIP(self.dimension)
-            
-            for doc_id, path in self.id_to_path.items():
-                full_path = os.path.join(settings.PDF_STORAGE, path)
-                if os.path.exists(full_path):
-                    text = extract_text_from_pdf(full_path)
-                    if text:
-                        embedding = self.model.encode([text])[0]
-                        faiss.normalize_L2(embedding.reshape(1, -1))
-                        new_index.add(embedding.reshape(1, -1))
-            
-            self.index = new_index
-            
-        except Exception as e:
-            logger.error(f"Error rebuilding index: {str(e)}")
+
+    def _best_sentence(self, text: str, spans: np.ndarray, embeddings: np.ndarray, candidates: np.ndarray,
+                       query: np.ndarray, query_terms: set, top_n: int = 32) -> str:
+        """Pick the sentence with the best blend of similarity and query-term matches"""
+        if len(candidates) == 0:
+            return ""
+
+        similarity = embeddings[candidates].astype(np.float32) @ query
+
+        # Check term matches on the most similar sentences first, widening only if none match
+        checked = 0
+        while checked < len(candidates):
+            top_n = min(top_n, len(candidates))
+            top = np.argpartition(-similarity, top_n - 1)[:top_n] if top_n < len(candidates) \
+                else np.arange(len(candidates))
+            top = top[np.argsort(-similarity[top])][checked:]
+
+            best_sentence = ""
+            best_score = -1
+            for i in top:
+                start, end = spans[candidates[i]]
+                sentence = text[start:end]
+                sentence_lower = sentence.lower()
+                matches = sum(1 for term in query_terms if term in sentence_lower)
+                if matches > 0:
+                    combined_score = (0.7 * similarity[i]) + (0.3 * (matches / len(query_terms)))
+                    if combined_score > best_score:
+                        best_score = combined_score
+                        best_sentence = sentence
+            if best_sentence:
+                return best_sentence
+            checked = top_n
+            top_n *= 4
+        return ""
+
+    def _keyword_sentence(self, text: str, spans: np.ndarray, candidates: np.ndarray, query_terms: set) -> str:
+        """Pick the earliest sentence with the most query-term matches"""
+        best_sentence = ""
+        best_matches = 0
+        for i in candidates:
+            start, end = spans[i]
+            sentence = text[start:end]
+            sentence_lower = sentence.lower()
+            matches = sum(1 for term in query_terms if term in sentence_lower)
+            if matches > best_matches:
+                best_matches = matches
+                best_sentence = sentence
+        return best_sentence
 
     def _get_full_path(self, file_path: str) -> str:
         """Convert relative path to full path"""
@@ -370,29 +1371,24 @@ class VectorStore:
 
 
 def find_similar_documents(query: str, 
-                         model: SentenceTransformer,
+                         model: SharedEncoder,
                          vector_store: 'VectorStore',
                          top_k: int = 5) -> List[Tuple[str, float]]:
     """Find similar documents using semantic search"""
     query_embedding = model.encode([query])[0]
     semantic_results = vector_store.search(query_embedding, query, k=top_k * 2)
 
-    pdf_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'media', 'pdfs')
-    query_terms = set(query.lower().split())
+    path_to_id = {path: doc_id for doc_id, path in vector_store.id_to_path.items()}
+    keyword_scores = vector_store.keyword_scores(
+        query, [path_to_id[path] for path, _, _, _ in semantic_results if path in path_to_id])
     final_results = []
 
-    for path, semantic_score, _ in semantic_results:
-        full_path = os.path.join(pdf_directory, path)
-        text = extract_text_from_pdf(full_path)
+    for path, semantic_score, _, _ in semantic_results:
+        keyword_score, term_matches = keyword_scores.get(path_to_id.get(path), (0.0, 0))
+        combined_score = (0.7 * semantic_score) + (0.3 * keyword_score)
         
-        if text:
-            text_lower = text.lower()
-            term_matches = sum(1 for term in query_terms if term in text_lower)
-            keyword_score = term_matches / len(query_terms) if query_terms else 0
-            combined_score = (0.7 * semantic_score) + (0.3 * keyword_score)
-            
-            if keyword_score > 0:
-                final_results.append((path, combined_score))
+        if term_matches > 0:
+            final_results.append((path, combined_score))
 
     final_results.sort(key=lambda x: x[1], reverse=True)
     return final_results[:top_k]
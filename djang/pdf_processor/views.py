@@ -3,31 +3,38 @@ from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.core.files import File
 from django.core.files.storage import default_storage
 from django.conf import settings
+from asgiref.sync import sync_to_async
 import os
 import json
+import hashlib
 import logging
 from .models import PDFDocument
-from .services.search_service import SearchService
+from .services import get_search_service
+from .services.offload import offload
+from .acl import user_principals
 from django.views.generic import TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from sentence_transformers import SentenceTransformer
-from .vector_store import VectorStore, find_similar_documents
 
 # Initialize logger first
 logger = logging.getLogger(__name__)
 
-# Initialize model and vector store
-model = SentenceTransformer('all-MiniLM-L6-v2')
-vector_store = VectorStore(dimension=384)
-try:
-    vector_store.load()
-    logger.info("Loaded existing vector store")
-except Exception as e:
-    logger.warning(f"Could not load vector store: {str(e)}")
+class _HashingUpload(File):
+    """An upload whose SHA-256 is computed from the chunks as storage writes them"""
 
-search_service = SearchService()
+    def __init__(self, upload):
+        super().__init__(upload, name=upload.name)
+        self.sha256 = hashlib.sha256()
+
+    def chunks(self, chunk_size=None):
+        for chunk in self.file.chunks(chunk_size):
+            self.sha256.update(chunk)
+            yield chunk
+
+
+# The search service (encoder and index) is created on the first request that needs it
 
 @login_required
 def search_page(request):
@@ -49,7 +56,7 @@ def search_page(request):
             
             # Perform search
             print("\nPerforming search...")
-            results = search_service.search(query)
+            results = get_search_service().search(query, user=request.user)
             print(f"Search returned {len(results)} results")
             print(f"Raw results: {results}")
             
@@ -78,14 +85,12 @@ def search_page(request):
         try:
             # Check vector store state
             print("\nChecking vector store state:")
-            vector_store = VectorStore(dimension=384)
-            vector_store.load()
-            print(f"Vectors in index: {vector_store.index.ntotal}")
-            print(f"Document paths: {vector_store.id_to_path}")
+            print(f"Vectors in index: {get_search_service().vector_store.index.ntotal}")
+            print(f"Document paths: {get_search_service().vector_store.id_to_path}")
             
             # Perform search
             print("\nPerforming search...")
-            results = search_service.search(query)
+            results = get_search_service().search(query, user=request.user)
             print(f"Search returned {len(results)} results")
             print(f"Raw results: {results}")
             
@@ -111,13 +116,16 @@ def upload_document(request):
         # Ensure the directory exists
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         
-        file_path = default_storage.save(file_path, file)
+        # Hashed in the same pass that writes it; identical PDFs are indexed by copying
+        upload = _HashingUpload(file)
+        file_path = default_storage.save(file_path, upload)
         
         # Create Document record
         doc = PDFDocument.objects.create(
             title=file.name,
             file=file_path,
-            owner=request.user
+            owner=request.user,
+            content_hash=upload.sha256.hexdigest()
         )
         
         return JsonResponse({
@@ -130,7 +138,7 @@ def upload_document(request):
 @login_required
 def get_document_content(request, document_id):
     try:
-        content = search_service.get_document_content(document_id, request.user)
+        content = get_search_service().get_document_content(document_id, request.user)
         if content:
             logger.info(f'Successfully retrieved content for document {document_id}')
             return JsonResponse({'content': content})
@@ -153,7 +161,7 @@ def answer_question(request, document_id):
             return JsonResponse({'error': 'Question is required'}, status=400)
         
         # Get answer
-        result = search_service.answer_question(document_id, question, request.user)
+        result = get_search_service().answer_question(document_id, question, request.user)
         if not result:
             logger.warning(f'Document not found or access denied: {document_id}')
             return JsonResponse({'error': 'Document not found or access denied'}, status=404)
@@ -164,6 +172,63 @@ def answer_question(request, document_id):
         logger.error(f'Answer question error: {str(e)}', exc_info=True)
         return JsonResponse({'error': 'Internal server error'}, status=500)
 
+async def _request_user(request):
+    """The authenticated user or None; resolving request.user reads the session and auth tables"""
+    def resolve():
+        return request.user if request.user.is_authenticated else None
+    return await sync_to_async(resolve)()
+
+async def search_api(request):
+    """JSON search for ASGI deployments; the search runs on the query batcher or the bounded search pool"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    user = await _request_user(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    query = request.GET.get('q', '').strip()
+    try:
+        k = min(max(int(request.GET.get('k', 5)), 1), 50)
+    except ValueError:
+        return JsonResponse({'error': 'k must be an integer'}, status=400)
+    if not query:
+        return JsonResponse({'query': query, 'results': []})
+
+    try:
+        principals = await sync_to_async(user_principals)(user)
+        # The first call loads the encoder and index, so it runs on the pool as well
+        search_service = await offload(get_search_service)
+        results = await search_service.search_as_async(query, principals, k=k)
+        return JsonResponse({'query': query, 'results': results})
+    except Exception as e:
+        logger.error(f'Async search error: {str(e)}', exc_info=True)
+        return JsonResponse({'error': 'Internal server error'}, status=500)
+
+async def document_content_api(request, document_id):
+    """Async variant of get_document_content"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    user = await _request_user(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    try:
+        search_service = await offload(get_search_service)
+        # Only the ORM lookups use the shared sync thread; the text is read on the search pool
+        name = await sync_to_async(search_service.readable_document_file)(document_id, user)
+        content = None
+        if name is not None:
+            content = await offload(search_service.document_text, name)
+            if not content:
+                content = await sync_to_async(search_service.stored_document_content)(document_id)
+        if content:
+            return JsonResponse({'content': content})
+        logger.warning(f'Document not found or access denied: {document_id}')
+        return JsonResponse({'error': 'Document not found or access denied'}, status=404)
+    except Exception as e:
+        logger.error(f'Document content error: {str(e)}', exc_info=True)
+        return JsonResponse({'error': 'Internal server error'}, status=500)
+
 def login_view(request):
     return render(request, 'registration/login.html')
 